@@ -1,7 +1,9 @@
 # Author: Hayk Aleksanyan
 # create bounding hierarchical boxes for word shapes
 
-from trees import QuadTreeNode, QuadTree
+import numpy as np
+
+from trees import QuadTreeNode, QuadTree, FlatQuadTree
 
 
 def rectangles_intersect(r1, r2, shift1=(0, 0), shift2=(0, 0), extraSize=3):
@@ -31,15 +33,64 @@ def rectangles_intersect(r1, r2, shift1=(0, 0), shift2=(0, 0), extraSize=3):
     return True
 
 
+def get_occupancy_mask(img):
+    """
+      returns a 2d boolean NumPy array (rows, columns) marking the pixels of @img that would be
+      kept by img.getbbox(), i.e. the non-transparent pixels if the image has an alpha channel
+      and the non-zero pixels otherwise
+    """
+
+    if 'A' in img.getbands():
+        return np.asarray(img.getchannel('A')) != 0
+
+    a = np.asarray(img)
+    if a.ndim == 3:
+        return a.any(axis=2)
+
+    return a != 0
+
+
+def get_summed_area_table(img):
+    """
+      returns the summed-area table (integral image) of the occupancy mask of @img
+      the table has shape (height + 1, width + 1), where the entry [y, x] is the number of
+      occupied pixels in the rectangle [0, x) x [0, y)
+    """
+
+    mask = get_occupancy_mask(img)
+    sat = np.zeros((mask.shape[0] + 1, mask.shape[1] + 1), dtype=np.int64)
+    np.cumsum(np.cumsum(mask, axis=0, dtype=np.int64), axis=1, out=sat[1:, 1:])
+
+    return sat
+
+
+def box_is_empty(sat, box):
+    """
+      True, if and only if the box (left, upper, right, lower) contains no occupied pixel,
+      where @sat is the summed-area table of the image (see get_summed_area_table)
+      this is the O(1) equivalent of img.crop(box).getbbox() is None
+    """
+
+    a, b, c, d = box
+    if c <= a or d <= b:
+        return True
+
+    return sat[d][c] - sat[b][c] - sat[d][a] + sat[b][a] == 0
+
+
 def construct_quadtree(img, min_w, min_h):
     """
       returns the quad-tree representation of the image @im, i.e.
       a Tree, where the value of each node is a 4-tuple of ints (can be 2 for some of the leaves),
       representing min-max of hierarchic boxes
       here minW and minH are the width, height of the minimal box
+
+      the alpha channel of the image is read only once into a summed-area table,
+      which answers if a sub-box is empty in constant time
     """
 
     box_0 = img.getbbox()  # the initial box
+    sat = get_summed_area_table(img).tolist()  # plain lists are faster to index one item at a time
 
     quadtree_root = QuadTreeNode(box_0, None)
     quadtree = QuadTree(quadtree_root)
@@ -80,28 +131,28 @@ def construct_quadtree(img, min_w, min_h):
             # we need 4 sub-rectangles
 
             x_child = (x_box[0], x_box[1], d1, d2)
-            if img.crop(x_child).getbbox() is not None:
+            if not box_is_empty(sat, x_child):
                 x.child1 = QuadTreeNode(x_child, x)
                 stack.append(x.child1)
             else:
                 full_node = False
 
             x_child = (d1, x_box[1], x_box[2], d2)
-            if img.crop(x_child).getbbox() is not None:
+            if not box_is_empty(sat, x_child):
                 x.child2 = QuadTreeNode(x_child, x)
                 stack.append(x.child2)
             else:
                 full_node = False
 
             x_child = (x_box[0], d2, d1, x_box[3])
-            if img.crop(x_child).getbbox() is not None:
+            if not box_is_empty(sat, x_child):
                 x.child3 = QuadTreeNode(x_child, x)
                 stack.append(x.child3)
             else:
                 full_node = False
 
             x_child = (d1, d2, x_box[2], x_box[3])
-            if img.crop(x_child).getbbox() is not None:
+            if not box_is_empty(sat, x_child):
                 x.child4 = QuadTreeNode(x_child, x)
                 stack.append(x.child4)
             else:
@@ -113,14 +164,14 @@ def construct_quadtree(img, min_w, min_h):
             if (h <= min_h) and (w > min_w):  # don't split the y-coord, but only x
 
                 x_child = (x_box[0], x_box[1], d1, x_box[3])
-                if img.crop(x_child).getbbox() is not None:
+                if not box_is_empty(sat, x_child):
                     x.child1 = QuadTreeNode(x_child, x)
                     stack.append(x.child1)
                 else:
                     full_node = False
 
                 x_child = (d1, x_box[1], x_box[2], x_box[3])
-                if img.crop(x_child).getbbox() is not None:
+                if not box_is_empty(sat, x_child):
                     x.child2 = QuadTreeNode(x_child, x)
                     stack.append(x.child2)
                 else:
@@ -131,14 +182,14 @@ def construct_quadtree(img, min_w, min_h):
             else:  # we're in a position that we only split H
 
                 x_child = (x_box[0], x_box[1], x_box[2], d2)
-                if img.crop(x_child).getbbox() is not None:
+                if not box_is_empty(sat, x_child):
                     x.child1 = QuadTreeNode(x_child, x)
                     stack.append(x.child1)
                 else:
                     full_node = False
 
                 x_child = (x_box[0], d2, x_box[2], x_box[3])
-                if img.crop(x_child).getbbox() is not None:
+                if not box_is_empty(sat, x_child):
                     x.child2 = QuadTreeNode(x_child, x)
                     stack.append(x.child2)
                 else:
@@ -158,6 +209,9 @@ def is_inside_canvas(quadtree, shift, canvas_size):
      returns True if the word's leaves stay inside the canvas
     """
 
+    if isinstance(quadtree, FlatQuadTree):
+        return _is_inside_canvas_flat(quadtree, shift, canvas_size)
+
     stack = [quadtree.root]
     w, h = canvas_size
     sh_w, sh_h = shift
@@ -186,8 +240,13 @@ def test_collision(quadtree1, quadtree2, shift1, shift2, stay_away):
        @stay_away parameter forces bounding boxes to stay at least @stay_away pixels away from each other
 
        return True iff the quad-trees have intersecting leaves, meaning the images they respresent actually intersect
+
+       if both trees are FlatQuadTree instances, their boxes are already inflated and @stay_away is not used
     """
 
+    if isinstance(quadtree1, FlatQuadTree):
+        return _test_collision_flat(quadtree1, quadtree2, shift1, shift2)
+
     r1, r2 = quadtree1.root, quadtree2.root
 
     if (not r1) or (not r2):
@@ -223,3 +282,161 @@ def test_collision(quadtree1, quadtree2, shift1, shift2, stay_away):
                         stack.append((x, y))
 
     return False
+
+
+def _is_inside_canvas_flat(quadtree, shift, canvas_size):
+    """ is_inside_canvas for FlatQuadTree; the word stays inside iff none of its leaves sticks out """
+
+    if quadtree.root is None:
+        return True
+
+    w, h = canvas_size
+    sh_w, sh_h = shift
+    s = quadtree.stay_away
+
+    a, b, c, d = quadtree.root_box
+    if not ((a + s + sh_w < 0) or (c - s + sh_w > w) or (b + s + sh_h < 0) or (d - s + sh_h > h)):
+        return True
+
+    leaves = quadtree.get_leaf_boxes()
+    return not ((leaves[:, 0] + sh_w < 0) | (leaves[:, 2] + sh_w > w) |
+                (leaves[:, 1] + sh_h < 0) | (leaves[:, 3] + sh_h > h)).any()
+
+
+def _test_collision_flat(quadtree1, quadtree2, shift1, shift2, stack=None, max_visits=-1):
+    """
+       test_collision for a pair of FlatQuadTree instances;
+       the traversal keeps node indices on a flat stack, hence no lists or tuples are allocated per node
+
+       if @max_visits > 0, stops with False after visiting that many pairs of nodes, leaving the pairs
+       still to be visited on the (given) @stack
+    """
+
+    if (quadtree1.root is None) or (quadtree2.root is None):
+        return False
+
+    boxes1, start1, count1, children1 = (quadtree1.boxes_view, quadtree1.child_start_view,
+                                         quadtree1.child_count_view, quadtree1.children_view)
+    boxes2, start2, count2, children2 = (quadtree2.boxes_view, quadtree2.child_start_view,
+                                         quadtree2.child_count_view, quadtree2.children_view)
+
+    # only the relative shift matters, we move the 1st tree into the coordinates of the 2nd
+    dx, dy = shift1[0] - shift2[0], shift1[1] - shift2[1]
+
+    if stack is None:
+        stack = [0, 0]  # pairs of node indices (node of the 1st tree, node of the 2nd tree)
+
+    while stack:
+        if max_visits == 0:
+            return False
+        max_visits -= 1
+
+        j = stack.pop()
+        i = stack.pop()
+
+        k, m = i << 2, j << 2
+        if ((boxes1[k] + dx > boxes2[m + 2]) or (boxes1[k + 2] + dx < boxes2[m])
+                or (boxes1[k + 1] + dy > boxes2[m + 3]) or (boxes1[k + 3] + dy < boxes2[m + 1])):
+            continue
+
+        n1, n2 = count1[i], count2[j]
+
+        if not n1:
+            if not n2:
+                # leaves collide, we're done
+                return True
+
+            for y in range(start2[j], start2[j] + n2):
+                stack.append(i)
+                stack.append(children2[y])
+        elif not n2:
+            for x in range(start1[i], start1[i] + n1):
+                stack.append(children1[x])
+                stack.append(j)
+        else:
+            for x in range(start1[i], start1[i] + n1):
+                u = children1[x]
+                for y in range(start2[j], start2[j] + n2):
+                    stack.append(u)
+                    stack.append(children2[y])
+
+    return False
+
+
+VECTORIZE_MIN_LEAF_PAIRS = 10000  # trees with fewer pairs of leaves than this are always walked node by node
+VECTORIZE_TRAVERSAL_BUDGET = 256  # node pairs visited one by one before the remaining work is handed over to NumPy
+
+
+def _expand_node_pairs(quadtree1, quadtree2, pairs):
+    """
+      replaces every pair of nodes (i, j) of the (n, 2) array @pairs by the pairs (child of i, child of j);
+      a leaf stands in for its own single child, exactly as in the traversal of test_collision
+    """
+
+    start1, count1, children1 = quadtree1.get_expansion_table()
+    start2, count2, children2 = quadtree2.get_expansion_table()
+
+    i, j = pairs[:, 0], pairs[:, 1]
+    n2 = count2[j]
+
+    # the new pairs of the old pair p are numbered r = 0, ..., n1[p] * n2[p] - 1
+    sizes = count1[i] * n2
+    p = np.repeat(np.arange(len(pairs)), sizes)
+    r = np.arange(len(p)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+
+    return np.stack((children1[start1[i[p]] + r // n2[p]], children2[start2[j[p]] + r % n2[p]]), axis=1)
+
+
+def _node_pairs_collide(quadtree1, quadtree2, pairs, dx, dy):
+    """
+      the breadth-first, vectorized version of the traversal in test_collision:
+      all pairs of nodes of a level are tested against each other in one NumPy comparison,
+      the intersecting pairs are expanded into the pairs of their children, and so on until the leaves
+    """
+
+    boxes1, boxes2 = quadtree1.boxes, quadtree2.boxes
+
+    while len(pairs):
+        b1, b2 = boxes1[pairs[:, 0]], boxes2[pairs[:, 1]]
+        pairs = pairs[(b1[:, 0] + dx <= b2[:, 2]) & (b1[:, 2] + dx >= b2[:, 0]) &
+                      (b1[:, 1] + dy <= b2[:, 3]) & (b1[:, 3] + dy >= b2[:, 1])]
+
+        if not len(pairs):
+            break
+
+        if ((quadtree1.child_count[pairs[:, 0]] == 0) & (quadtree2.child_count[pairs[:, 1]] == 0)).any():
+            # leaves collide
+            return True
+
+        pairs = _expand_node_pairs(quadtree1, quadtree2, pairs)
+
+    return False
+
+
+def test_collision_vectorized(quadtree1, quadtree2, shift1, shift2, stay_away=None):
+    """
+       the same as test_collision for a pair of FlatQuadTree instances;
+       the trees are walked node by node for at most VECTORIZE_TRAVERSAL_BUDGET pairs of nodes,
+       which rejects far apart roots and settles small trees and deep overlaps (a leaf collision is found quickly);
+       the pairs of nodes still waiting on the stack are then walked down level by level in NumPy,
+       which pays off for large words that come close without touching, where thousands of pairs must be visited
+
+       @stay_away is not used, the boxes of the flat trees are inflated already
+    """
+
+    if (quadtree1.root is None) or (quadtree2.root is None):
+        return False
+
+    if len(quadtree1.leaves) * len(quadtree2.leaves) < VECTORIZE_MIN_LEAF_PAIRS:
+        return _test_collision_flat(quadtree1, quadtree2, shift1, shift2)
+
+    stack = [0, 0]
+    if _test_collision_flat(quadtree1, quadtree2, shift1, shift2, stack=stack,
+                            max_visits=VECTORIZE_TRAVERSAL_BUDGET):
+        return True
+
+    if not stack:
+        return False
+
+    return _node_pairs_collide(quadtree1, quadtree2, np.array(stack, dtype=np.int64).reshape(-1, 2),
+                               shift1[0] - shift2[0], shift1[1] - shift2[1])
@@ -0,0 +1,93 @@
+# Author: Hayk Aleksanyan
+# bounding the wall-clock time of placing the words, and what is given up when the time runs out
+
+import timeit
+
+POLICIES = ('drop', 'shrink', 'switch')  # what happens to a word whose time has run out, see PlacementBudget
+
+
+class PlacementBudget:
+    """
+       the time budget of placing the words: @total seconds for all words and @per_token seconds for a single word,
+       0 for no limit; the search of a word stops at its deadline, i.e. at the earlier of the two limits
+
+       a word whose search ran out of time (and every word left once the total budget is spent) is degraded
+       by the @policy, unless it has found a free place outside the canvas by then, which it keeps:
+         'drop'   - the word is not placed
+         'shrink' - the word is tried again with a smaller font, until the smallest one
+         'switch' - the word is tried again with the cheaper placement of the free places found at once
+                    (see free_space.CorrelationSearch), used for all words from then on
+       the words left once the total budget is spent have @overdue_time seconds each (or the @per_token seconds
+       if given) to be placed, hence the total budget is exceeded by about that much per word left
+    """
+
+    def __init__(self, total=0.0, per_token=0.0, policy='drop', overdue_time=0.05):
+        if policy not in POLICIES:
+            raise ValueError('unknown policy <{}>, expected one of {}'.format(policy, ', '.join(POLICIES)))
+
+        self.total = total
+        self.per_token = per_token
+        self.policy = policy
+        self.overdue_time = overdue_time
+
+        self.t_start = None
+        self.token_deadline = None  # the deadline of the word being placed, None if there is no limit
+        self.degraded = dict()  # the index of a word -> (word, the last action taken on it)
+
+    @property
+    def name(self):
+        return type(self).__name__
+
+    def start(self):
+        """ starts the clock of the total budget """
+
+        self.t_start = timeit.default_timer()
+        self.token_deadline = None
+        self.degraded.clear()
+
+    def is_over(self):
+        """ True if the total budget is spent """
+        return self.total > 0 and timeit.default_timer() - self.t_start > self.total
+
+    def start_token(self):
+        """ starts the clock of a word, returns its deadline (in timeit.default_timer seconds) or None """
+
+        now = timeit.default_timer()
+        if self.is_over():
+            self.token_deadline = now + (self.per_token if self.per_token > 0 else self.overdue_time)
+            return self.token_deadline
+
+        deadlines = []
+        if self.total > 0:
+            deadlines.append(self.t_start + self.total)
+        if self.per_token > 0:
+            deadlines.append(now + self.per_token)
+
+        self.token_deadline = min(deadlines) if deadlines else None
+        return self.token_deadline
+
+    def is_token_over(self):
+        """ True if the word being placed has run out of time """
+        return self.token_deadline is not None and timeit.default_timer() > self.token_deadline
+
+    def degrade(self, i, token, action):
+        """ records the @action ('dropped', 'shrunk' or 'switched') taken on the i-th @token """
+
+        token.degraded = action
+        self.degraded[i] = (token.word, action)
+
+    def get_report(self):
+        """ returns the dict action -> the list of words, for the words degraded so far (by their last action) """
+
+        report = dict()
+        for i in sorted(self.degraded):
+            word, action = self.degraded[i]
+            report.setdefault(action, []).append(word)
+
+        return report
+
+    def get_stats(self):
+        report = self.get_report()
+        counts = ', '.join('{}={}'.format(action, len(words)) for action, words in sorted(report.items()))
+
+        return '[{}] {} words were degraded{}{}'.format(self.name, len(self.degraded), ': ' if counts else '', counts)
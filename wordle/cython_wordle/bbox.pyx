@@ -1,6 +1,8 @@
 # Author: Hayk Aleksanyan
 # create bounding hierarchical boxes for word shapes
 
+import numpy as np
+
 from trees import QuadTreeNode, QuadTree
 
 
@@ -19,15 +21,64 @@ cdef rectangles_intersect(int r10, int r11, int r12, int r13, int r20, int r21,
     return True
 
 
+def get_occupancy_mask(img):
+    """
+      returns a 2d boolean NumPy array (rows, columns) marking the pixels of @img that would be
+      kept by img.getbbox(), i.e. the non-transparent pixels if the image has an alpha channel
+      and the non-zero pixels otherwise
+    """
+
+    if 'A' in img.getbands():
+        return np.asarray(img.getchannel('A')) != 0
+
+    a = np.asarray(img)
+    if a.ndim == 3:
+        return a.any(axis=2)
+
+    return a != 0
+
+
+def get_summed_area_table(img):
+    """
+      returns the summed-area table (integral image) of the occupancy mask of @img
+      the table has shape (height + 1, width + 1), where the entry [y, x] is the number of
+      occupied pixels in the rectangle [0, x) x [0, y)
+    """
+
+    mask = get_occupancy_mask(img)
+    sat = np.zeros((mask.shape[0] + 1, mask.shape[1] + 1), dtype=np.int64)
+    np.cumsum(np.cumsum(mask, axis=0, dtype=np.int64), axis=1, out=sat[1:, 1:])
+
+    return sat
+
+
+def box_is_empty(sat, box):
+    """
+      True, if and only if the box (left, upper, right, lower) contains no occupied pixel,
+      where @sat is the summed-area table of the image (see get_summed_area_table)
+      this is the O(1) equivalent of img.crop(box).getbbox() is None
+    """
+
+    a, b, c, d = box
+    if c <= a or d <= b:
+        return True
+
+    return sat[d][c] - sat[b][c] - sat[d][a] + sat[b][a] == 0
+
+
 def construct_quadtree(img, min_w, min_h):
     """
       returns the quad-tree representation of the image @im, i.e.
       a Tree, where the value of each node is a 4-tuple of ints (can be 2 for some of the leaves),
       representing min-max of hierarchic boxes
       here minW and minH are the width, height of the minimal box
+
+      the alpha channel of the image is read only once into a summed-area table,
+      which answers if a sub-box is empty in constant time
     """
 
     box_0 = img.getbbox()  # the initial box
+    sat = get_summed_area_table(img).tolist()  # plain lists are faster to index one item at a time
 
     quadtree_root = QuadTreeNode(box_0, None)
     quadtree = QuadTree(quadtree_root)
@@ -68,28 +119,28 @@ def construct_quadtree(img, min_w, min_h):
             # we need 4 sub-rectangles
 
             x_child = (x_box[0], x_box[1], d1, d2)
-            if img.crop(x_child).getbbox() is not None:
+            if not box_is_empty(sat, x_child):
                 x.child1 = QuadTreeNode(x_child, x)
                 stack.append(x.child1)
             else:
                 full_node = False
 
             x_child = (d1, x_box[1], x_box[2], d2)
-            if img.crop(x_child).getbbox() is not None:
+            if not box_is_empty(sat, x_child):
                 x.child2 = QuadTreeNode(x_child, x)
                 stack.append(x.child2)
             else:
                 full_node = False
 
             x_child = (x_box[0], d2, d1, x_box[3])
-            if img.crop(x_child).getbbox() is not None:
+            if not box_is_empty(sat, x_child):
                 x.child3 = QuadTreeNode(x_child, x)
                 stack.append(x.child3)
             else:
                 full_node = False
 
             x_child = (d1, d2, x_box[2], x_box[3])
-            if img.crop(x_child).getbbox() is not None:
+            if not box_is_empty(sat, x_child):
                 x.child4 = QuadTreeNode(x_child, x)
                 stack.append(x.child4)
             else:
@@ -101,14 +152,14 @@ def construct_quadtree(img, min_w, min_h):
             if (h <= min_h) and (w > min_w):  # don't split the y-coord, but only x
 
                 x_child = (x_box[0], x_box[1], d1, x_box[3])
-                if img.crop(x_child).getbbox() is not None:
+                if not box_is_empty(sat, x_child):
                     x.child1 = QuadTreeNode(x_child, x)
                     stack.append(x.child1)
                 else:
                     full_node = False
 
                 x_child = (d1, x_box[1], x_box[2], x_box[3])
-                if img.crop(x_child).getbbox() is not None:
+                if not box_is_empty(sat, x_child):
                     x.child2 = QuadTreeNode(x_child, x)
                     stack.append(x.child2)
                 else:
@@ -119,14 +170,14 @@ def construct_quadtree(img, min_w, min_h):
             else:  # we're in a position that we only split H
 
                 x_child = (x_box[0], x_box[1], x_box[2], d2)
-                if img.crop(x_child).getbbox() is not None:
+                if not box_is_empty(sat, x_child):
                     x.child1 = QuadTreeNode(x_child, x)
                     stack.append(x.child1)
                 else:
                     full_node = False
 
                 x_child = (x_box[0], d2, x_box[2], x_box[3])
-                if img.crop(x_child).getbbox() is not None:
+                if not box_is_empty(sat, x_child):
                     x.child2 = QuadTreeNode(x_child, x)
                     stack.append(x.child2)
                 else:
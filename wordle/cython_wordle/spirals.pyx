@@ -14,6 +14,7 @@ cdef class Archimedian:
     cdef public int u
     cdef public int v
     cdef public double r
+    cdef public long index
 
     def start(self, param):
         self.param = param
@@ -23,9 +24,42 @@ cdef class Archimedian:
         self.u = 0
         self.v = 0
         self.r = 0.0
+        self.index = 0  # the index of the current point (u, v) along the spiral
+
+    def seek(self, long n):
+        """
+         moves the spiral to its n-th point; a point depends on the previous one (see get_next),
+         hence the spiral is walked from the start, which is cheap compared to the tests made at each point
+        """
+
+        self.start(self.param)
+        while self.index < n:
+            self.get_next()
 
 
-    def get_next(self):
+    def skip_inside(self, long x, long y, long x0, long y0, long x1, long y1, long c_w, long c_h):
+        """
+         moves the spiral on while the next position of a walk at (x, y), i.e. (x + u, y + v), stays inside
+         the box (x0, y0, x1, y1), borders included; the walk is made here in C, not point by point in python
+
+         returns (n, first_out, x, y): the number n of positions passed, the number of them up to the first one
+         outside the canvas of size (c_w, c_h) (0 if none) and the last position passed ((x, y) if none)
+        """
+
+        cdef long n = 0
+        cdef long first_out = 0
+
+        while x0 <= x + self.u <= x1 and y0 <= y + self.v <= y1:
+            x += self.u
+            y += self.v
+            n += 1
+            if first_out == 0 and (x < 0 or x >= c_w or y < 0 or y > c_h):
+                first_out = n
+            self.get_next()
+
+        return n, first_out, x, y
+
+    cpdef get_next(self):
         """
          generator for the Archimedian spiral r = a*\phi (in polar coordinates)
          generated coordinates are in (x,y) plane
@@ -41,6 +75,7 @@ cdef class Archimedian:
         else:
             self.u = int(self.x)
             self.v = int(self.y)
+            self.index += 1
 
 
 
@@ -53,6 +88,7 @@ cdef class Rectangular:
     cdef public int m
     cdef public int step
     cdef public int phase
+    cdef public long index
 
     def start(self, param):
         self.param = param
@@ -61,9 +97,68 @@ cdef class Rectangular:
         self.phase = 0
         self.step = 0
         self.m = param
+        self.index = 0  # the index of the current point (u, v) along the spiral
+
+    def seek(self, long n):
+        """
+         moves the spiral to its n-th point directly, side by side;
+         the t-th side (t = 0, 1, ...) has length param*(t//2 + 1) and is walked in the direction t % 4
+        """
+
+        cdef long left = n
+        cdef long d
+        cdef int t = 0
+        cdef int length
+
+        self.start(self.param)
+
+        while left > 0:
+            length = self.param * (t // 2 + 1)
+            d = min(left, length)
+
+            if t % 4 == 0:
+                self.v -= d
+            elif t % 4 == 1:
+                self.u += d
+            elif t % 4 == 2:
+                self.v += d
+            else:
+                self.u -= d
+
+            left -= d
+            if left > 0:
+                t += 1
+            else:
+                self.phase = t % 4
+                self.step = d
+                self.m = length
+
+        self.index = n
+
+
+    def skip_inside(self, long x, long y, long x0, long y0, long x1, long y1, long c_w, long c_h):
+        """
+         moves the spiral on while the next position of a walk at (x, y), i.e. (x + u, y + v), stays inside
+         the box (x0, y0, x1, y1), borders included; the walk is made here in C, not point by point in python
+
+         returns (n, first_out, x, y): the number n of positions passed, the number of them up to the first one
+         outside the canvas of size (c_w, c_h) (0 if none) and the last position passed ((x, y) if none)
+        """
+
+        cdef long n = 0
+        cdef long first_out = 0
+
+        while x0 <= x + self.u <= x1 and y0 <= y + self.v <= y1:
+            x += self.u
+            y += self.v
+            n += 1
+            if first_out == 0 and (x < 0 or x >= c_w or y < 0 or y > c_h):
+                first_out = n
+            self.get_next()
 
+        return n, first_out, x, y
 
-    def get_next(self):
+    cpdef get_next(self):
         """
            generator for rectangular spiral
            directions = [ (0,-1), (1,0), (0, 1), (-1, 0) ]
@@ -77,6 +172,7 @@ cdef class Rectangular:
                 self.v -= 1
 
                 self.step += 1
+                self.index += 1
             else:
                 self.step = 0
                 self.phase = 1
@@ -87,6 +183,7 @@ cdef class Rectangular:
                 self.u += 1
 
                 self.step += 1
+                self.index += 1
             else:
                 self.step = 0
                 self.phase = 2
@@ -98,6 +195,7 @@ cdef class Rectangular:
             if self.step < self.m:
                 self.v += 1
                 self.step += 1
+                self.index += 1
             else:
                 self.step = 0
                 self.phase = 3
@@ -107,6 +205,7 @@ cdef class Rectangular:
             if self.step < self.m:
                 self.u -= 1
                 self.step += 1
+                self.index += 1
             else:
                 self.step = 0
                 self.phase = 0
@@ -39,9 +39,11 @@ class Token:
 
 
 class Wordle:
-    def __init__(self, file_path, vert_prob=0.0):
+    def __init__(self, file_path, vert_prob=0.0, skip_ahead=False):
         self.file_path = file_path
         self.vert_prob = vert_prob
+        # if True, after a collision the spiral moves on until the word clears the bounding box of the blocking word
+        self.skip_ahead = skip_ahead
 
         self._arch_spiral_param = 0.2
         self._rect_spiral_param = 2
@@ -240,6 +242,14 @@ class Wordle:
             token.quadtree = quadtree
             token.img_size = im_tmp.size
 
+    @staticmethod
+    def get_placed_box(token):
+        """ the root box of a placed @token on the canvas, grown by STAY_AWAY """
+
+        a, b, c, d = token.quadtree.root.value
+        return (a + token.place[0] - STAY_AWAY, b + token.place[1] - STAY_AWAY,
+                c + token.place[0] + STAY_AWAY, d + token.place[1] + STAY_AWAY)
+
     def place_words(self, normal_tokens):
         """
           gets a list of tokens and their frequencies
@@ -302,6 +312,8 @@ class Wordle:
             start_countdown = False
             max_iter = 0
 
+            x0, y0, x1, y1 = token.quadtree.root.value  # the root box of the word, for skipping ahead
+
             while True:
                 w = location1[0] + spiral.u
                 h = location1[1] + spiral.v
@@ -323,11 +335,14 @@ class Wordle:
                 location1 = (w, h)
                 collision = False
 
+                blocker = -1
                 if last_hit_index < i:
                     j = last_hit_index
                     if normal_tokens[j].place is not None:
                         collision = bbox.test_collision(token.quadtree, normal_tokens[j].quadtree, location1,
                                                         normal_tokens[j].place, STAY_AWAY)
+                        if collision:
+                            blocker = j
 
                 if not collision:
                     # NO collision with the cached index
@@ -337,10 +352,31 @@ class Wordle:
                                                    normal_tokens[j].place,
                                                    STAY_AWAY):
                                 collision = True
-                                last_hit_index = j
+                                last_hit_index = blocker = j
 
                                 break  # no need to check with the rest of the tokens, try a new position now
 
+                if collision and self.skip_ahead:
+                    # the spiral is walked past the positions where the word still meets the box of the blocking word
+                    # at once, in C (see spirals.skip_inside); their steps are counted as if they were tested
+                    a, b, c, d = Wordle.get_placed_box(normal_tokens[blocker])
+                    n_skipped, first_out, w, h = spiral.skip_inside(w, h, a - x1 - STAY_AWAY, b - y1 - STAY_AWAY,
+                                                                    c - x0 + STAY_AWAY, d - y0 + STAY_AWAY, c_w, c_h)
+                    location1 = (w, h)
+
+                    if n_skipped and not start_countdown:
+                        n_inside = first_out if first_out > 0 else n_skipped
+                        iter_ += n_inside
+                        n_skipped -= n_inside
+                        if first_out > 0:
+                            start_countdown = True
+                            max_iter = 1 + 10 * iter_
+
+                    if n_skipped:
+                        max_iter -= n_skipped
+                        if max_iter <= 0:
+                            break
+
                 if not collision:
                     if bbox.is_inside_canvas(token.quadtree, location1, (c_w, c_h)):
                         # at this point we have found a place inside the canvas where the current token has NO collision
@@ -403,17 +439,20 @@ if __name__ == "__main__":
                         help='probability of a word to be placed vertically; default placement is horizontal')
     parser.add_argument('--interactive', type=bool, required=False, default=False,
                         help='if 1, will not exit after wordle creation to allow change of color schemes')
+    parser.add_argument('--skipahead', type=int, required=False, default=0,
+                        help='if 1, the spiral jumps over the bounding box of the word blocking the last position')
 
     args = parser.parse_args()
 
     filepath = args.filepath
     vertprob = args.vertprob
     interactive = args.interactive
+    skipahead = args.skipahead
 
     if vertprob < 0.0:
         vertprob = 0.0
     if vertprob > 1.0:
         vertprob = 1.0
 
-    wordle = Wordle(filepath, vertprob)
+    wordle = Wordle(filepath, vertprob, skip_ahead=skipahead == 1)
     wordle.create(interactive=interactive)
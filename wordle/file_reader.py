@@ -1,12 +1,73 @@
 # Author: Hayk Aleksanyan
 # read file and tokenize into words
 
+import codecs
+from collections import Counter
+import mmap
+import os
+import re
 import traceback
 
+CHUNK_SIZE = 1 << 20  # the bytes of a span of read_file_mapped, and the least bytes of a range of get_byte_ranges
+
+# the handlers of the invalid utf-8 bytes of read_file_mapped, besides the error handlers of bytes.decode
+ERROR_HANDLERS = ('rows', 'latin-1', 'surrogateescape', 'replace', 'ignore')
+
+_escaped = re.compile('[\udc80-\udcff]+')  # the invalid bytes decoded with 'surrogateescape'
+
+
+def _get_last_char_end(data):
+    """ the end of the last complete utf-8 character of the bytes @data, an invalid byte counts as a character """
+
+    for k in range(len(data) - 1, max(len(data) - 4, 0) - 1, -1):
+        if data[k] & 0xC0 != 0x80:  # not a continuation byte, i.e. the first byte of the last character
+            size = 2 if data[k] & 0xE0 == 0xC0 else 3 if data[k] & 0xF0 == 0xE0 else 4 if data[k] & 0xF8 == 0xF0 else 1
+            return len(data) if k + size <= len(data) else k
+
+    return len(data)
+
+
+def get_byte_ranges(file_path, n_ranges, min_size=CHUNK_SIZE):
+    """
+      splits the file into at most @n_ranges consecutive byte ranges [start, end) of about the same size, but not
+      smaller than @min_size bytes; a range ends after a new line if there is one near its end, otherwise after
+      another separator of the tokens, hence the ranges can be read and tokenized independently (such bytes are
+      never a part of a multi-byte character); a range may be empty
+    """
+
+    size = os.path.getsize(file_path)
+    n_ranges = max(1, min(n_ranges, size // max(min_size, 1)))
+
+    cuts = [0]
+    with open(file_path, "rb") as f:
+        for k in range(1, n_ranges):
+            cut = max(size * k // n_ranges, cuts[-1])
+            f.seek(cut)
+            while True:
+                data = f.read(1 << 16)
+                if not data:
+                    cut = size
+                    break
+
+                end = data.find(b"\n")
+                if end < 0:
+                    end = min((i for i in (data.find(c) for c in (b" ", b"\t", b"\r", b"\f", b"\a", b"\b")) if i >= 0),
+                              default=-1)
+                if end >= 0:
+                    cut += end + 1
+                    break
+                cut += len(data)
+
+            cuts.append(cut)
+    cuts.append(size)
+
+    return [(cuts[k], cuts[k + 1]) for k in range(n_ranges)]
+
 
 class FileReaderFromBinary:
     def __init__(self, log_file=""):
         self.log_file = log_file
+        self.error_counts = Counter()  # the numbers of invalid bytes and rows found by read_file_mapped
 
     @property
     def name(self):
@@ -57,4 +118,149 @@ class FileReaderFromBinary:
             print("[{}] there are {} rows in the file at [{}]".format(self.name, len(file_lines_decoded), file_path),
                   flush=True)
 
-        return file_lines_decoded
\ No newline at end of file
+        return file_lines_decoded
+
+    def _decode_span(self, data, errors):
+        """
+          decodes the rows (bytes ending with a new line, but maybe the last one) of @data, the invalid utf-8 bytes
+          are handled by @errors: 'rows' - a row with an invalid byte is taken byte by byte (as latin-1), i.e. as in
+          read_file_into_list_of_row; 'latin-1' - only the invalid bytes are; otherwise an error handler of
+          bytes.decode, e.g. 'surrogateescape' or 'replace'; the invalid bytes (and rows, for 'rows') are counted
+        """
+
+        try:
+            return data.decode()
+        except UnicodeDecodeError:
+            pass
+
+        # every invalid byte becomes a lone surrogate, which 'ignore' drops
+        text = data.decode("utf-8", "surrogateescape")
+        self.error_counts["bytes"] += len(text) - len(data.decode("utf-8", "ignore"))
+
+        if errors == "rows":
+            rows = data.split(b"\n")
+            for i, row in enumerate(rows):
+                try:
+                    rows[i] = row.decode()
+                except UnicodeDecodeError:
+                    rows[i] = row.decode("latin-1")
+                    self.error_counts["rows"] += 1
+
+            return "\n".join(rows)
+
+        if errors == "latin-1":
+            return _escaped.sub(lambda m: m.group().encode("utf-8", "surrogateescape").decode("latin-1"), text)
+        if errors == "surrogateescape":
+            return text
+
+        return data.decode("utf-8", errors)
+
+    def _read_split_row(self, data, position, row_start, row_end, start, end, span_size):
+        """
+          yields the part [@position, min(@row_end, @end)) of the row [@row_start, @row_end) of the memory-mapped
+          @data in spans of about @span_size bytes, for a row which does not fit into a span or is cut by the range
+          [@start, @end); as in the 'rows' mode of _decode_span, the row is read as latin-1 if it has an invalid byte
+          anywhere, also outside the part; the invalid bytes of the part are counted, and the row is counted by the
+          range holding its start
+        """
+
+        part_end = min(row_end, end)
+
+        valid = True
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        try:
+            for i in range(row_start, row_end, span_size):
+                decoder.decode(data[i:min(i + span_size, row_end)], final=i + span_size >= row_end)
+        except UnicodeDecodeError:
+            valid = False
+
+        if not valid:
+            decoder = codecs.getincrementaldecoder("utf-8")("surrogateescape")
+            for i in range(position, part_end, span_size):
+                text = decoder.decode(data[i:min(i + span_size, part_end)], final=i + span_size >= part_end)
+                # an invalid byte is one byte with 'surrogateescape' and none with 'ignore'
+                self.error_counts["bytes"] += (len(text.encode("utf-8", "surrogateescape")) -
+                                               len(text.encode("utf-8", "ignore")))
+            if row_start >= start:
+                self.error_counts["rows"] += 1
+
+            for i in range(position, part_end, span_size):
+                yield data[i:min(i + span_size, part_end)].decode("latin-1")
+            return
+
+        while position < part_end:
+            span_end = min(position + span_size, part_end)
+            if span_end < part_end:
+                # cut between two characters, at least 4 bytes (the longest one) are taken
+                window = data[position:min(max(span_end, position + 4), part_end)]
+                span_end = position + (_get_last_char_end(window) or len(window))
+
+            yield data[position:span_end].decode()
+            position = span_end
+
+    def read_file_mapped(self, file_path, errors="rows", span_size=CHUNK_SIZE, verbose=0, start=0, end=None):
+        """
+          yields the text of the file in spans of about @span_size bytes made of whole rows, the file is never held
+          in memory at once: it is memory-mapped, and a span with invalid utf-8 bytes is decoded at once, by the handler
+          @errors (see _decode_span); the default 'rows' gives the text of read_file_into_list_of_row, also for
+          a row longer than the @span_size, or cut by the range [@start, @end) (see _read_split_row)
+
+          the invalid bytes are not reported one by one: their number (and the number of rows having them) is added
+          to the error_counts of the reader and written to the log file (or printed if @verbose) once per file
+        """
+
+        if errors not in ("rows", "latin-1"):
+            codecs.lookup_error(errors)  # raises LookupError for an unknown handler
+
+        counts_before = Counter(self.error_counts)
+
+        try:
+            with open(file_path, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                end = size if end is None else min(end, size)
+                if start >= end:
+                    return
+
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    position = start
+                    while position < end:
+                        span_end = min(position + span_size, end)
+
+                        if errors == "rows":
+                            row_start = data.rfind(b"\n", 0, position) + 1
+                            row_end = data.find(b"\n", position) + 1 or size
+                            if row_start < position or row_end > span_end:
+                                # the row at the position is not whole in the span, it is read on its own
+                                yield from self._read_split_row(data, position, row_start, row_end, start, end,
+                                                                span_size)
+                                position = min(row_end, end)
+                                continue
+
+                            if span_end < size:
+                                # the span ends with a whole row, the row after it is read in the next one
+                                span_end = data.rfind(b"\n", position, span_end) + 1
+
+                        elif span_end < end:
+                            cut = data.rfind(b"\n", position, span_end) + 1
+                            if cut == 0:
+                                # a long row, cut between two characters, at least 4 bytes (the longest one) are taken
+                                window = data[position:min(max(span_end, position + 4), end)]
+                                cut = position + (_get_last_char_end(window) or len(window))
+                            span_end = cut
+
+                        yield self._decode_span(data[position:span_end], errors)
+                        position = span_end
+
+        except:
+            print(traceback.format_exc())
+
+        found = self.error_counts - counts_before
+        if found:
+            msg = "[{}] {} in the file [{}], handled by '{}'".format(
+                self.name, ", ".join("{} invalid {}".format(n, key) for key, n in sorted(found.items())), file_path,
+                errors)
+            if verbose:
+                print(msg, flush=True)
+            if self.log_file != "":
+                with open(self.log_file, "a") as f:
+                    f.write(msg + "\n")
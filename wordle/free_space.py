@@ -0,0 +1,232 @@
+# Author: Hayk Aleksanyan
+# finding the free places of the canvas for a word at once, instead of walking along a spiral
+
+import numpy as np
+
+
+def max_pool(mask, factor, pad_y=0, pad_x=0):
+    """
+      returns the boolean @mask shrunk by the @factor, a cell of the result is set if any of its pixels is set;
+      the mask is first moved down and right by (@pad_y, @pad_x) pixels
+    """
+
+    h, w = mask.shape
+    hc = (h + pad_y + factor - 1) // factor
+    wc = (w + pad_x + factor - 1) // factor
+
+    padded = np.zeros((hc * factor, wc * factor), dtype=bool)
+    padded[pad_y:pad_y + h, pad_x:pad_x + w] = mask
+
+    return padded.reshape(hc, factor, wc, factor).any(axis=(1, 3))
+
+
+def get_containment(outer, inner):
+    """ returns the boolean matrix whose [j, k] entry tells if the box @outer[j] contains the box @inner[k] """
+
+    return ((outer[:, None, 0] <= inner[None, :, 0]) & (outer[:, None, 1] <= inner[None, :, 1]) &
+            (outer[:, None, 2] >= inner[None, :, 2]) & (outer[:, None, 3] >= inner[None, :, 3]))
+
+
+class CorrelationSearch:
+    """
+       keeps the occupancy of the canvas on a grid coarser than the pixels by @factor;
+       the overlap of a word with the placed words, for all of its positions at once,
+       is the cross-correlation of the two masks, computed through the FFT
+
+       a coarse cell is occupied if any of its pixels is, hence the positions found free on the coarse grid
+       are free on the pixel level as well (but some free places might be missed)
+    """
+
+    def __init__(self, width, height, factor=4):
+        self.width = width
+        self.height = height
+        self.factor = factor
+
+        self.cells = np.zeros(((height + factor - 1) // factor, (width + factor - 1) // factor), dtype=bool)
+
+    @property
+    def name(self):
+        return type(self).__name__
+
+    def _get_coarse_mask(self, mask):
+        """ the PackedMask @mask on the coarse grid, with the offset of its upper-left cell (for a place on the grid) """
+
+        f = self.factor
+        # the cell of a pixel (place + offset + i) is place / f + (offset + i) // f if the place is a multiple of f
+        pad_x, pad_y = mask.offset_x % f, mask.offset_y % f
+        coarse = max_pool(mask.unpack(), f, pad_y, pad_x)
+
+        return coarse, (mask.offset_x - pad_x) // f, (mask.offset_y - pad_y) // f
+
+    def get_free_places(self, mask, start, max_places=-1):
+        """
+          returns the list of places (multiples of the factor) where the PackedMask @mask lies inside the canvas
+          and does not overlap the occupied cells, sorted by the distance from the @start;
+          if @max_places > 0, only that many nearest places are returned
+
+          the search starts in a window around the @start, which is doubled until a free place is found in it
+        """
+
+        if mask.height == 0:
+            return [tuple(start)]
+
+        coarse, ox, oy = self._get_coarse_mask(mask)
+        hc, wc = coarse.shape
+        H, W = self.cells.shape
+        if hc > H or wc > W:
+            return []
+
+        # the cell of the upper-left corner of the mask with the word at the start
+        u_s, v_s = start[0] // self.factor + ox, start[1] // self.factor + oy
+
+        r = max(hc, wc, 16)
+        while True:
+            u0, v0 = max(u_s - r, 0), max(v_s - r, 0)
+            u1, v1 = min(u_s + wc + r, W), min(v_s + hc + r, H)
+            whole_grid = u0 == 0 and v0 == 0 and u1 == W and v1 == H
+
+            if u1 - u0 >= wc and v1 - v0 >= hc:
+                us, vs = self._get_free_cells(coarse, u0, v0, u1, v1)
+                if len(us) or whole_grid:
+                    break
+            elif whole_grid:
+                return []
+
+            r *= 2
+
+        if len(us) == 0:
+            return []
+
+        # back to the places of the word in pixels
+        xs = (us - ox) * self.factor
+        ys = (vs - oy) * self.factor
+
+        d = (xs - start[0]) ** 2 + (ys - start[1]) ** 2
+        if 0 < max_places < len(d):
+            nearest = np.argpartition(d, max_places)[:max_places]
+            order = nearest[np.argsort(d[nearest], kind='stable')]
+        else:
+            order = np.argsort(d, kind='stable')
+
+        return list(zip(xs[order].tolist(), ys[order].tolist()))
+
+    def _get_free_cells(self, coarse, u0, v0, u1, v1):
+        """ the cells (columns, rows) inside the window [u0, u1) x [v0, v1) where the @coarse mask fits and is free """
+
+        hc, wc = coarse.shape
+        window = self.cells[v0:v1, u0:u1]
+        if not window.any():
+            vs, us = np.mgrid[v0:v1 - hc + 1, u0:u1 - wc + 1]
+            return us.ravel(), vs.ravel()
+
+        # overlap[v, u] = number of occupied cells under the mask with its upper-left cell at (u, v);
+        # the correlation is cyclic, but it does not wrap for the masks lying inside the window
+        s = window.shape
+        overlap = np.fft.irfft2(np.fft.rfft2(window.astype(np.float32)) *
+                                np.conj(np.fft.rfft2(coarse.astype(np.float32), s=s)), s=s)
+
+        vs, us = np.nonzero(overlap[:s[0] - hc + 1, :s[1] - wc + 1] < 0.5)
+        return us + u0, vs + v0
+
+    def commit(self, mask, place):
+        """ marks the cells under the PackedMask @mask put at @place as occupied; parts outside the canvas are dropped """
+
+        if mask.height == 0:
+            return
+
+        f = self.factor
+        x, y = place[0] + mask.offset_x, place[1] + mask.offset_y
+        coarse = max_pool(mask.unpack(), f, y % f, x % f)
+        u, v = (x - x % f) // f, (y - y % f) // f
+
+        H, W = self.cells.shape
+        hc, wc = coarse.shape
+        u0, v0, u1, v1 = max(u, 0), max(v, 0), min(u + wc, W), min(v + hc, H)
+        if u0 >= u1 or v0 >= v1:
+            return
+
+        self.cells[v0:v1, u0:u1] |= coarse[v0 - v:v1 - v, u0 - u:u1 - u]
+
+
+class FreeRectangles:
+    """
+       the maximal empty rectangles of the canvas: every rectangle inside the canvas which avoids all occupied boxes
+       lies inside one of them; boxes and rectangles are (x0, y0, x1, y1) with the borders included
+
+       an occupied box splits every rectangle it meets into the (at most 4) parts left, right, above and below it,
+       and the parts lying inside other rectangles are dropped; rectangles thinner than @min_side cannot hold a word
+       and are dropped as well
+    """
+
+    def __init__(self, width, height, min_side=8):
+        self.width = width
+        self.height = height
+        self.min_side = min_side
+
+        self.rects = np.array([[0, 0, width - 1, height - 1]], dtype=np.int64)
+
+    @property
+    def name(self):
+        return type(self).__name__
+
+    def __len__(self):
+        return len(self.rects)
+
+    def occupy(self, box):
+        """ removes the box (x0, y0, x1, y1) from the free space """
+
+        r = self.rects
+        hit = ~((r[:, 0] > box[2]) | (r[:, 2] < box[0]) | (r[:, 1] > box[3]) | (r[:, 3] < box[1]))
+        if not hit.any():
+            return
+
+        old, rest = r[hit], r[~hit]
+        parts = []
+        for k, (side, cut, value) in enumerate(((0, 2, box[0] - 1), (2, 0, box[2] + 1),
+                                                (1, 3, box[1] - 1), (3, 1, box[3] + 1))):
+            # the part of the rectangles on one side of the box: e.g. left of it if they start left of it
+            beyond = old[:, side] < box[side] if k % 2 == 0 else old[:, side] > box[side]
+            part = old[beyond]
+            part[:, cut] = value
+            parts.append(part)
+
+        new = np.concatenate(parts)
+        new = new[(new[:, 2] - new[:, 0] + 1 >= self.min_side) & (new[:, 3] - new[:, 1] + 1 >= self.min_side)]
+
+        # the untouched rectangles were maximal, only the new parts can lie inside other rectangles;
+        # of several equal parts the first one is kept
+        inside = get_containment(new, new)
+        equal = inside & inside.T
+        inside[equal] = np.triu(equal, k=1)[equal]
+        dropped = inside.any(axis=0) | get_containment(rest, new).any(axis=0)
+
+        self.rects = np.concatenate((rest, new[~dropped]))
+
+    def get_places(self, box, target, max_places=-1):
+        """
+          returns the places of a word whose box, relative to its place, is @box, such that the box lies inside
+          one of the free rectangles; for every rectangle large enough, the place putting the center of the box
+          nearest to the @target is taken, sorted by that distance;
+          if @max_places > 0, only that many nearest places are returned
+        """
+
+        x0, y0, x1, y1 = box
+        r = self.rects
+        fits = (r[:, 2] - r[:, 0] >= x1 - x0) & (r[:, 3] - r[:, 1] >= y1 - y0)
+        r = r[fits]
+
+        # the place centering the box at the target, moved into the places keeping the box inside a rectangle,
+        # which are [r0 - x0, r2 - x1] x [r1 - y0, r3 - y1]
+        cx, cy = int(round(target[0] - (x0 + x1) / 2)), int(round(target[1] - (y0 + y1) / 2))
+        xs = np.clip(cx, r[:, 0] - x0, r[:, 2] - x1)
+        ys = np.clip(cy, r[:, 1] - y0, r[:, 3] - y1)
+        xs, ys = np.unique(np.stack((xs, ys), axis=1), axis=0).T.reshape(2, -1)  # rectangles overlap
+
+        d = (xs - cx) ** 2 + (ys - cy) ** 2
+        if 0 < max_places < len(d):
+            nearest = np.argpartition(d, max_places)[:max_places]
+            order = nearest[np.argsort(d[nearest], kind='stable')]
+        else:
+            order = np.argsort(d, kind='stable')
+
+        return list(zip(xs[order].tolist(), ys[order].tolist()))
@@ -0,0 +1,440 @@
+# Author: Hayk Aleksanyan
+# occupancy of the canvas as a bitmap packed in 64-bit words, tests a word against all placed words at once
+
+import numpy as np
+
+WORD_BITS = 64
+
+
+def dilate(mask, r):
+    """ returns the boolean @mask grown by @r pixels in every direction (a square of side 2r+1 around every pixel) """
+
+    if r <= 0:
+        return mask.copy()
+
+    h, w = mask.shape
+    out = np.zeros((h + 2 * r, w + 2 * r), dtype=bool)
+
+    # the square is separable: first grow the rows, then the columns
+    rows = np.zeros((h, w + 2 * r), dtype=bool)
+    for d in range(2 * r + 1):
+        rows[:, d:d + w] |= mask
+    for d in range(2 * r + 1):
+        out[d:d + h, :] |= rows
+
+    return out
+
+
+def pack_rows(mask, n_words):
+    """
+      packs every row of the boolean @mask into @n_words unsigned 64-bit integers;
+      pixel x of a row is the bit (63 - x % 64) of the word x // 64, i.e. the pixels are read from the highest bit
+    """
+
+    h, w = mask.shape
+    padded = np.zeros((h, n_words * WORD_BITS), dtype=bool)
+    padded[:, :w] = mask
+
+    return np.packbits(padded, axis=1).view('>u8').astype(np.uint64)
+
+
+class PackedMask:
+    """
+       the occupancy mask of a word, grown by the stay-away distance and packed as rows of 64-bit words;
+       the pixel (0, 0) of the mask is at (@offset_x, @offset_y) relative to the place of the word;
+
+       the canvas words are aligned to multiples of 64 pixels, hence a mask at x needs to be shifted by x % 64 bits;
+       the shifted versions of the mask are computed once, when they are first needed
+    """
+
+    def __init__(self, mask, stay_away=0):
+        """ @mask is a 2d boolean array (rows, columns) of the pixels covered by the word """
+
+        mask = np.asarray(mask, dtype=bool)
+
+        ys, xs = np.nonzero(mask)
+        if len(ys) == 0:
+            self.offset_x, self.offset_y, self.width, self.height = 0, 0, 0, 0
+            self.n_words = 0
+            self._shifted = {0: np.zeros((0, 0), dtype=np.uint64)}
+            return
+
+        # crop to the ink, the blank parts of the image never collide
+        y0, y1, x0, x1 = ys.min(), ys.max() + 1, xs.min(), xs.max() + 1
+        mask = dilate(mask[y0:y1, x0:x1], stay_away)
+
+        self.offset_x, self.offset_y = int(x0) - stay_away, int(y0) - stay_away
+        self.height, self.width = mask.shape
+
+        self.n_words = (self.width + WORD_BITS - 1) // WORD_BITS + 1  # the extra word receives the shifted-out bits
+        self._shifted = {0: pack_rows(mask, self.n_words)}
+
+    def get_shifted(self, s):
+        """ returns the rows of the mask moved right by @s bits, 0 <= s < 64 """
+
+        rows = self._shifted.get(s)
+        if rows is None:
+            base = self._shifted[0]
+            rows = base >> np.uint64(s)
+            rows[:, 1:] |= base[:, :-1] << np.uint64(WORD_BITS - s)
+            self._shifted[s] = rows
+
+        return rows
+
+    def unpack(self):
+        """ returns the mask as a 2d boolean array of shape (height, width) """
+        return np.unpackbits(self._shifted[0].astype('>u8').view(np.uint8), axis=1)[:, :self.width].astype(bool)
+
+    def release(self):
+        """ drops the shifted copies of the mask, e.g. once the word has been placed """
+        self._shifted = {0: self._shifted[0]}
+
+
+class OccupancyBitmap:
+    """
+       the set of canvas pixels taken by the placed words (grown by the stay-away distance),
+       kept as one bit per pixel; testing a word costs the same no matter how many words have been placed
+
+       only the part of the words inside the canvas is recorded, hence a test is exact only
+       for masks lying entirely inside the canvas, see contains()
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.n_words = (width + WORD_BITS - 1) // WORD_BITS
+        self.rows = np.zeros((height, self.n_words + 1), dtype=np.uint64)  # one spare word for the shifted masks
+
+    @property
+    def name(self):
+        return type(self).__name__
+
+    def contains(self, mask, place):
+        """ True if the @mask put at @place lies inside the canvas entirely """
+
+        x, y = place[0] + mask.offset_x, place[1] + mask.offset_y
+        return x >= 0 and y >= 0 and x + mask.width <= self.width and y + mask.height <= self.height
+
+    def collides(self, mask, place):
+        """ True if the @mask put at @place (inside the canvas, see contains) overlaps an occupied pixel """
+
+        if mask.height == 0:
+            return False
+
+        x, y = place[0] + mask.offset_x, place[1] + mask.offset_y
+        k = x // WORD_BITS
+        rows = mask.get_shifted(x % WORD_BITS)
+
+        window = self.rows[y:y + mask.height, k:k + mask.n_words]
+        n = window.shape[1]  # the spare words of the mask might stick out of the canvas, these are empty
+
+        return bool(np.any(window & rows[:, :n]))
+
+    def commit(self, mask, place):
+        """ marks the pixels of the @mask put at @place as occupied; the parts outside the canvas are dropped """
+
+        if mask.height == 0:
+            return
+
+        x, y = place[0] + mask.offset_x, place[1] + mask.offset_y
+
+        # clip to the canvas on the pixel level first
+        full = mask.unpack()
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + mask.width, self.width), min(y + mask.height, self.height)
+        if x0 >= x1 or y0 >= y1:
+            return
+
+        clipped = full[y0 - y:y1 - y, x0 - x:x1 - x]
+        k = x0 // WORD_BITS
+        s = x0 % WORD_BITS
+        n_words = (x1 - x0 + s + WORD_BITS - 1) // WORD_BITS
+
+        shifted = np.zeros((y1 - y0, n_words * WORD_BITS), dtype=bool)
+        shifted[:, s:s + x1 - x0] = clipped
+
+        packed = np.packbits(shifted, axis=1).view('>u8').astype(np.uint64)
+        self.rows[y0:y1, k:k + n_words] |= packed
+
+    def get_fill_ratio(self):
+        """ the share of the occupied pixels of the canvas """
+
+        bits = np.unpackbits(self.rows.astype('>u8').view(np.uint8), axis=1)[:, :self.width]
+        return float(bits.mean()) if bits.size else 0.0
+
+
+def get_depth(occupied, max_depth):
+    """
+      returns for every set pixel of the boolean @occupied array its chessboard distance to the nearest unset pixel
+      (1 next to an unset pixel), capped at @max_depth; 0 for the unset pixels; the pixels beyond the borders
+      of the array count as unset
+
+      the depth is the number of erosions (by the 3x3 square) the pixel survives, plus one
+    """
+
+    depth = np.zeros(occupied.shape, dtype=np.uint8)
+    current = occupied.copy()
+
+    for _ in range(max_depth):
+        if not current.any():
+            break
+        depth += current
+
+        # the square is separable: erode along the columns, then along the rows
+        rows = current.copy()
+        rows[1:, :] &= current[:-1, :]
+        rows[:-1, :] &= current[1:, :]
+        rows[[0, -1], :] = False
+
+        current = rows.copy()
+        current[:, 1:] &= rows[:, :-1]
+        current[:, :-1] &= rows[:, 1:]
+        current[:, [0, -1]] = False
+
+    return depth
+
+
+class DepthField:
+    """
+       the pixels of the canvas taken by the placed words (grown by the @stay_away distance, as in OccupancyBitmap),
+       and for every taken pixel its depth: the chessboard distance to the nearest free pixel (see get_depth);
+       the canvas outside counts as free
+
+       if a pixel of a word (grown by the stay-away distance as well) lies at depth d, the word collides
+       with a placed word at all positions less than d pixels away (along both axes) from the current one,
+       for the trees and the bitmap alike; hence these positions can be skipped without testing them
+
+       the depth is capped at @max_depth, so placing a word changes the depth only near the word
+    """
+
+    def __init__(self, width, height, max_depth=32, stay_away=0):
+        self.width = width
+        self.height = height
+        self.max_depth = max_depth
+        self.stay_away = stay_away
+
+        self.taken = np.zeros((height, width), dtype=bool)
+        self.depth = np.zeros((height, width), dtype=np.uint8)
+
+        self.n_probes = 0  # the number of positions probed
+        self.n_hits = 0  # the number of positions found inside the taken pixels
+
+    @property
+    def name(self):
+        return type(self).__name__
+
+    def get_probes(self, mask, max_probes=64):
+        """
+          returns the probes of the word with the boolean @mask: up to @max_probes of its pixels (grown by
+          the stay-away distance) spread along the word, as the pair (array of (x, y), bounding box of the pixels)
+        """
+
+        ys, xs = np.nonzero(dilate(np.asarray(mask, dtype=bool), self.stay_away))
+        if len(xs) == 0:
+            return np.zeros((0, 2), dtype=np.int64), None
+
+        if len(xs) > max_probes:
+            k = np.linspace(0, len(xs) - 1, max_probes).astype(np.int64)
+            xs, ys = xs[k], ys[k]
+
+        points = np.stack((xs, ys), axis=1).astype(np.int64) - self.stay_away
+        return points, tuple(points.min(axis=0).tolist() + points.max(axis=0).tolist())
+
+    def get_depth(self, probes, place):
+        """ the largest depth of the @probes (see get_probes) of a word put at @place; 0 if all of them are free """
+
+        points, box = probes
+        if box is None:
+            return 0
+
+        self.n_probes += 1
+
+        x, y = place
+        if x + box[0] >= 0 and y + box[1] >= 0 and x + box[2] < self.width and y + box[3] < self.height:
+            d = int(self.depth[points[:, 1] + y, points[:, 0] + x].max())
+        else:
+            xs, ys = points[:, 0] + x, points[:, 1] + y
+            inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+            d = int(self.depth[ys[inside], xs[inside]].max()) if inside.any() else 0
+
+        if d > 0:
+            self.n_hits += 1
+
+        return d
+
+    def get_depths(self, probes, xs, ys):
+        """ get_depth for the word put at every place (xs[k], ys[k]) of the arrays @xs, @ys at once """
+
+        points, box = probes
+        if box is None:
+            return np.zeros(len(xs), dtype=np.uint8)
+
+        self.n_probes += len(xs)
+
+        px, py = xs[:, None] + points[None, :, 0], ys[:, None] + points[None, :, 1]
+        inside = (px >= 0) & (px < self.width) & (py >= 0) & (py < self.height)
+
+        depths = np.where(inside, self.depth[np.clip(py, 0, self.height - 1), np.clip(px, 0, self.width - 1)], 0)
+        depths = depths.max(axis=1)
+        self.n_hits += int(np.count_nonzero(depths))
+
+        return depths
+
+    def commit(self, mask, place):
+        """ marks the pixels of the boolean @mask of a word put at @place, grown by the stay-away distance, as taken """
+
+        x, y = place[0] - self.stay_away, place[1] - self.stay_away
+        mask = dilate(np.asarray(mask, dtype=bool), self.stay_away)
+
+        h, w = mask.shape
+        x0, y0, x1, y1 = max(x, 0), max(y, 0), min(x + w, self.width), min(y + h, self.height)
+        if x0 >= x1 or y0 >= y1:
+            return
+
+        self.taken[y0:y1, x0:x1] |= mask[y0 - y:y1 - y, x0 - x:x1 - x]
+
+        # the depth changes only at most max_depth pixels away from the word; the depth there is found
+        # from the taken pixels up to max_depth pixels further
+        m = self.max_depth
+        u0, v0, u1, v1 = max(x0 - m, 0), max(y0 - m, 0), min(x1 + m, self.width), min(y1 + m, self.height)
+        s0, t0, s1, t1 = max(u0 - m, 0), max(v0 - m, 0), min(u1 + m, self.width), min(v1 + m, self.height)
+
+        depth = get_depth(self.taken[t0:t1, s0:s1], m)
+        self.depth[v0:v1, u0:u1] = depth[v0 - t0:v1 - t0, u0 - s0:u1 - s0]
+
+
+def _pool_pairs(a):
+    """ the 2x2 max-pool of the boolean array @a, an odd last row or column is completed with unset pixels """
+
+    h, w = a.shape
+    if h % 2 or w % 2:
+        padded = np.zeros((h + h % 2, w + w % 2), dtype=bool)
+        padded[:h, :w] = a
+        a = padded
+
+    return a.reshape(a.shape[0] // 2, 2, a.shape[1] // 2, 2).any(axis=(1, 3))
+
+
+class OccupancyPyramid:
+    """
+       the pixels of the canvas covered by the (inflated) leaf boxes of the placed words, kept as a max-pyramid:
+       the cell (u, v) of the level k tells if any pixel of the square [u * 2^k, (u + 1) * 2^k) x [v * 2^k, ...)
+       is covered; a box is looked up on the level where it spans a few cells, and on the pixels only if it is small
+
+       a word whose root box (or each of the first-level boxes of its tree) meets no covered pixel collides with
+       no placed word for sure; a word one of whose leaves has its center on a covered pixel collides for sure,
+       since that leaf touches a leaf of a placed word (a few leaves spread along the word are enough to find
+       most of these positions); every other position is left to the trees
+
+       only the canvas is known, the boxes sticking out of it are never decided
+    """
+
+    def __init__(self, width, height, query_cells=4, max_exact_area=4096):
+        self.width = width
+        self.height = height
+        self.query_cells = query_cells  # a box is looked up on the level where it spans about this many cells
+        self.max_exact_area = max_exact_area  # the boxes of at most this many pixels are looked up on the pixels
+
+        self.levels = [np.zeros((height, width), dtype=bool)]
+        while self.levels[-1].shape[0] > 1 or self.levels[-1].shape[1] > 1:
+            self.levels.append(_pool_pairs(self.levels[-1]))
+
+        self.n_tests = 0  # the positions tested
+        self.n_free = 0  # the positions found free for sure
+        self.n_blocked = 0  # the positions found blocked for sure
+
+    @property
+    def name(self):
+        return type(self).__name__
+
+    def get_hit_rate(self):
+        """ the share of the tested positions decided without the trees """
+        return (self.n_free + self.n_blocked) / self.n_tests if self.n_tests else 0.0
+
+    @staticmethod
+    def get_leaf_centers(tree, max_centers=64):
+        """ the centers (x, y) of up to @max_centers leaves of the flat quadtree @tree, spread along it, as an array """
+
+        boxes = tree.get_leaf_boxes(inflated=False).astype(np.int64)
+        if len(boxes) > max_centers:
+            boxes = boxes[np.linspace(0, len(boxes) - 1, max_centers).astype(np.int64)]
+        return np.stack(((boxes[:, 0] + boxes[:, 2]) // 2, (boxes[:, 1] + boxes[:, 3]) // 2), axis=1)
+
+    def may_be_covered(self, box):
+        """ False if no pixel of the box (x0, y0, x1, y1) inside the canvas, borders included, is covered """
+
+        x0, y0, x1, y1 = box
+        k = min((max(x1 - x0, y1 - y0) // self.query_cells).bit_length(), len(self.levels) - 1)
+
+        if not self.levels[k][y0 >> k:(y1 >> k) + 1, x0 >> k:(x1 >> k) + 1].any():
+            return False
+        if k == 0 or (x1 - x0 + 1) * (y1 - y0 + 1) > self.max_exact_area:
+            return True
+
+        return bool(self.levels[0][y0:y1 + 1, x0:x1 + 1].any())
+
+    def classify(self, root_box, boxes, centers, place):
+        """
+          returns False if the word with the (inflated) @root_box, first-level @boxes and leaf @centers
+          (see get_leaf_centers) put at @place collides with no placed word for sure, True if it collides for sure,
+          and None if the trees have to decide
+        """
+
+        self.n_tests += 1
+
+        x, y = place
+        root = (root_box[0] + x, root_box[1] + y, root_box[2] + x, root_box[3] + y)
+        if root[0] < 0 or root[1] < 0 or root[2] >= self.width or root[3] >= self.height:
+            return None
+
+        # along a spiral most positions lie over placed words, hence this test comes first
+        if self.levels[0][centers[:, 1] + y, centers[:, 0] + x].any():
+            self.n_blocked += 1
+            return True
+
+        if not self.may_be_covered(root) or \
+                not any(self.may_be_covered((b[0] + x, b[1] + y, b[2] + x, b[3] + y)) for b in boxes):
+            self.n_free += 1
+            return False
+
+        return None
+
+    def get_blocked(self, centers, xs, ys):
+        """
+          the blocked-for-sure test of classify for the word put at every place (xs[k], ys[k]) of the arrays
+          @xs, @ys at once, returns a boolean array
+        """
+
+        self.n_tests += len(xs)
+
+        px, py = xs[:, None] + centers[None, :, 0], ys[:, None] + centers[None, :, 1]
+        inside = (px >= 0) & (px < self.width) & (py >= 0) & (py < self.height)
+
+        covered = inside & self.levels[0][np.clip(py, 0, self.height - 1), np.clip(px, 0, self.width - 1)]
+        blocked = covered.any(axis=1)
+        self.n_blocked += int(np.count_nonzero(blocked))
+
+        return blocked
+
+    def commit(self, boxes, place):
+        """ marks the pixels of the (inflated) leaf @boxes of a word put at @place as covered """
+
+        x, y = place
+        r = None  # the region of the canvas changed
+        for b in boxes:
+            x0, y0 = max(b[0] + x, 0), max(b[1] + y, 0)
+            x1, y1 = min(b[2] + x, self.width - 1), min(b[3] + y, self.height - 1)
+            if x0 > x1 or y0 > y1:
+                continue
+
+            self.levels[0][y0:y1 + 1, x0:x1 + 1] = True
+            r = (x0, y0, x1, y1) if r is None else (min(r[0], x0), min(r[1], y0), max(r[2], x1), max(r[3], y1))
+
+        if r is None:
+            return
+
+        # the cells above the changed region, level by level
+        x0, y0, x1, y1 = r
+        for k in range(1, len(self.levels)):
+            x0, y0, x1, y1 = x0 >> 1, y0 >> 1, x1 >> 1, y1 >> 1
+            self.levels[k][y0:y1 + 1, x0:x1 + 1] = _pool_pairs(self.levels[k - 1][2 * y0:2 * y1 + 2, 2 * x0:2 * x1 + 2])
@@ -0,0 +1,169 @@
+# Author: Hayk Aleksanyan
+# walking the spiral of a word in several processes at once
+
+import concurrent.futures
+
+import numpy as np
+
+import bbox
+
+_quadtrees = None  # the trees of all tokens, set once in every worker process, see _init_worker
+_test_collision = None  # the function testing two trees for a collision
+
+
+def _init_worker(quadtrees, test_collision):
+    global _quadtrees, _test_collision
+    _quadtrees = quadtrees
+    _test_collision = test_collision
+
+
+def _search_chunk(i, positions, placed, canvas_size, stay_away):
+    """ search_positions for the i-th token, run in a worker process """
+    return search_positions(i, positions, placed, _quadtrees, _test_collision, canvas_size, stay_away)
+
+
+def get_positions(spiral, start, n):
+    """
+      returns the first @n positions of a word walking along the (seekable) @spiral from the @start;
+      the spiral moves relative to the last position, i.e. the positions are the running sums of its items
+    """
+    return np.asarray(start, dtype=np.int64) + np.cumsum(spiral.get_points(0, n), axis=0)
+
+
+def search_positions(i, positions, placed, quadtrees, test_collision, canvas_size, stay_away):
+    """
+      tests the positions (an (n, 2) array) of the i-th token, in their order, against the @placed tokens,
+      given as a list of pairs (index of the token, its place); @quadtrees are the trees of all tokens
+
+      returns the pair (k_inside, k_free): the index of the first collision-free position inside the canvas and
+      the index of the first collision-free position (inside the canvas or not); -1 if there is no such position
+    """
+
+    quadtree = quadtrees[i]
+    x0, y0, x1, y1 = quadtree.root_box
+    xs, ys = positions[:, 0], positions[:, 1]
+
+    if placed:
+        keys = np.array([j for j, _ in placed], dtype=np.int64)
+        boxes = np.array([quadtrees[j].root_box for j, _ in placed], dtype=np.int64)
+        boxes += np.array([(p[0], p[1], p[0], p[1]) for _, p in placed], dtype=np.int64)
+        places = dict(placed)
+    else:
+        keys, boxes, places = np.zeros(0, dtype=np.int64), np.zeros((0, 4), dtype=np.int64), dict()
+
+    # hits[p, k] - the root of the token at the p-th position intersects the root of the k-th placed token
+    hits = ~((xs[:, None] + x0 > boxes[:, 2]) | (xs[:, None] + x1 < boxes[:, 0]) |
+             (ys[:, None] + y0 > boxes[:, 3]) | (ys[:, None] + y1 < boxes[:, 1]))
+
+    k_free = -1
+    last_hit = -1
+    for p in range(len(positions)):
+        location = (int(xs[p]), int(ys[p]))
+        candidates = keys[hits[p]].tolist()
+
+        collision = False
+        if last_hit in candidates:
+            collision = test_collision(quadtree, quadtrees[last_hit], location, places[last_hit], stay_away)
+
+        if not collision:
+            for j in candidates:
+                if j != last_hit and test_collision(quadtree, quadtrees[j], location, places[j], stay_away):
+                    collision = True
+                    last_hit = j
+                    break
+
+        if not collision:
+            if k_free < 0:
+                k_free = p
+            if bbox.is_inside_canvas(quadtree, location, canvas_size):
+                return p, k_free
+
+    return -1, k_free
+
+
+class ParallelSpiralSearch:
+    """
+       walks the spiral of a word in chunks of positions, tested in @workers processes;
+       the trees of all tokens are sent to every process once, a chunk carries only the positions and
+       the places of the placed tokens
+
+       the chunks are collected in the order of the spiral, hence the place found is the same as with the serial walk
+    """
+
+    def __init__(self, quadtrees, test_collision, workers, chunk_size=1024, serial_steps=2048):
+        self.quadtrees = quadtrees
+        self.test_collision = test_collision
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.serial_steps = serial_steps  # the positions tested in the main process first, before using the pool
+
+        self.pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                                           initargs=(quadtrees, test_collision))
+        self.n_parallel = 0  # the number of words which needed the pool
+
+    @property
+    def name(self):
+        return type(self).__name__
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True)
+
+    def search(self, i, start, spiral, placed, canvas_size, stay_away):
+        """
+          the place of the i-th token walking along the @spiral from the @start (see Wordle.place_words):
+          the first collision-free position inside the canvas or, if there is none, the first collision-free one;
+          the walk stops 10 steps for every step made inside the canvas after the token left the canvas
+        """
+
+        c_w, c_h = canvas_size
+        n = 0  # positions computed so far
+        positions = np.zeros((0, 2), dtype=np.int64)
+        limit = -1  # the number of positions to test, known once the token leaves the canvas
+
+        def extend(m):
+            nonlocal positions, n, limit
+            if m <= n:
+                return
+            m = max(m, 2 * n)  # the positions are recomputed from the start, hence we grow them geometrically
+            positions = get_positions(spiral, start, m)
+            if limit < 0:
+                xs, ys = positions[n:, 0], positions[n:, 1]
+                outside = np.flatnonzero((xs < 0) | (xs >= c_w) | (ys < 0) | (ys > c_h))
+                if len(outside):
+                    limit = 11 * (n + int(outside[0]) + 1)
+            n = m
+
+        # the cheap words are placed in this process, without waiting for the pool
+        extend(self.serial_steps)
+        last = self.serial_steps if limit < 0 else min(self.serial_steps, limit)
+        k_inside, k_free = search_positions(i, positions[:last], placed, self.quadtrees, self.test_collision,
+                                            canvas_size, stay_away)
+        if k_inside >= 0:
+            return tuple(positions[k_inside].tolist())
+
+        fallback = None if k_free < 0 else tuple(positions[k_free].tolist())
+        first = last
+        self.n_parallel += 1
+
+        while limit < 0 or first < limit:
+            # a wave of chunks, one or two for every worker
+            futures = []
+            for _ in range(2 * self.workers):
+                extend(first + self.chunk_size)
+                last = first + self.chunk_size if limit < 0 else min(first + self.chunk_size, limit)
+                if first >= last:
+                    break
+                futures.append((first, self.pool.submit(_search_chunk, i, positions[first:last], placed,
+                                                        canvas_size, stay_away)))
+                first = last
+
+            for k, (offset, future) in enumerate(futures):
+                k_inside, k_free = future.result()
+                if fallback is None and k_free >= 0:
+                    fallback = tuple(positions[offset + k_free].tolist())
+                if k_inside >= 0:
+                    for _, other in futures[k + 1:]:
+                        other.cancel()
+                    return tuple(positions[offset + k_inside].tolist())
+
+        return fallback
@@ -0,0 +1,194 @@
+# Author: Hayk Aleksanyan
+# cache of word shapes (cropped image size and quadtree) shared between runs
+
+from collections import OrderedDict
+import hashlib
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+
+from trees import FlatQuadTree
+
+
+_file_hashes = dict()  # (path, size, mtime) -> sha1 of the file content
+
+
+def get_file_hash(file_path):
+    """ returns the sha1 hex-digest of the content of the file, computed once per version of the file """
+
+    st = os.stat(file_path)
+    key = (os.path.abspath(file_path), st.st_size, st.st_mtime_ns)
+
+    if key not in _file_hashes:
+        h = hashlib.sha1()
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        _file_hashes[key] = h.hexdigest()
+
+    return _file_hashes[key]
+
+
+class LRUCache:
+    """
+       a dictionary holding at most @max_size items, or items of total size at most @max_size
+       if the function @size_of giving the size of an item (e.g. in bytes) is given;
+       when full, the least recently used items are evicted
+    """
+
+    def __init__(self, max_size=1024, size_of=None):
+        self.max_size = max_size
+        self.size_of = size_of
+        self.size = 0  # the total size of the items, their number if there is no size_of
+        self._items = OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, default=None):
+        if key not in self._items:
+            return default
+
+        self._items.move_to_end(key)
+        return self._items[key]
+
+    def _get_size(self, value):
+        return 1 if self.size_of is None else self.size_of(value)
+
+    def put(self, key, value):
+        if key in self._items:
+            self.size -= self._get_size(self._items[key])
+        self._items[key] = value
+        self._items.move_to_end(key)
+        self.size += self._get_size(value)
+
+        while self.size > self.max_size:
+            _, evicted = self._items.popitem(last=False)
+            self.size -= self._get_size(evicted)
+
+    def clear(self):
+        self._items.clear()
+        self.size = 0
+
+
+class ShapeCache:
+    """
+       keeps the shapes of the words, i.e. the size of the cropped image and the (flat) quadtree,
+       in a bounded in-memory LRU and, if @cache_dir is given, in a persistent on-disk store
+
+       files on disk are written to a temporary file first and then renamed into place,
+       hence several processes may share the same @cache_dir; a file which cannot be written (e.g. a full disk or
+       a read-only @cache_dir) is only logged, the shape stays in memory
+    """
+
+    def __init__(self, max_entries=4096, cache_dir=None):
+        self.memory = LRUCache(max_entries)
+        self.cache_dir = cache_dir
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.write_errors = 0  # the shapes which could not be written to the disk
+
+        if self.cache_dir:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+            except OSError as e:
+                print('[{}] cannot create the cache directory <{}>: {}'.format(self.name, self.cache_dir, e),
+                      flush=True)
+
+    @property
+    def name(self):
+        return type(self).__name__
+
+    @staticmethod
+    def make_key(word, font_path, font_size, angle, quadtree_min_size, stay_away, kind="word"):
+        """
+          the key of a shape; the font enters through the hash of its file
+          @kind tells apart shapes of the same text built in different ways, e.g. a word vs. a single glyph
+        """
+
+        s = repr((kind, word, get_file_hash(font_path), font_size, angle, quadtree_min_size, stay_away))
+        return hashlib.sha1(s.encode("utf-8")).hexdigest()
+
+    def _get_file_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".npz")
+
+    def get(self, key):
+        """ returns the pair (img_size, quadtree) stored under the @key or None if there is no such entry """
+
+        shape = self.memory.get(key)
+        if shape is not None:
+            self.hits += 1
+            return shape
+
+        if self.cache_dir:
+            shape = self._read_from_disk(key)
+            if shape is not None:
+                self.disk_hits += 1
+                self.memory.put(key, shape)
+                return shape
+
+        self.misses += 1
+        return None
+
+    def put(self, key, img_size, quadtree):
+        """ stores the shape in memory and, if the cache is persistent, on the disk """
+
+        shape = (tuple(img_size), quadtree)
+        self.memory.put(key, shape)
+
+        if self.cache_dir:
+            self._write_to_disk(key, shape)
+
+    def _read_from_disk(self, key):
+        file_path = self._get_file_path(key)
+        if not os.path.exists(file_path):
+            return None
+
+        try:
+            with np.load(file_path, allow_pickle=False) as data:
+                img_size = tuple(int(x) for x in data['img_size'])
+                quadtree = FlatQuadTree.from_arrays(data)
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            # a broken entry is treated as a miss and will be overwritten
+            return None
+
+        return img_size, quadtree
+
+    def _write_to_disk(self, key, shape):
+        img_size, quadtree = shape
+
+        file_path = self._get_file_path(key)
+        folder = os.path.dirname(file_path)
+
+        tmp_path = None
+        try:
+            os.makedirs(folder, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, img_size=np.array(img_size, dtype=np.int32), **quadtree.to_arrays())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, file_path)  # atomic, readers see either no file or the complete one
+        except OSError as e:
+            # the persistent cache is optional, the shape is kept in memory only
+            if tmp_path is not None and os.path.exists(tmp_path):
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
+            self.write_errors += 1
+            if self.write_errors == 1:
+                print('[{}] cannot write the shape to <{}>: {}'.format(self.name, file_path, e), flush=True)
+
+    def get_stats(self):
+        return "[{}] memory hits={}, disk hits={}, misses={}, write errors={}".format(self.name, self.hits,
+                                                                                       self.disk_hits, self.misses,
+                                                                                       self.write_errors)
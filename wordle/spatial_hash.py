@@ -0,0 +1,123 @@
+# Author: Hayk Aleksanyan
+# uniform grid over the canvas to find the placed words near a given box
+
+from collections import defaultdict
+
+import numpy as np
+
+
+class GridIndex:
+    """
+       buckets the boxes of the placed words by the square cells of side @cell_size they touch;
+       a query returns the keys of all boxes sharing a cell with the given box, i.e. a superset of the boxes
+       intersecting it; the grid is unbounded, hence words placed outside of the canvas are handled as well
+    """
+
+    def __init__(self, cell_size=128):
+        self.cell_size = cell_size
+        self.cells = defaultdict(list)  # (column, row) -> keys of the boxes touching the cell
+        self.size = 0  # the number of boxes
+
+        # consecutive positions of the spiral mostly touch the same cells, so we keep the last answer
+        self._last_range = None
+        self._last_result = None
+
+    def __len__(self):
+        return self.size
+
+    def _get_range(self, box):
+        c = self.cell_size
+        return box[0] // c, box[1] // c, box[2] // c, box[3] // c
+
+    def insert(self, key, box):
+        """ adds the box (x0, y0, x1, y1) under the @key """
+
+        u0, v0, u1, v1 = self._get_range(box)
+        for u in range(u0, u1 + 1):
+            for v in range(v0, v1 + 1):
+                self.cells[(u, v)].append(key)
+
+        self.size += 1
+        self._last_range = None
+
+    def query(self, box):
+        """ returns the sorted list of the keys of the boxes which touch a cell of the given box """
+
+        r = self._get_range(box)
+        if r == self._last_range:
+            return self._last_result
+
+        u0, v0, u1, v1 = r
+        keys = set()
+        for u in range(u0, u1 + 1):
+            for v in range(v0, v1 + 1):
+                cell = self.cells.get((u, v))
+                if cell:
+                    keys.update(cell)
+
+        self._last_range = r
+        self._last_result = sorted(keys)
+
+        return self._last_result
+
+
+class MoveToFrontList:
+    """
+       a short list of the recently used keys, the most recent first;
+       used to test first the words which have blocked the previous positions
+    """
+
+    def __init__(self, max_size=8):
+        self.max_size = max_size
+        self.items = []
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def touch(self, key):
+        """ moves (or adds) the @key to the front of the list """
+
+        if key in self.items:
+            self.items.remove(key)
+        self.items.insert(0, key)
+
+        del self.items[self.max_size:]
+
+
+class BoxList:
+    """
+       the boxes of the placed words kept in one array, for testing many positions of a word at once
+    """
+
+    def __init__(self):
+        self._keys = []
+        self._boxes = []
+
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.boxes = np.zeros((0, 4), dtype=np.int64)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def append(self, key, box):
+        """ adds the box (x0, y0, x1, y1) under the @key """
+
+        self._keys.append(key)
+        self._boxes.append(box)
+
+        self.keys = None  # rebuilt at the next query
+
+    def query(self, box):
+        """ returns the keys and the boxes (as arrays) of the boxes which intersect the given box, borders included """
+
+        if self.keys is None:
+            self.keys = np.array(self._keys, dtype=np.int64)
+            self.boxes = np.array(self._boxes, dtype=np.int64).reshape(-1, 4)
+
+        b = self.boxes
+        hit = ~((box[0] > b[:, 2]) | (box[2] < b[:, 0]) | (box[1] > b[:, 3]) | (box[3] < b[:, 1]))
+
+        return self.keys[hit], b[hit]
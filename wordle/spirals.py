@@ -1,20 +1,28 @@
 # Author: Hayk Aleksanyan
 # support for various types of 2d spirals
 
+import itertools
 import math
 import numpy as np
 import os
 from PIL import Image
 
+_archimedian_points = dict()  # param -> (generator, array of the first items taken from it), see Archimedian
+ARCH_SHARED_ITEMS = 1 << 18  # the most items of an Archimedian spiral kept for all spirals with its parameter
+ARCH_SHARED_PARAMS = 8  # the most parameters whose items are kept
+
 
 class SpiralBase:
     """
        the base class of a 2d spiral
     """
 
+    seekable = False  # True if the items of the spiral can be accessed by their index, see get_points
+
     def __init__(self, generator):
         """ the generator of the spiral, will be initialized through a derived class for specific spiral types """
         self.generator = generator
+        self.index = 0  # the index of the next item of an seekable spiral
 
     @property
     def name(self):
@@ -24,6 +32,110 @@ class SpiralBase:
     def get_alias():
         return ""
 
+    def get_block(self, n):
+        """
+         returns the next @n items of the generator as an (n, 2) integer array (shorter if the generator stops);
+         alters the state of the generator the same way as taking the items one by one
+        """
+
+        if self.seekable:
+            block = self.get_points(self.index, n)
+            self.index += len(block)
+            return block
+
+        items = itertools.chain.from_iterable(itertools.islice(self.generator, n))
+        return np.fromiter(items, dtype=np.int64).reshape(-1, 2)
+
+    def get_points(self, first, n):
+        """
+         returns the items of the spiral with indices @first, ..., @first + @n - 1 as an (n, 2) integer array,
+         without altering the state of the generator; only for the seekable spirals
+        """
+        raise NotImplementedError('[{}] the items of the spiral cannot be accessed by index'.format(self.name))
+
+    def seek(self, index):
+        """ the generator (and get_block) of a seekable spiral will continue from the item with the given @index """
+
+        if not self.seekable:
+            raise NotImplementedError('[{}] the spiral cannot be moved to an index'.format(self.name))
+        self.index = index
+
+    def skip_inside(self, start, box):
+        """
+         moves a seekable spiral (see seek) past its next items keeping the point walking along it from the @start
+         inside the @box (x0, y0, x1, y1), borders included; returns the positions of the point after the items
+         skipped as an (n, 2) integer array, empty if the next item already leaves the @box
+
+         the positions are computed in blocks (doubling in size) from get_points, not one by one
+        """
+
+        x0, y0, x1, y1 = box
+        location = np.array(start, dtype=np.int64)
+        skipped, n = [], 16
+        while True:
+            positions = location + np.cumsum(self.get_points(self.index, n), axis=0)
+            xs, ys = positions[:, 0], positions[:, 1]
+            out = np.flatnonzero((xs < x0) | (xs > x1) | (ys < y0) | (ys > y1))
+
+            k = int(out[0]) if len(out) else len(positions)
+            skipped.append(positions[:k])
+            self.seek(self.index + k)
+            if len(out):
+                return np.concatenate(skipped)
+
+            location = positions[-1]
+            n *= 2
+
+    def walk_inside(self, start, box):
+        """
+         yields the positions inside the @box (x0, y0, x1, y1), borders included, of a point walking along
+         the spiral from the @start; the items of the spiral accumulate, i.e. the position after the k-th item is
+         the @start plus the sum of the items 0, ..., k (as in Wordle.place_words); only for the seekable spirals
+
+         the positions are computed a turn at a time, those outside the @box are dropped at once; the walk ends
+         (the spiral is exhausted) after a turn with no position inside the @box which lies farther from the start
+         than all corners of the @box; this assumes that the walk does not come back, which is not proven for the
+         Archimedean spiral: its walk moves away from the start by about |param| per item, checked over the
+         first 2^22 items (see test_spirals.py); the rectangular spiral does come back and has its own end
+        """
+
+        x0, y0, x1, y1 = box
+        if x0 > x1 or y0 > y1:
+            return
+
+        location = np.array(start, dtype=np.int64)
+        corners = np.array([(x0, y0), (x0, y1), (x1, y0), (x1, y1)], dtype=np.int64) - location
+        radius = (corners ** 2).sum(axis=1).max()
+
+        first = 0
+        while True:
+            offsets = self.get_points(first, self.items_per_turn)
+            first += len(offsets)
+
+            positions = location + np.cumsum(offsets, axis=0)
+            location = positions[-1]
+
+            xs, ys = positions[:, 0], positions[:, 1]
+            inside = (xs >= x0) & (xs <= x1) & (ys >= y0) & (ys <= y1)
+            if not inside.any() and (((positions - start) ** 2).sum(axis=1) > radius).all():
+                return
+
+            for x, y in positions[inside].tolist():
+                yield x, y
+
+    def walk(self):
+        """ the generator of an seekable spiral, takes the items from get_points and follows the moves of seek """
+
+        block, first = [], 0
+        while True:
+            k = self.index - first
+            if not 0 <= k < len(block):
+                first, k = self.index, 0
+                block = [tuple(item) for item in self.get_points(first, 256).tolist()]
+
+            self.index += 1
+            yield block[k]
+
     def draw(self, width, height, n_of_iter, snapshot_freq=-1):
         """
          draw the spiral based on the generator @gen on a 2d canvas of the given @width and @height
@@ -85,13 +197,53 @@ class Archimedian(SpiralBase):
         Models the Archimedian spiral with the given parameter
     """
 
+    seekable = True
+    items_per_turn = 13  # the angle grows by 0.5 with every item of spiral() (or more), see walk_inside
+
     def __init__(self, param):
-        super().__init__(self.spiral(param))
+        self.param = param
+        self._gen, self._points = None, None  # the items of this spiral only, once it walks past the shared ones
+        super().__init__(self.walk())
 
     @staticmethod
     def get_alias():
         return "arch"
 
+    def get_points(self, first, n):
+        """
+         the items of the spiral depend on the previous ones (see spiral), hence we take them from a generator
+         and keep them: the first ARCH_SHARED_ITEMS items are shared by all spirals with the same parameter,
+         a spiral walking past them keeps all of its items itself, they are freed with the spiral
+        """
+
+        if self._gen is None and first + n > ARCH_SHARED_ITEMS:
+            self._gen, self._points = self.spiral(self.param), np.zeros((0, 2), dtype=np.int64)
+
+        if self._gen is not None:
+            self._points = Archimedian._take(self._gen, self._points, max(first + n, 2 * len(self._points)))
+            return self._points[first:first + n].copy()
+
+        gen, points = _archimedian_points.pop(self.param, (None, None))
+        if gen is None:
+            gen, points = self.spiral(self.param), np.zeros((0, 2), dtype=np.int64)
+            while len(_archimedian_points) >= ARCH_SHARED_PARAMS:
+                _archimedian_points.pop(next(iter(_archimedian_points)))  # the least recently used parameter
+
+        points = Archimedian._take(gen, points, min(max(first + n, 2 * len(points)), ARCH_SHARED_ITEMS))
+        _archimedian_points[self.param] = (gen, points)
+
+        return points[first:first + n].copy()
+
+    @staticmethod
+    def _take(gen, points, size):
+        """ the @points taken from the generator @gen so far, with more items of it up to @size items """
+
+        if len(points) >= size:
+            return points
+
+        more = np.fromiter(itertools.chain.from_iterable(itertools.islice(gen, size - len(points))), dtype=np.int64)
+        return np.concatenate([points, more.reshape(-1, 2)])
+
     def spiral(self, a):
         """
          generator for the Archimedian spiral r = a*\phi (in polar coordinates)
@@ -119,71 +271,151 @@ class Archimedian(SpiralBase):
 class Rectangular(SpiralBase):
     """ Models a Rectangular spiral  with the given parameters """
 
+    seekable = True
+
+    # the directions of the sides of the spiral, in the order they are walked
+    directions = np.array([(0, -1), (1, 0), (0, 1), (-1, 0)], dtype=np.int64)
+
     def __init__(self, param, reverse=1):
         param = int(param)
-        super().__init__(self.spiral(param, reverse))
+        self.param = param
+        self.reverse = reverse
+        super().__init__(self.walk())
 
     @staticmethod
     def get_alias():
         return "rect"
 
-    def spiral(self, a, reverse):
+    def get_points(self, first, n):
+        """
+         the items of the spiral computed directly from their indices;
+         the t-th side of the spiral (t = 0, 1, ...) has length a*(t//2 + 1) and is walked in the direction t % 4,
+         hence L(t) = a*q*(q + 1) steps are made before the side t = 2q and L(t) = a*(q + 1)^2 before t = 2q + 1;
+         every 4 sides move the spiral by (-a, a)
+        """
+
+        a = self.param
+        k = np.arange(first, first + n, dtype=np.int64)
+        if n <= 0:
+            return np.zeros((0, 2), dtype=np.int64)
+
+        # the number of steps made before each side, enough sides to reach the last index
+        t_max = 2 * int(math.sqrt(max(k[-1], 1) / a)) + 4
+        t = np.arange(t_max + 1, dtype=np.int64)
+        q = t // 2
+        steps_before = np.where(t % 2 == 0, a * q * (q + 1), a * (q + 1) ** 2)
+
+        # the item k >= 1 lies on the side t with L(t) < k <= L(t + 1)
+        side = np.searchsorted(steps_before, k, side='left') - 1
+        side = np.maximum(side, 0)
+
+        g, r = side // 4, side % 4
+        corner_x = -a * g + np.where(r >= 2, a * (2 * g + 1), 0)
+        corner_y = a * g - np.where(r >= 1, a * (2 * g + 1), 0) + np.where(r >= 3, a * (2 * g + 2), 0)
+
+        along = k - steps_before[side]
+        points = np.stack([corner_x, corner_y], axis=1) + along[:, None] * self.directions[r]
+        points[k == 0] = 0
+
+        return points if self.reverse else -points
+
+    def get_side(self, t):
         """
-         generator for rectangular spiral
-         directions = [(0,-1), (1,0), (0, 1), (-1, 0)]
+         returns the t-th side of the spiral as the tuple (L(t), length, corner, direction), see get_points;
+         the item L(t) + j, j = 1, ..., length, of the spiral is the corner plus j steps in the direction
+        """
+
+        a = self.param
+        q, g, r = t // 2, t // 4, t % 4
+        steps_before = a * q * (q + 1) if t % 2 == 0 else a * (q + 1) ** 2
+        corner = np.array([-a * g + (a * (2 * g + 1) if r >= 2 else 0),
+                           a * g - (a * (2 * g + 1) if r >= 1 else 0) + (a * (2 * g + 2) if r >= 3 else 0)],
+                          dtype=np.int64)
+        sign = 1 if self.reverse else -1
 
-         if reverse, then spiral the normal way, otherwise, do mirror reflection in (x,y)
+        return steps_before, a * (q + 1), sign * corner, sign * self.directions[r]
+
+    def is_exhausted(self, g, box):
+        """
+         True if no position of the walk from (0, 0) after its side 4*@g lies inside the @box (x0, y0, x1, y1), but
+         for the point (0, -(a*a - 1)/8) of an odd a = param, visited again at the end of every turn and already by
+         the sides before (g >= 1); for the walk of reverse=1, the walk of the other spiral is its mirror image
+
+         the bounds come from the closed forms of the sides of the turns g' >= g, see get_points and walk_inside;
+         with m = a*(a + 1)/2 the walk comes back to (-m*g', -m*(g' + 1)) after the side 4*g', and
+           on the side 4g' + 1:  y <= -(g' + 1)*(m + a)
+           on the side 4g' + 2:  y <= -(g' + 1)*(m + a*a - a + 2*a*a*g')
+           on the side 4g' + 3:  x >= (g' + 1)*(m - a) + 2*a*a*(g' + 1)^2
+           on the side 4g' + 4:  2x = a*(g' + 1)*(2k - a - 1) after the item k steps before its end, i.e.
+                                 |x| >= a*(g' + 1)/2 for an even a; |x| >= a*(g' + 1) or x = 0 (the point above)
+                                 for an odd a
+         every bound moves away from the start as g' grows, hence the bounds of the turn @g hold for all later turns
         """
 
-        x, y = 0, 0
-        yield x, y
+        a = self.param
+        m = a * (a + 1) // 2
+        x0, y0, x1, y1 = box
+        far = max(abs(x0), abs(x1))
 
-        m = a
+        if (g + 1) * (m + a) <= -y0 or (g + 1) * (m + a * a - a + 2 * a * a * g) <= -y0:
+            return False
+        if (g + 1) * (m - a) + 2 * a * a * (g + 1) ** 2 <= x1:
+            return False
+        if a % 2 == 0:
+            return a * (g + 1) > 2 * far
 
-        while True:
-            i = 0
-            while i < m:
-                y -= 1
-                i += 1
+        return a * (g + 1) > far and (g >= 1 or not (x0 <= 0 <= x1 and y0 <= -(a * a - 1) // 8 <= y1))
 
-                if reverse:
-                    yield x, y
-                else:
-                    yield -x, -y
+    def walk_inside(self, start, box):
+        """
+         SpiralBase.walk_inside, with the positions computed side by side: on the side t the item j = 1, 2, ...
+         is the corner c of the side plus j steps in its direction d, hence the position after it is
+         p + j*c + j*(j + 1)/2 * d, where p is the position at the corner; the coordinate across the direction
+         changes by the corner only, i.e. linearly in j, and only the items keeping it inside the @box are computed
 
-            i = 0
-            while i < m:
-                x += 1
-                i += 1
+         the walk ends once no later side can reach the @box, see is_exhausted; the only position left out is
+         the one the walk of an odd param comes back to in every turn, which has been yielded before
+        """
 
-                if reverse:
-                    yield x, y
-                else:
-                    yield -x, -y
+        x0, y0, x1, y1 = box
+        if x0 > x1 or y0 > y1:
+            return
 
-            i = 0
-            m = m + a
+        p = np.array(start, dtype=np.int64)
 
-            while i < m:
-                y += 1
-                i += 1
+        if x0 <= p[0] <= x1 and y0 <= p[1] <= y1:
+            yield int(p[0]), int(p[1])  # the item 0 does not move
 
-                if reverse:
-                    yield x, y
-                else:
-                    yield -x, -y
+        # the box seen from the start, by the walk of reverse=1
+        relative = (x0 - start[0], y0 - start[1], x1 - start[0], y1 - start[1])
+        if not self.reverse:
+            relative = (-relative[2], -relative[3], -relative[0], -relative[1])
 
-            i = 0
-            while i < m:
-                x -= 1
-                i += 1
+        t = 0
+        while t % 4 != 1 or not self.is_exhausted(t // 4, relative):
+            _, n, corner, d = self.get_side(t)
 
-                if reverse:
+            # the items j in [j0, j1] keep the linear coordinate c + j*b inside [lo, hi]
+            axis = 1 if d[0] != 0 else 0
+            b, c, lo, hi = int(corner[axis]), int(p[axis]), box[axis], box[axis + 2]
+            if b == 0:
+                j0, j1 = (1, n) if lo <= c <= hi else (1, 0)
+            elif b > 0:
+                j0, j1 = -((c - lo) // b), (hi - c) // b
+            else:
+                j0, j1 = -((c - hi) // b), (lo - c) // b
+            j0, j1 = max(j0, 1), min(j1, n)
+
+            if j0 <= j1:
+                j = np.arange(j0, j1 + 1, dtype=np.int64)
+                positions = p + j[:, None] * corner + (j * (j + 1) // 2)[:, None] * d
+                xs, ys = positions[:, 0], positions[:, 1]
+                inside = (xs >= x0) & (xs <= x1) & (ys >= y0) & (ys <= y1)
+                for x, y in positions[inside].tolist():
                     yield x, y
-                else:
-                    yield -x, -y
 
-            m = m + a
+            p = p + n * corner + (n * (n + 1) // 2) * d
+            t += 1
 
 
 class RandomWalk(SpiralBase):
@@ -0,0 +1,213 @@
+# Author: Hayk Aleksanyan
+# testing a whole side of the rectangular spiral against the placed words at once
+
+import numpy as np
+
+import spatial_hash
+
+
+def _get_quadratic_range(a, b, c, lo, hi, n):
+    """
+      for the integer j in [1, n], the values q(j) = a*j*(j + 1)/2 + b*j + c lie in [lo, hi] on at most 2 intervals
+      of j, returned as two (m, 2) arrays of (first, last) pairs, empty if first > last; the arguments are arrays
+      of length m, a is 1 or -1, i.e. q is convex or concave; q is multiplied by 2*a (with its bounds) to be convex
+    """
+
+    # 2*a*q(j) = j*j + (2*a*b + 1)*j + 2*a*c, since a*a = 1
+    lo2, hi2 = np.where(a > 0, 2 * lo, -2 * hi), np.where(a > 0, 2 * hi, -2 * lo)
+
+    # the integer ranges [j0, j1] where 2*a*q(j) <= bound, for the bounds hi2 and lo2 - 1 at once
+    k, m, bound = np.tile(2 * b * a + 1, 2), np.tile(2 * c * a, 2), np.concatenate((hi2, lo2 - 1))
+    disc = (k * k - 4 * (m - bound)).astype(np.float64)
+    root = np.sqrt(np.maximum(disc, 0))
+    j0 = np.ceil((-k - root) / 2).astype(np.int64)
+    j1 = np.floor((-k + root) / 2).astype(np.int64)
+
+    # the floating point roots are corrected by the exact integer values
+    def value(j):
+        return j * (j + k) + m
+
+    j0 = np.where(value(j0 - 1) <= bound, j0 - 1, np.where(value(j0) > bound, j0 + 1, j0))
+    j1 = np.where(value(j1 + 1) <= bound, j1 + 1, np.where(value(j1) > bound, j1 - 1, j1))
+    j0, j1 = np.where(disc < 0, 1, j0), np.where(disc < 0, 0, j1)
+
+    # 2*a*q(j) <= hi2 on [r0, r1], < lo2 on [s0, s1], hence q(j) in [lo, hi] on [r0, s0 - 1] and [s1 + 1, r1]
+    r0, s0 = j0[:len(lo)], j0[len(lo):]
+    r1, s1 = j1[:len(lo)], j1[len(lo):]
+    hole = s0 <= s1
+
+    first = np.stack((np.maximum(r0, 1), np.minimum(np.where(hole, s0 - 1, r1), n)), axis=1)
+    second = np.stack((np.maximum(np.where(hole, s1 + 1, r1 + 1), 1), np.minimum(r1, n)), axis=1)
+
+    return first, second
+
+
+def _get_linear_range(b, c, lo, hi, n):
+    """ for the integer j in [1, n], the values b*j + c lie in [lo, hi] on the returned (m, 2) array of intervals;
+        the arguments are arrays of length m """
+
+    safe = np.where(b == 0, 1, b)
+    j0 = np.where(b > 0, -((c - lo) // safe), -((c - hi) // safe))  # ceil((lo - c)/b) for b > 0
+    j1 = np.where(b > 0, (hi - c) // safe, (lo - c) // safe)
+    # b = 0: the value is c for every j
+    constant_inside = (lo <= c) & (c <= hi)
+    j0 = np.where(b == 0, np.where(constant_inside, 1, n + 1), j0)
+    j1 = np.where(b == 0, n, j1)
+
+    return np.stack((np.maximum(j0, 1), np.minimum(j1, n)), axis=1)
+
+
+def get_side_ranges(starts, lengths, corners, directions):
+    """
+      the smallest and the largest coordinates, as two (m, 2) arrays, of the places of m sides of the rectangular
+      spiral: the side s goes through starts[s] + j*corners[s] + j*(j + 1)/2*directions[s], j = 1, ..., lengths[s]
+      (see spirals.Rectangular.get_side); they are taken at the ends or at the vertex of the parabola
+    """
+
+    e = np.where(directions == 0, 1, directions)
+    v = np.floor(-corners / e - 0.5).astype(np.int64)  # the vertex of every coordinate, meaningless for e = 0
+    n = lengths[:, None]
+    js = np.clip(np.concatenate((np.ones_like(n), n, v, v + 1), axis=1), 1, n)  # (m, 6)
+    places = (starts[:, None, :] + js[:, :, None] * corners[:, None, :] +
+              (js * (js + 1) // 2)[:, :, None] * directions[:, None, :])
+
+    return places.min(axis=1), places.max(axis=1)
+
+
+def _get_pair_intervals(s, lo, hi, starts, lengths, corners, directions):
+    """
+      the intervals of j where the places of the side s[i] lie inside the box [lo[i], hi[i]] (a pair of (n, 2) arrays),
+      as two (n, 2) arrays of (first, last) pairs, empty if first > last; see get_blocked_intervals
+    """
+
+    # one coordinate moves along the direction (quadratic in j), the other one by the corner only (linear in j)
+    sides = np.arange(len(starts))
+    axis = (directions[:, 0] == 0).astype(np.int64)  # the quadratic coordinate of every side
+    a, b, c = directions[sides, axis], corners[sides, axis], starts[sides, axis]
+    b_l, c_l = corners[sides, 1 - axis], starts[sides, 1 - axis]
+
+    rows, axis = np.arange(len(s)), axis[s]
+    linear = _get_linear_range(b_l[s], c_l[s], lo[rows, 1 - axis], hi[rows, 1 - axis], lengths[s])
+    quadratic = _get_quadratic_range(a[s], b[s], c[s], lo[rows, axis], hi[rows, axis], lengths[s])
+
+    return [np.stack((np.maximum(q[:, 0], linear[:, 0]), np.minimum(q[:, 1], linear[:, 1])), axis=1)
+            for q in quadratic]
+
+
+def get_blocked_intervals(quadtree, placed_leaves, starts, lengths, corners, directions):
+    """
+      the word with the FlatQuadTree @quadtree walks m consecutive sides of the rectangular spiral
+      (see get_side_ranges); the places of the sides are numbered one after another, i.e. the j-th place of
+      the side s is the place sum(lengths[:s]) + j; returns the (k, 2) array of the intervals (first, last) of the
+      places where some (inflated) leaf of the word meets one of the (inflated, absolute) @placed_leaves boxes,
+      borders included, i.e. where the word collides with a placed word
+
+      two boxes meet at a place iff the place lies inside their Minkowski box in both coordinates; along a side
+      one coordinate of the place is linear and the other one quadratic in j, hence the places of a pair of boxes
+      form at most 2 intervals, found without walking the side; the leaves of the word are reached from the root,
+      level by level, dropping the nodes which meet no placed leaf anywhere on the side
+    """
+
+    if quadtree.root is None or len(placed_leaves) == 0:
+        return np.zeros((0, 2), dtype=np.int64)
+
+    side_lo, side_hi = get_side_ranges(starts, lengths, corners, directions)
+    boxes = quadtree.boxes.astype(np.int64)
+    expansion_start, expansion_count, expansion_nodes = quadtree.get_expansion_table()
+
+    # the triples (side, placed leaf, node of the word), starting with the root
+    x0, y0, x1, y1 = boxes[0].tolist()
+    s, k = np.nonzero((placed_leaves[None, :, 0] <= side_hi[:, None, 0] + x1) &
+                      (placed_leaves[None, :, 2] >= side_lo[:, None, 0] + x0) &
+                      (placed_leaves[None, :, 1] <= side_hi[:, None, 1] + y1) &
+                      (placed_leaves[None, :, 3] >= side_lo[:, None, 1] + y0))
+    node = np.zeros(len(s), dtype=np.int64)
+
+    while len(s):
+        # the places of the word where the node meets the placed leaf: x in [px0 - x1, px1 - x0], same for y
+        lo = placed_leaves[k, :2] - boxes[node, 2:]
+        hi = placed_leaves[k, 2:] - boxes[node, :2]
+
+        near = ((lo <= side_hi[s]) & (hi >= side_lo[s])).all(axis=1)
+        s, k, node, lo, hi = s[near], k[near], node[near], lo[near], hi[near]
+
+        intervals = _get_pair_intervals(s, lo, hi, starts, lengths, corners, directions)
+        meet = (intervals[0][:, 0] <= intervals[0][:, 1]) | (intervals[1][:, 0] <= intervals[1][:, 1])
+        s, k, node = s[meet], k[meet], node[meet]
+
+        if (quadtree.child_count[node] == 0).all():
+            base = (np.cumsum(lengths) - lengths)[s]
+            intervals = np.concatenate([r[meet] + base[:, None] for r in intervals])
+            return intervals[intervals[:, 0] <= intervals[:, 1]]
+
+        # every node is replaced by its children, a leaf stands for itself
+        sizes = expansion_count[node]
+        first = np.repeat(expansion_start[node], sizes)
+        r = np.arange(len(first)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        s, k, node = np.repeat(s, sizes), np.repeat(k, sizes), expansion_nodes[first + r]
+
+    return np.zeros((0, 2), dtype=np.int64)
+
+
+def collides(leaves, placed_leaves, place):
+    """ True if some of the (inflated) @leaves, put at @place, meets one of the @placed_leaves, borders included """
+
+    x, y = place
+    a, b = leaves[:, None, :], placed_leaves[None, :, :]
+
+    return bool(((a[..., 0] + x <= b[..., 2]) & (a[..., 2] + x >= b[..., 0]) &
+                 (a[..., 1] + y <= b[..., 3]) & (a[..., 3] + y >= b[..., 1])).any())
+
+
+def get_free_offsets(intervals, n):
+    """ returns the sorted array of the j in [1, n] not covered by the (m, 2) array of @intervals (first, last) """
+
+    cover = np.zeros(n + 2, dtype=np.int64)
+    np.add.at(cover, intervals[:, 0], 1)
+    np.add.at(cover, intervals[:, 1] + 1, -1)
+
+    return np.flatnonzero(np.cumsum(cover)[1:n + 1] == 0) + 1
+
+
+def get_first_free_offset(quadtree, placed_leaves, start, length, corner, direction):
+    """
+      the sweep query: the first j in [1, @length] where the word walking a side of the rectangular spiral
+      from the place @start is free (see get_blocked_intervals), or -1 if there is none
+    """
+
+    sides = [np.asarray(x, dtype=np.int64)[None] for x in (start, length, corner, direction)]
+    free = get_free_offsets(get_blocked_intervals(quadtree, placed_leaves, *sides), length)
+
+    return int(free[0]) if len(free) else -1
+
+
+class PlacedLeaves:
+    """
+       the inflated leaf boxes of the placed words, on the canvas, found by the root boxes of their words
+    """
+
+    def __init__(self):
+        self.roots = spatial_hash.BoxList()
+        self.leaves = dict()  # the key of a word -> the (n, 4) array of its leaf boxes
+
+    def __len__(self):
+        return len(self.roots)
+
+    def append(self, key, quadtree, place):
+        """ adds the word with the FlatQuadTree @quadtree put at @place under the @key """
+
+        if quadtree.root is None:
+            return
+
+        shift = np.array([place[0], place[1], place[0], place[1]], dtype=np.int64)
+        self.roots.append(key, (np.asarray(quadtree.root_box, dtype=np.int64) + shift).tolist())
+        self.leaves[key] = quadtree.get_leaf_boxes(inflated=True) + shift
+
+    def query(self, box):
+        """ returns the (n, 4) array of the leaf boxes of the words whose root box meets the given box """
+
+        keys, _ = self.roots.query(box)
+        if len(keys) == 0:
+            return np.zeros((0, 4), dtype=np.int64)
+
+        return np.concatenate([self.leaves[k] for k in keys.tolist()])
@@ -0,0 +1,87 @@
+# Author: Hayk Aleksanyan
+# the walks of the spirals inside a box, against the positions of the whole walk
+
+import random
+
+import numpy as np
+
+import spirals
+
+
+def get_positions_inside(spiral, start, box, n):
+    """ the positions inside the @box of the first @n items of the walk from the @start, found by get_points """
+
+    x0, y0, x1, y1 = box
+    positions = np.asarray(start, dtype=np.int64) + np.cumsum(spiral.get_points(0, n), axis=0)
+    xs, ys = positions[:, 0], positions[:, 1]
+
+    return [tuple(p) for p in positions[(xs >= x0) & (xs <= x1) & (ys >= y0) & (ys <= y1)].tolist()]
+
+
+def check_walk_inside(spiral, start, box, n):
+    """ the walk inside the @box, against the first @n items of the whole walk, which must cover its end """
+
+    walked = list(spiral.walk_inside(start, box))
+    expected = get_positions_inside(spiral, start, box, n)
+
+    # the walk keeps the order of the spiral; it ends only when the positions left were all visited before
+    assert walked == expected[:len(walked)]
+    assert set(walked) == set(expected)
+
+
+def get_edge_cases(w, h):
+    """ pairs (start, box) of the boxes at the edges: empty, a single position, around or far from the start """
+
+    box = (-5, -5, w, h)
+    return [((w // 2, h // 2), box), ((0, 0), box), ((w, h), box), ((-15, h // 2), box), ((w + 15, -10), box),
+            ((w // 2, h + 20), box), ((3, 4), (3, 4, 3, 4)), ((0, 0), (7, -9, 7, -9)), ((0, 0), (5, 5, 4, 9)),
+            ((0, 0), (-3, -2, 3, 2)), ((w // 2, 10), (-8, 1, w + 20, 8)), ((0, 0), (w, h, w + 10, h + 2))]
+
+
+def test_rectangular_walk_inside():
+    rnd = random.Random(1)
+
+    # the walk ends after about 8*r*r/a items, where r is the largest |x| of the box from the start, a the param
+    cases = [(start, box, param, reverse) for start, box in get_edge_cases(40, 20)
+             for param in (1, 2, 3, 4) for reverse in (0, 1)]
+    for _ in range(12):
+        w, h = rnd.randint(10, 50), rnd.randint(5, 30)
+        box = (-rnd.randint(0, 5), -rnd.randint(0, 5), w - rnd.randint(1, 5), h - rnd.randint(1, 5))
+        start = (rnd.randint(-10, w + 10), rnd.randint(-10, h + 10))
+        cases.append((start, box, rnd.choice([1, 2, 3, 4]), rnd.choice([0, 1])))
+
+    for start, box, param, reverse in cases:
+        check_walk_inside(spirals.Rectangular(param, reverse), start, box, 1 << 15)
+
+
+def test_archimedian_walk_inside():
+    rnd = random.Random(2)
+
+    cases = [(start, box, param) for start, box in get_edge_cases(40, 20) for param in (0.2, -0.2)]
+    for _ in range(10):
+        w, h = rnd.randint(20, 200), rnd.randint(10, 100)
+        box = (-rnd.randint(0, 20), -rnd.randint(0, 20), w - rnd.randint(1, 20), h - rnd.randint(1, 10))
+        start = (rnd.randint(0, w), rnd.randint(0, h))
+        cases.append((start, box, rnd.choice([0.2, -0.2])))
+
+    for start, box, param in cases:
+        check_walk_inside(spirals.Archimedian(param), start, box, 1 << 14)
+
+
+def test_skip_inside():
+    rnd = random.Random(3)
+
+    for spiral in (spirals.Rectangular(2, 0), spirals.Rectangular(1, 1), spirals.Archimedian(0.2)):
+        for start, box in get_edge_cases(40, 20):
+            box = tuple(v + rnd.randint(-3, 3) for v in box)
+            spiral.seek(rnd.randint(0, 50))
+            index = spiral.index
+            skipped = spiral.skip_inside(start, box)
+
+            # the positions passed over are the walk from the start up to the first one outside the box
+            positions = np.asarray(start, dtype=np.int64) + np.cumsum(spiral.get_points(index, len(skipped) + 1), axis=0)
+            assert skipped.tolist() == positions[:-1].tolist()
+            assert spiral.index == index + len(skipped)
+            x, y = positions[-1]
+            assert not (box[0] <= x <= box[2] and box[1] <= y <= box[3])
+            assert all(box[0] <= x <= box[2] and box[1] <= y <= box[3] for x, y in skipped.tolist())
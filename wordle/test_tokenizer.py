@@ -0,0 +1,35 @@
+# Author: Hayk Aleksanyan
+# the grouping heuristics of the tokens, on the list of tokens and on their counts
+
+from collections import Counter
+import random
+
+import tokenizer
+
+
+def test_plural_chain():
+    tk = tokenizer.SimpleTokenizer()
+    tokens = ["bos", "boss", "boss", "bosss", "bosss", "bosss"]
+
+    # every token is replaced once, by the rules found from the unique tokens: a plural of a plural is not
+    # followed down to the singular, i.e. "bosss" -> "boss" and "boss" -> "bos"
+    assert tokenizer.SimpleTokenizer.get_plural_replacements(set(tokens)) == {"boss": "bos", "bosss": "boss"}
+    assert tk.group_heuristics(tokens) == ["bos", "bos", "bos", "boss", "boss", "boss"]
+    assert list(tk.get_token_to_freq_sorted(tokens).items()) == [("bos", 3), ("boss", 3)]
+
+
+def test_freq_from_counts():
+    rnd = random.Random(1)
+    tk = tokenizer.SimpleTokenizer()
+    tk.stop_words = {"the", "of"}
+
+    words = ["bos", "boss", "bosss", "Boss", "Bos", "the", "The", "of", "word", "words", "Words", "a", "as", "ass"]
+    cases = [["bos", "boss", "boss", "bosss", "bosss", "bosss"], words]
+    cases += [[rnd.choice(words) for _ in range(rnd.randint(1, 200))] for _ in range(50)]
+
+    for tokens in cases:
+        for drop_stop_words in (True, False):
+            expected = tk.get_token_to_freq_sorted(tokens, drop_stop_words)
+            assert Counter(tk.group_heuristics(tokens, drop_stop_words)) == Counter(expected)
+            assert list(tk.get_token_to_freq_sorted_from_counts(Counter(tokens), drop_stop_words).items()) == \
+                list(expected.items())
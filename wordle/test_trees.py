@@ -0,0 +1,63 @@
+# Author: Hayk Aleksanyan
+# the trees of the shapes rotated by a multiple of 90 degrees, against the rotated images
+
+import random
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+import bbox
+import trees
+
+
+def get_random_image(rnd, w, h):
+    """ an 'L' image of size (@w, @h) with a few random ellipses and bars, as the ink of a word """
+
+    img = Image.new('L', (w, h), color=0)
+    draw = ImageDraw.Draw(img)
+    draw.point((rnd.randint(0, w - 1), rnd.randint(0, h - 1)), fill=255)  # a tiny ellipse may draw nothing
+    for _ in range(rnd.randint(1, 6)):
+        x0, y0 = rnd.randint(0, w - 1), rnd.randint(0, h - 1)
+        box = (x0, y0, rnd.randint(x0, w - 1), rnd.randint(y0, h - 1))
+        if rnd.random() < 0.5:
+            draw.ellipse(box, fill=255)
+        else:
+            draw.rectangle(box, fill=255)
+
+    return img
+
+
+def get_covered(tree, shape):
+    """ the pixels of the array of @shape (rows, columns) covered by the leaves of the @tree """
+
+    covered = np.zeros(shape, dtype=bool)
+    for x0, y0, x1, y1 in tree.get_leaf_boxes().tolist():
+        covered[y0:y1, x0:x1] = True
+
+    return covered
+
+
+def test_rotated_covers_rotated_ink():
+    rnd = random.Random(1)
+
+    for _ in range(30):
+        w, h = rnd.randint(1, 120), rnd.randint(1, 60)
+        img = get_random_image(rnd, w, h)
+        quadtree = bbox.construct_quadtree(img, 5, 5)
+        quadtree.compress()
+        tree = trees.FlatQuadTree.from_quadtree(quadtree, 2)
+
+        for angle in (90, 180, 270):
+            rotated = tree.rotated(angle, w, h)
+            img_rotated = img.rotate(angle, expand=1)
+
+            # the leaves are those of the horizontal tree rotated, they cover all ink and no leaf is empty
+            ink = bbox.get_occupancy_mask(img_rotated)
+            covered = get_covered(rotated, ink.shape)
+            assert np.array_equal(covered, np.rot90(get_covered(tree, (h, w)), angle // 90))
+            assert not (ink & ~covered).any()
+
+            sat = bbox.get_summed_area_table(img_rotated)
+            assert not any(bbox.box_is_empty(sat, box) for box in rotated.get_leaf_boxes().tolist())
+            assert tuple(rotated.get_raw_boxes()[0].tolist()) == img_rotated.getbbox()
+            assert (rotated.get_leaf_boxes(inflated=True) - rotated.get_leaf_boxes() == [-2, -2, 2, 2]).all()
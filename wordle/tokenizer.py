@@ -1,15 +1,45 @@
 # Author: Hayk Aleksanyan
 # read file and tokenize into words
 
+from collections import Counter
+import concurrent.futures
 import os
 import re
 
 import file_reader
 
+SEPARATORS = ' \a\b\f\n\r\t'  # the characters ending a token, any other character but [\w-] is dropped
+_to_spaces = str.maketrans('\a\b\f\n\r\t', '      ')
+_reg_exp_alphanum = re.compile(r'[^\w -]')  # everything except non-alphanumeric, non-space, non-hyphen
+
+ENGINES = ('bytes', 'split')  # the ways of cutting a text into tokens, see SimpleTokenizer.get_split_function
+
+# the table of the bytes engine: the ascii separators become spaces, the other ascii characters but [\w-] are deleted
+_byte_table = bytes.maketrans(SEPARATORS.encode(), b' ' * len(SEPARATORS))
+_byte_junk = bytes(c for c in range(128) if chr(c) not in SEPARATORS and not re.match(r'[\w-]', chr(c)))
+
+
+def _count_tokens_in_range(file_path, start, end, token_min_length, chunk_size, log_file, decode_errors, engine,
+                           lower, stop_words):
+    """
+      the Counter of the tokens of the bytes [@start, @end) of the file, run in a worker process;
+      returns it with the counts of the invalid bytes of the range (see file_reader.read_file_mapped)
+    """
+
+    reader = file_reader.FileReaderFromBinary(log_file=log_file)
+    texts = reader.read_file_mapped(file_path, errors=decode_errors, span_size=chunk_size, start=start, end=end)
+
+    return SimpleTokenizer.count_tokens(texts, token_min_length, engine, lower, stop_words), reader.error_counts
+
 
 class SimpleTokenizer:
-    def __init__(self, stop_words_file=""):
+    def __init__(self, stop_words_file="", decode_errors="rows", engine="bytes"):
+        if engine not in ENGINES:
+            raise ValueError('unknown engine <{}>, expected one of {}'.format(engine, ', '.join(ENGINES)))
+
         self.file_reader = file_reader.FileReaderFromBinary()
+        self.decode_errors = decode_errors  # the handler of the invalid utf-8 bytes, see file_reader.ERROR_HANDLERS
+        self.engine = engine  # cutting the text into tokens, see ENGINES
 
         self.stop_words_file = stop_words_file
         self.stop_words = set()
@@ -31,62 +61,179 @@ class SimpleTokenizer:
             return []
 
         str_data = " ".join(file_row_list)
+        tokens = list(SimpleTokenizer.get_split_function(self.engine)(str_data, token_min_length))
+
+        if verbose:
+            print('[{}] the number of tokens equals {}'.format(self.name, len(tokens)), flush=True)
 
-        for c in {'\a', '\b', '\f', '\n', '\r', '\t'}:
-            str_data = str_data.replace(c, ' ')
+        return tokens
 
-        reg_exp_spaces = re.compile(' {2,}')  # strips off the extra white-spaces
-        reg_exp_alphanum = re.compile(r'[^\w -]')  # everything except non-alphanumeric, non-space, non-hyphen
+    @staticmethod
+    def get_split_function(engine):
+        """ the function yielding the tokens of a string by the @engine, split_tokens or scan_tokens """
 
-        str_data = re.sub(reg_exp_alphanum, '', str_data)
-        str_data = re.sub(reg_exp_spaces, ' ', str_data)
+        if engine not in ENGINES:
+            raise ValueError('unknown engine <{}>, expected one of {}'.format(engine, ', '.join(ENGINES)))
 
-        str_data = str_data.strip()
+        return SimpleTokenizer.scan_tokens if engine == 'bytes' else SimpleTokenizer.split_tokens
+
+    @staticmethod
+    def split_tokens(str_data, token_min_length=2, lower=False, stop_words=None):
+        """
+          yields the tokens of the string @str_data: the separators become spaces, the other characters but [\w-]
+          are deleted, and the words between the spaces are stripped of the hyphens at their ends; the tokens are
+          lower cased if @lower, and those whose lower case is in the set @stop_words are skipped
+        """
+
+        str_data = _reg_exp_alphanum.sub('', str_data.translate(_to_spaces))
 
-        tokens = []  # the final list of Tokens to be returned
         for w in str_data.split(' '):
+            if w:  # not between two spaces
+                w = w.strip('-')
+                if len(w) >= token_min_length:
+                    if lower:
+                        w = w.lower()
+                    if not stop_words or w.lower() not in stop_words:
+                        yield w
+
+    @staticmethod
+    def scan_words(str_data):
+        """
+          the list of the words of @str_data between the separators, found with one pass of a byte table over the
+          utf-8 encoded text: the ascii separators become spaces and the other ascii characters but [\w-] are deleted
+          at once; the non-ascii characters and the hyphens at the ends are left to scan_tokens
+        """
+
+        data = str_data.encode('utf-8', 'surrogatepass').translate(_byte_table, _byte_junk)
+        return data.decode('utf-8', 'surrogatepass').split(' ')
+
+    @staticmethod
+    def scan_tokens(str_data, token_min_length=2, lower=False, stop_words=None):
+        """ the tokens of split_tokens, cut by scan_words; only the words with a non-ascii character are cleaned by
+            the regular expression """
+
+        for w in SimpleTokenizer.scan_words(str_data):
+            if not w.isascii():
+                w = _reg_exp_alphanum.sub('', w)
             w = w.strip('-')
             if len(w) >= token_min_length:
-                tokens.append(w)
+                if lower:
+                    w = w.lower()
+                if not stop_words or w.lower() not in stop_words:
+                    yield w
+
+    @staticmethod
+    def cut_at_separators(texts):
+        """
+          yields the text coming in the pieces @texts (strings) in pieces ending at a separator (but the last one);
+          the end of a piece after its last separator is kept for the next piece, i.e. a token cut between two
+          pieces is completed
+        """
+
+        rest = ''
+        for text in texts:
+            text = rest + text
+            end = max(text.rfind(c) for c in SEPARATORS) + 1
+            rest = text[end:]
+
+            yield text[:end]
+
+        yield rest
+
+    @staticmethod
+    def iter_tokens(texts, token_min_length=2, engine='bytes', lower=False, stop_words=None):
+        """ yields the tokens of the text coming in the pieces @texts (strings), the same as split_tokens of the whole
+            text (with the given @engine, see get_split_function) """
+
+        split = SimpleTokenizer.get_split_function(engine)
+
+        for text in SimpleTokenizer.cut_at_separators(texts):
+            yield from split(text, token_min_length, lower, stop_words)
+
+    @staticmethod
+    def count_tokens(texts, token_min_length=2, engine='bytes', lower=False, stop_words=None):
+        """
+          the Counter of iter_tokens; the bytes engine counts the words of scan_words as they are, and every
+          different word is made a token (or dropped) once, by scan_tokens
+        """
+
+        if engine != 'bytes':
+            return Counter(SimpleTokenizer.iter_tokens(texts, token_min_length, engine, lower, stop_words))
+
+        words = Counter()
+        for text in SimpleTokenizer.cut_at_separators(texts):
+            words.update(SimpleTokenizer.scan_words(text))
+
+        counts = Counter()
+        for word, n in words.items():
+            for token in SimpleTokenizer.scan_tokens(word, token_min_length, lower, stop_words):
+                counts[token] += n
+
+        return counts
+
+    def count_tokens_in_file(self, file_path, token_min_length=2, chunk_size=file_reader.CHUNK_SIZE, verbose=0,
+                             workers=0, lower=False, drop_stop_words=False):
+        """
+          the streaming version of tokenize_file: returns the Counter token -> the number of its occurrences,
+          the file is read (memory-mapped) and tokenized in chunks of about @chunk_size bytes; the memory used does
+          not grow with the size of the file, only with the number of different tokens; the invalid utf-8 bytes
+          are handled by the decode_errors of the tokenizer, see file_reader.read_file_mapped
+
+          if @workers > 1, the file is split into that many byte ranges (at separators of the tokens, see
+          file_reader.get_byte_ranges) counted in as many processes, and the counts are added up; the result
+          does not depend on the number of workers
+
+          the tokens are lower cased if @lower, and the stop words are not counted if @drop_stop_words, as the
+          text is tokenized (see split_tokens)
+        """
+
+        stop_words = self.stop_words if drop_stop_words else None
+
+        ranges = [(0, None)]
+        if workers > 1:
+            ranges = file_reader.get_byte_ranges(file_path, workers)
+
+        if len(ranges) > 1:
+            counts = Counter()
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(_count_tokens_in_range, file_path, start, end, token_min_length, chunk_size,
+                                       self.file_reader.log_file, self.decode_errors, self.engine, lower, stop_words)
+                           for (start, end) in ranges]
+                for future in futures:
+                    range_counts, error_counts = future.result()
+                    counts.update(range_counts)
+                    self.file_reader.error_counts.update(error_counts)
+        else:
+            texts = self.file_reader.read_file_mapped(file_path, errors=self.decode_errors, span_size=chunk_size,
+                                                      verbose=verbose)
+            counts = SimpleTokenizer.count_tokens(texts, token_min_length, self.engine, lower, stop_words)
 
         if verbose:
-            print('[{}] the number of tokens equals {}'.format(self.name, len(tokens)), flush=True)
+            print('[{}] the number of tokens equals {}, unique={}'.format(self.name, sum(counts.values()),
+                                                                          len(counts)), flush=True)
 
-        return tokens
+        return counts
 
     def group_heuristics(self, tokens, drop_stop_words=True, verbose=0):
         """
-           given a raw (unprocessed) list of tokens, we apply a few crude heuristics to group some tokens together
+           given a raw (unprocessed) list of tokens, we apply a few crude heuristics to group some tokens together;
+           every rule is a map replacing some tokens by others, found from the unique tokens and applied in one pass
         """
 
-        grouped_tokens = []
-
-        for token in tokens:
-            if drop_stop_words:
-                if token.lower() not in self.stop_words:
-                    grouped_tokens.append(token)
-            else:
-                grouped_tokens.append(token)
+        kept = set(tokens)
+        if drop_stop_words:
+            kept = {token for token in kept if token.lower() not in self.stop_words}
+        grouped_tokens = [token for token in tokens if token in kept]
 
         # 1. if a token appears both lower case and upper case, we replace the upper case version with lowercase
-        token_set = set(grouped_tokens)
-        for t in token_set:
-            if t[0].lower() + t[1:] in token_set and t[0].upper() + t[1:] in token_set:
-                w = t[0].upper() + t[1:]
-                w_rep = t[0].lower() + t[1:]
-
-                for i, token in enumerate(grouped_tokens):
-                    if token == w:
-                        grouped_tokens[i] = w_rep
+        replace = SimpleTokenizer.get_case_replacements(set(grouped_tokens))
+        if replace:
+            grouped_tokens = [replace.get(token, token) for token in grouped_tokens]
 
         # 2. replacement of plurals
-        token_set = set(grouped_tokens)
-        for t in token_set:
-            if t[-1] == 's' and t[:-1] in token_set:
-                w_rep = t[:-1]
-                for i, token in enumerate(grouped_tokens):
-                    if token == t:
-                        grouped_tokens[i] = w_rep
+        replace = SimpleTokenizer.get_plural_replacements(set(grouped_tokens))
+        if replace:
+            grouped_tokens = [replace.get(token, token) for token in grouped_tokens]
 
         if verbose:
             print("[{}] number of original tokens={}, unique={}, unique tokens after stop words check and grouping={}".
@@ -94,6 +241,23 @@ class SimpleTokenizer:
 
         return grouped_tokens
 
+    @staticmethod
+    def get_case_replacements(token_set):
+        """ the tokens of the @token_set appearing both with upper and lower case first letter -> the lower case one """
+
+        replace = dict()
+        for t in token_set:
+            w, w_rep = t[0].upper() + t[1:], t[0].lower() + t[1:]
+            if w != w_rep and w in token_set and w_rep in token_set:
+                replace[w] = w_rep
+
+        return replace
+
+    @staticmethod
+    def get_plural_replacements(token_set):
+        """ the tokens of the @token_set ending with s, whose singular (without the s) is there too -> the singular """
+        return {t: t[:-1] for t in token_set if t[-1] == 's' and t[:-1] in token_set}
+
     def get_token_to_freq_sorted(self, tokens, drop_stop_words=True):
         """
           gets a list of raw tokens (strings) and returns 2 lists
@@ -101,14 +265,45 @@ class SimpleTokenizer:
           returns the sorted (according to decreasing frequencies) lists
         """
 
-        grouped_tokens = self.group_heuristics(tokens, drop_stop_words=drop_stop_words)
+        return self.get_token_to_freq_sorted_from_counts(Counter(tokens), drop_stop_words=drop_stop_words)
+
+    def group_heuristics_on_counts(self, token_to_count, drop_stop_words=True):
+        """
+           group_heuristics for the tokens given by their counts @token_to_count, returns the counts of the grouped
+           tokens; every rule of group_heuristics replaces all occurrences of a token by another one, hence the
+           counts of the token go to the other one
+        """
+
+        counts = Counter()
+        for token, n in token_to_count.items():
+            if not drop_stop_words or token.lower() not in self.stop_words:
+                counts[token] += n
 
-        token_to_freq = dict()
-        for token in grouped_tokens:
-            if token not in token_to_freq:
-                token_to_freq[token] = 0
-            token_to_freq[token] += 1
+        # 1. the case of the first letter, 2. the plurals, see group_heuristics
+        counts = SimpleTokenizer._replace_counts(counts, SimpleTokenizer.get_case_replacements(set(counts)))
+
+        return SimpleTokenizer._replace_counts(counts, SimpleTokenizer.get_plural_replacements(set(counts)))
+
+    @staticmethod
+    def _replace_counts(counts, replace):
+        """ the counts with every token t in the dict @replace counted as replace[t] """
+
+        if not replace:
+            return counts
+
+        replaced = Counter()
+        for token, n in counts.items():
+            replaced[replace.get(token, token)] += n
+
+        return replaced
+
+    def get_token_to_freq_sorted_from_counts(self, token_to_count, drop_stop_words=True):
+        """
+          get_token_to_freq_sorted for the raw tokens given by their counts @token_to_count (see count_tokens_in_file)
+          instead of the list of all of them
+        """
 
+        token_to_freq = self.group_heuristics_on_counts(token_to_count, drop_stop_words=drop_stop_words)
         token_to_freq_sorted = sorted(token_to_freq.items(), key=lambda p: (-p[1], p[0]))
 
         return {token: freq for (token, freq) in token_to_freq_sorted}
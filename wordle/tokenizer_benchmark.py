@@ -0,0 +1,60 @@
+# Author: Hayk Aleksanyan
+# the throughput of the tokenization of a file (MB/s) for the engines and several numbers of worker processes
+
+import argparse
+import os
+import timeit
+
+import tokenizer
+
+
+def measure(tk, file_path, workers, repeat=3, lower=False, drop_stop_words=False):
+    """ returns the best time (in seconds) of counting the tokens of the file by @workers processes, and the counts """
+
+    best, counts = None, None
+    for _ in range(repeat):
+        t_start = timeit.default_timer()
+        counts = tk.count_tokens_in_file(file_path, token_min_length=2, workers=workers, lower=lower,
+                                         drop_stop_words=drop_stop_words)
+        elapsed = timeit.default_timer() - t_start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best, counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measuring the throughput of the tokenizer.')
+    parser.add_argument('--filepath', type=str, required=True, help='path of the text file to tokenize')
+    parser.add_argument('--workers', type=int, nargs='+', required=False, default=[1, 2, 4],
+                        help='the numbers of worker processes to measure')
+    parser.add_argument('--engines', type=str, nargs='+', required=False, default=list(tokenizer.ENGINES),
+                        choices=tokenizer.ENGINES, help='the tokenizer engines to measure')
+    parser.add_argument('--lower', type=int, required=False, default=0,
+                        help='if 1, the tokens are lower cased as they are found')
+    parser.add_argument('--dropstopwords', type=int, required=False, default=0,
+                        help='if 1, the stop words are dropped as they are found')
+    parser.add_argument('--repeat', type=int, required=False, default=3,
+                        help='the best of this number of runs is taken')
+
+    args = parser.parse_args()
+
+    size_mb = os.path.getsize(args.filepath) / (1 << 20)
+
+    print('file: {} ({:.1f} MB), cpu count: {}'.format(args.filepath, size_mb, os.cpu_count()), flush=True)
+    print('{:>8} {:>8} {:>10} {:>10} {:>14}'.format('engine', 'workers', 'seconds', 'MB/s', 'MB/s per core'),
+          flush=True)
+
+    reference = None
+    for engine in args.engines:
+        tk = tokenizer.SimpleTokenizer(stop_words_file="stop-words.txt", engine=engine)
+
+        for workers in args.workers:
+            elapsed, counts = measure(tk, args.filepath, workers, args.repeat, args.lower == 1, args.dropstopwords == 1)
+            if reference is None:
+                reference = counts
+            elif counts != reference:
+                print('the counts of {} with {} workers differ from the counts of {} with {}'.format(
+                    engine, workers, args.engines[0], args.workers[0]))
+
+            print('{:>8} {:>8} {:>10.2f} {:>10.1f} {:>14.1f}'.format(engine, workers, elapsed, size_mb / elapsed,
+                                                                     size_mb / elapsed / max(workers, 1)), flush=True)
@@ -1,6 +1,8 @@
 # Author: Hayk Aleksanyan
 # create and test Trees for spatial partition
 
+import numpy as np
+
 
 def get_rectangle_area(r):
     # returns the area of the rectangle given in min-max coordinates (top-left <--> bottom-right)
@@ -217,3 +219,277 @@ class QuadTree:
             a += get_rectangle_area(r.value)
 
         return a
+
+
+class FlatQuadTree:
+    """
+      a compact, read-only representation of a QuadTree, where all nodes live in contiguous int32 arrays;
+      nodes are numbered in depth-first (pre-)order, the root has index 0 and the children of the node i
+      are children[child_start[i]: child_start[i] + child_count[i]]
+
+      the boxes are stored already inflated by @stay_away pixels in every direction,
+      so that collision checks do not need to add the extra size on every call
+    """
+
+    def __init__(self, boxes, child_start, child_count, children, node_is_full, stay_away=0):
+        self.stay_away = stay_away
+        self._set_arrays(boxes, child_start, child_count, children, node_is_full)
+
+    def _set_arrays(self, boxes, child_start, child_count, children, node_is_full):
+        self.boxes = self._read_only(boxes, np.int32).reshape(-1, 4)
+        self.child_start = self._read_only(child_start, np.int32)
+        self.child_count = self._read_only(child_count, np.int32)
+        self.children = self._read_only(children, np.int32)
+        self.node_is_full = self._read_only(node_is_full, np.bool_)
+
+        self.leaves = np.flatnonzero(self.child_count == 0).astype(np.int32)
+        self.leaves.setflags(write=False)
+
+        # flat int views, indexing these returns plain python ints which keeps the traversal loops cheap
+        self.boxes_view = memoryview(self.boxes.ravel())
+        self.child_start_view = memoryview(self.child_start)
+        self.child_count_view = memoryview(self.child_count)
+        self.children_view = memoryview(self.children)
+
+        self._inflated_leaf_boxes = None  # computed on demand, see get_leaf_boxes()
+        self._expansion_table = None  # computed on demand, see get_expansion_table()
+
+    @staticmethod
+    def _read_only(a, dtype):
+        """ a contiguous read-only copy of @a """
+        a = np.array(a, dtype=dtype)
+        a.setflags(write=False)
+        return a
+
+    @classmethod
+    def from_quadtree(cls, quadtree, stay_away=0):
+        """ build the flat representation of a QuadTree whose nodes are QuadTreeNode instances """
+
+        if quadtree.root is None:
+            return cls(np.empty((0, 4)), [], [], [], [], stay_away)
+
+        nodes = []
+        stack = [quadtree.root]
+        while stack:
+            v = stack.pop()
+            nodes.append(v)
+            stack += reversed(v.get_children_list())
+
+        index = {id(v): i for i, v in enumerate(nodes)}
+
+        child_start, child_count, children = [], [], []
+        for v in nodes:
+            c = v.get_children_list()
+            child_start.append(len(children))
+            child_count.append(len(c))
+            children += [index[id(u)] for u in c]
+
+        boxes = np.array([v.value for v in nodes], dtype=np.int32) + np.array([-stay_away, -stay_away,
+                                                                                 stay_away, stay_away], dtype=np.int32)
+
+        return cls(boxes, child_start, child_count, children, [v.node_is_full for v in nodes], stay_away)
+
+    def to_arrays(self):
+        """ returns the content of the tree as a dict of NumPy arrays, e.g. to be stored with numpy.savez """
+        return {'boxes': self.boxes, 'child_start': self.child_start, 'child_count': self.child_count,
+                'children': self.children, 'node_is_full': self.node_is_full,
+                'stay_away': np.array(self.stay_away, dtype=np.int32)}
+
+    def __reduce__(self):
+        # the memoryviews cannot be pickled, the tree is sent to other processes through its arrays
+        return FlatQuadTree.from_arrays, (self.to_arrays(),)
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """ the inverse of to_arrays() """
+        return cls(arrays['boxes'], arrays['child_start'], arrays['child_count'], arrays['children'],
+                   arrays['node_is_full'], int(arrays['stay_away']))
+
+    @classmethod
+    def compose(cls, parts):
+        """
+          returns the tree of a shape made of several pieces, e.g. a word made of its glyphs;
+          @parts is a list of (FlatQuadTree, dx, dy), where every tree is moved by (dx, dy);
+          the root of the result is the bounding box of all pieces and its children are the roots of the pieces
+        """
+
+        parts = [(tree, dx, dy) for (tree, dx, dy) in parts if tree.root is not None]
+        if not parts:
+            return cls(np.empty((0, 4)), [], [], [], [], 0)
+
+        stay_away = parts[0][0].stay_away
+        if any(tree.stay_away != stay_away for tree, _, _ in parts):
+            raise ValueError("all pieces of the composed tree must have the same stay-away inflation")
+
+        boxes = [tree.shifted(dx, dy).boxes for tree, dx, dy in parts]
+        all_boxes = np.concatenate(boxes)
+        root_box = np.array([[all_boxes[:, 0].min(), all_boxes[:, 1].min(),
+                              all_boxes[:, 2].max(), all_boxes[:, 3].max()]], dtype=np.int32)
+
+        # the nodes of the k-th piece keep their depth-first order and follow the nodes of the previous pieces
+        offsets = 1 + np.cumsum([0] + [len(tree.boxes) for tree, _, _ in parts])
+        child_offsets = len(parts) + np.cumsum([0] + [len(tree.children) for tree, _, _ in parts])
+
+        child_start = [[0]] + [tree.child_start + child_offsets[k] for k, (tree, _, _) in enumerate(parts)]
+        child_count = [[len(parts)]] + [tree.child_count for tree, _, _ in parts]
+        children = [offsets[:-1]] + [tree.children + offsets[k] for k, (tree, _, _) in enumerate(parts)]
+        node_is_full = [[False]] + [tree.node_is_full for tree, _, _ in parts]  # the pieces are never merged
+
+        return cls(np.concatenate([root_box] + boxes), np.concatenate(child_start), np.concatenate(child_count),
+                   np.concatenate(children), np.concatenate(node_is_full), stay_away)
+
+    def shifted(self, dx, dy):
+        """ returns the tree with all boxes moved by (dx, dy) """
+
+        return FlatQuadTree(self.boxes + np.array([dx, dy, dx, dy], dtype=np.int32), self.child_start,
+                            self.child_count, self.children, self.node_is_full, self.stay_away)
+
+    def rotated(self, angle, width, height):
+        """
+          returns the tree of the image rotated counterclockwise by @angle (a multiple of 90 degrees)
+          with expansion, as done by PIL's Image.rotate(angle, expand=1), where (@width, @height) is the size
+          of the original image; the boxes are transformed, the structure of the tree stays the same
+        """
+
+        angle %= 360
+        x0, y0, x1, y1 = self.boxes[:, 0], self.boxes[:, 1], self.boxes[:, 2], self.boxes[:, 3]
+
+        if angle == 0:
+            boxes = self.boxes
+        elif angle == 90:
+            boxes = np.stack((y0, width - x1, y1, width - x0), axis=1)
+        elif angle == 180:
+            boxes = np.stack((width - x1, height - y1, width - x0, height - y0), axis=1)
+        elif angle == 270:
+            boxes = np.stack((height - y1, x0, height - y0, x1), axis=1)
+        else:
+            raise ValueError("only rotations by a multiple of 90 degrees are supported, got {}".format(angle))
+
+        return FlatQuadTree(boxes, self.child_start, self.child_count, self.children, self.node_is_full,
+                            self.stay_away)
+
+    @property
+    def root(self):
+        """ the index of the root node, or None if the tree is empty; mirrors QuadTree.root """
+        return 0 if len(self.boxes) else None
+
+    @property
+    def root_box(self):
+        """ the inflated box of the root as a tuple of ints """
+        return tuple(self.boxes_view[0:4])
+
+    def get_raw_boxes(self):
+        """ returns the boxes of all nodes without the stay-away inflation """
+        s = self.stay_away
+        return self.boxes + np.array([s, s, -s, -s], dtype=np.int32)
+
+    def get_leaf_boxes(self, inflated=False):
+        """ returns the boxes of the leaves as an (n, 4) array, with or without the stay-away inflation """
+        if inflated:
+            if self._inflated_leaf_boxes is None:
+                self._inflated_leaf_boxes = self.boxes[self.leaves]
+                self._inflated_leaf_boxes.setflags(write=False)
+            return self._inflated_leaf_boxes
+        return self.get_raw_boxes()[self.leaves]
+
+    def get_expansion_table(self):
+        """
+          returns int64 arrays (start, count, nodes), where nodes[start[i]: start[i] + count[i]] are the children
+          of the node i, or just [i] if i is a leaf; used to walk down the tree level by level in NumPy
+        """
+
+        if self._expansion_table is None:
+            is_leaf = self.child_count == 0
+
+            start = self.child_start.astype(np.int64)
+            start[is_leaf] = len(self.children) + np.arange(len(self.leaves))
+            count = np.maximum(self.child_count, 1).astype(np.int64)
+            nodes = np.concatenate((self.children, self.leaves)).astype(np.int64)
+
+            for a in (start, count, nodes):
+                a.setflags(write=False)
+            self._expansion_table = (start, count, nodes)
+
+        return self._expansion_table
+
+    def get_level_boxes(self, depth, inflated=True):
+        """
+          returns the boxes of the nodes @depth levels below the root as an (n, 4) array, a leaf above that level
+          stands for itself; these boxes cover the shape more tightly than the root, with much fewer boxes
+          than the leaves
+        """
+
+        if self.root is None:
+            return np.zeros((0, 4), dtype=np.int32)
+
+        start, count, nodes = self.get_expansion_table()
+        level = np.zeros(1, dtype=np.int64)
+        for _ in range(depth):
+            level = np.concatenate([nodes[s:s + c] for s, c in zip(start[level], count[level])])
+
+        return (self.boxes if inflated else self.get_raw_boxes())[level]
+
+    def get_number_of_nodes(self):
+        """ get the total number of nodes of this tree """
+        return len(self.boxes)
+
+    def get_node_value_list(self, output=False):
+        """ returns the (not inflated) boxes of all nodes as a list of 4-tuples in depth-first order """
+
+        res = [tuple(b) for b in self.get_raw_boxes().tolist()]
+        if output:
+            if not res:
+                print('The tree is empty', flush=True)
+            for b in res:
+                print(b, flush=True)
+
+        return res
+
+    def compress(self):
+        """
+         the flat analogue of QuadTree.compress(): a node all of whose children are leaves and which has
+         its full capacity of children loses these children, repeated bottom-up;
+         the arrays are read-only, hence the compressed tree gets new arrays
+        """
+
+        n = len(self.boxes)
+        if n == 0:
+            return
+
+        start, count, children, full = self.child_start, self.child_count, self.children, self.node_is_full
+        is_leaf = (count == 0).tolist()
+
+        # in depth-first order all descendants of a node follow it, hence a reversed pass is bottom-up
+        for i in range(n - 1, -1, -1):
+            if is_leaf[i] or not full[i]:
+                continue
+            if all(is_leaf[u] for u in children[start[i]: start[i] + count[i]].tolist()):
+                is_leaf[i] = True
+
+        keep = []
+        stack = [0]
+        while stack:
+            i = stack.pop()
+            keep.append(i)
+            if not is_leaf[i]:
+                stack += reversed(children[start[i]: start[i] + count[i]].tolist())
+
+        new_index = {old: new for new, old in enumerate(keep)}
+
+        child_start, child_count, new_children = [], [], []
+        for i in keep:
+            child_start.append(len(new_children))
+            if is_leaf[i]:
+                child_count.append(0)
+            else:
+                c = children[start[i]: start[i] + count[i]].tolist()
+                child_count.append(len(c))
+                new_children += [new_index[u] for u in c]
+
+        self._set_arrays(self.boxes[keep], child_start, child_count, new_children, full[keep])
+
+    def area_covered(self):
+        """ the 2d area covered by the (not inflated) leaves of this tree """
+
+        b = self.get_leaf_boxes().astype(np.int64)
+        return int(np.abs((b[:, 0] - b[:, 2]) * (b[:, 1] - b[:, 3])).sum())
@@ -3,15 +3,32 @@
 
 import argparse
 
+import concurrent.futures
+import contextlib
+import functools
+import io
+import itertools
+import json
+import numpy as np
 import os
 from PIL import Image, ImageFont, ImageDraw, ImageOps
 import random
+import tempfile
 import timeit
 
 import spirals
 import bbox
+import budget as time_budget
 import color_handler
+import file_reader
+import free_space as free_space_search
+import occupancy
+import parallel
+import shape_cache
+import spatial_hash
+import sweep
 import tokenizer
+import trees
 
 # constants:
 TOKENS_TO_USE = 400  # number of different tokens to use in the wordle
@@ -20,8 +37,59 @@ FONT_SIZE_MIN = 10  # the smallest font of a word
 FONT_SIZE_MAX = 300  # the largest font of a word, might go slightly above this value
 DESIRED_HW_RATIO = 0.618  # height/widht ratio of the canvas
 QUADTREE_MINSIZE = 5  # minimal height-width of the box in quadTree partition
+FFT_CELL_SIZE = 4  # the fft placement looks for free places on a grid of cells of this size (in pixels)
+FFT_MAX_CANDIDATES = 64  # the number of the nearest free places tested exactly, before falling back to the spiral
+FREE_RECTS_MAX_AREA = 6000  # the rects placement puts the words with smaller images (in pixels) into free rectangles
+FREE_RECTS_DEPTH = 2  # a placed word takes the boxes of the nodes of its tree at this depth from the free rectangles
+FREE_RECTS_MIN_SIDE = 8  # free rectangles thinner than this (in pixels) are dropped
+DEPTH_MAX = 32  # the depth of the ink (see occupancy.DepthField) is known up to this number of pixels
+DEPTH_PROBES = 64  # the number of pixels of a word whose depth is looked up at a position
+SKIP_JUMP_STEPS = 16  # the serial spiral jumps over the box of a blocking word this many steps deep in it
+SWEEP_BLOCK_SIZE = 4096  # the most positions of the rectangular spiral swept at once, see search_spiral_swept
+WORD_MASKS_BYTES = 64 << 20  # the rendered masks of the words kept for drawing them again, in bytes
 FONT_NAME = os.path.join("fonts", "OLDENGL.TTF")  # the font (true type) used to draw the word shapes
 
+# the functions deciding if two (flat) quadtrees collide, selected by the collision_engine of the Wordle
+COLLISION_ENGINES = {
+    'quadtree': bbox.test_collision,  # node by node traversal of both trees
+    'vectorized': bbox.test_collision_vectorized,  # traversal switching to NumPy for large trees
+}
+
+# engines keeping the occupancy of the whole canvas, a word is tested against all placed words at once
+OCCUPANCY_ENGINES = {
+    'bitmap': occupancy.OccupancyBitmap,  # one bit per pixel of the canvas
+}
+
+# (font, word, size, angle) -> the rendered mask of the word, at most WORD_MASKS_BYTES of masks ('L', a byte per pixel)
+_word_masks = shape_cache.LRUCache(max_size=WORD_MASKS_BYTES, size_of=lambda mask: mask.width * mask.height)
+
+
+@functools.lru_cache(maxsize=None)
+def _load_font(font_name, font_size):
+    return ImageFont.truetype(font_name, font_size)
+
+
+def get_font(font_size):
+    """ returns the FONT_NAME font of the given size; every size is loaded only once """
+    return _load_font(FONT_NAME, font_size)
+
+
+def get_text_length(font, text):
+    """ the advance width of the @text in pixels, i.e. where the pen stops after drawing it, kerning included """
+
+    if hasattr(font, 'getlength'):
+        return font.getlength(text)
+
+    return font.getsize(text)[0]  # older versions of PIL
+
+
+def _place_words_quietly(wordle, normal_tokens, seed):
+    """ Wordle.place_words_seeded without the progress output, e.g. for several layouts in parallel """
+
+    wordle.workers = 0  # no processes of its own, the layouts are the parallel tasks
+    with contextlib.redirect_stdout(io.StringIO()):
+        return wordle.place_words_seeded(normal_tokens, seed)
+
 
 class Token:
     """
@@ -36,12 +104,65 @@ class Token:
         self.quadtree = None  # the quadTree of the image of this word with the above characteristics
         self.place = None  # tuple, the coordinate of the upper-left corner of the token on the final canvas
         self.color = None  # the fill color on canvas (R, G, B) triple
+        self.degraded = None  # what the time budget of the placement did to this word, see budget.PlacementBudget
 
 
 class Wordle:
-    def __init__(self, file_path, vert_prob=0.0):
+    def __init__(self, file_path, vert_prob=0.0, cache_dir=None, collision_engine='quadtree', glyph_shapes=False,
+                 grid_cell_size=128, placement='spiral', spiral_block_size=256, skip_ahead=False, workers=0,
+                 layouts=1, seed=None, distance_field=False, pyramid=False, clip_spiral=False,
+                 sweep_sides=False, time_budget=0.0, token_time_budget=0.0, budget_policy='drop', layout_file=None,
+                 size_tolerance=0, tokenizer_workers=0, decode_errors='rows', tokenizer_engine='bytes'):
         self.file_path = file_path
         self.vert_prob = vert_prob
+        self.collision_engine = collision_engine  # a key of COLLISION_ENGINES or OCCUPANCY_ENGINES
+        self.glyph_shapes = glyph_shapes  # if True, the shapes of the words are composed from the shapes of glyphs
+        self.grid_cell_size = grid_cell_size  # cells of the grid finding the placed words near a position; 0 for none
+        # 'spiral' - walk along a spiral; 'fft' - find the free places at once; 'rects' - put the small words
+        # into the free rectangles nearest to the center (see free_space); the spiral is the fallback of both
+        self.placement = placement
+        self.spiral_block_size = spiral_block_size  # the most spiral positions tested at once; 0 for one by one
+        # if True, after a collision the positions where the word still meets the bounding box of the blocking word
+        # are not tested: the spiral is moved (see spirals.skip_inside) to the first position clearing the box,
+        # by the serial walk only if the word is deep in the box (see SKIP_JUMP_STEPS), otherwise it steps over them;
+        # much fewer positions are tested, but the holes inside that box are not searched
+        self.skip_ahead = skip_ahead
+        self.workers = workers  # if > 0, the long spiral walks are split between this number of processes
+        self.layouts = layouts  # the number of layouts tried, the most compact one is kept; see search_layouts
+        self.seed = seed  # the seed of the random choices; a random one if None
+        # if True, the spiral skips the positions near a position where the word lies deep in the ink of
+        # the placed words (see occupancy.DepthField); these positions collide for sure, the result is the same
+        self.distance_field = distance_field
+        # if True, the positions are first tested against the occupancy pyramid of the canvas, which decides
+        # many of them without the trees (see occupancy.OccupancyPyramid); the result is the same
+        self.pyramid = pyramid
+        # if True, the spiral visits only the positions keeping the word inside the canvas and the walk ends once
+        # no later position can be inside (see spirals.walk_inside); the words left without a place
+        # are reported as exhausted, there is no fallback outside the canvas; the places are tested as the positions
+        # of the spiral, batched or one by one, with the skip-ahead, the distance field and the pyramid if they are set
+        self.clip_spiral = clip_spiral
+        # if True, the words on the rectangular spiral find their free positions a side of the spiral at a time,
+        # from the leaves of the placed words near the side (see sweep); the result is the same, off by default as
+        # it is slower than the batched spiral on the walks measured so far; not used with the clipped spiral
+        self.sweep_sides = sweep_sides
+        # the seconds of placing all words and a single word (0 for no limit), and what is done with the words
+        # running out of time: 'drop', 'shrink' or 'switch' (see budget.PlacementBudget)
+        self.time_budget = time_budget
+        self.token_time_budget = token_time_budget
+        self.budget_policy = budget_policy
+        self.budget_report = dict()  # the words degraded by the time budget in the last placement, by the action
+        # if the file exists, the layout saved there is updated instead of placing all words anew (see update_layout),
+        # and the new layout is saved there; the words whose font size changed by at most @size_tolerance keep
+        # their old size and place
+        self.layout_file = layout_file
+        self.size_tolerance = size_tolerance
+        self.layout = None  # the layout of the last wordle created, see get_layout
+        self.tokenizer_workers = tokenizer_workers  # if > 1, the text is tokenized in this number of processes
+        self.decode_errors = decode_errors  # the handler of the invalid utf-8 bytes, see file_reader.read_file_mapped
+        self.tokenizer_engine = tokenizer_engine  # cutting the text into tokens, see tokenizer.ENGINES
+
+        # shapes of the words are reused across calls, and across runs if @cache_dir is given
+        self.shape_cache = shape_cache.ShapeCache(cache_dir=cache_dir)
 
         self._arch_spiral_param = 0.2
         self._rect_spiral_param = 2
@@ -117,23 +238,44 @@ class Wordle:
           gets an instance of Token class and draws the word it represents
           returns an image of the given word in the given font size
           the image is NOT cropped
-        """
 
-        font = ImageFont.truetype(FONT_NAME, token.font_size)
-        w, h = font.getsize(token.word)
+          the (rotated) shape of the word is rendered only once, see get_word_mask
+        """
 
-        im = Image.new('RGBA', (w, h), color=None)
-        draw = ImageDraw.Draw(im)
-        if not use_color:
-            draw.text((0, 0), token.word, font=font)
-        else:
-            draw.text((0, 0), token.word, font=font, fill=token.color)
+        mask = Wordle.get_word_mask(token)
 
-        if token.draw_at_angle != 0:
-            im = im.rotate(token.draw_at_angle, expand=1)
+        fill = token.color if use_color else (255, 255, 255)
+        im = Image.new('RGBA', mask.size, color=tuple(fill[:3]) + (0,))
+        im.putalpha(mask)
 
         return im
 
+    @staticmethod
+    def get_word_mask(token):
+        """
+          returns the alpha mask (an 'L' image) of the word of the @token drawn with its font size and rotated
+          by its angle; the masks are cached, hence repainting the words, e.g. in the interactive mode,
+          does not render and rotate them again
+        """
+
+        key = (FONT_NAME, token.word, token.font_size, token.draw_at_angle)
+        mask = _word_masks.get(key)
+
+        if mask is None:
+            font = get_font(token.font_size)
+            w, h = font.getsize(token.word)
+
+            mask = Image.new('L', (w, h), color=0)
+            draw = ImageDraw.Draw(mask)
+            draw.text((0, 0), token.word, font=font, fill=255)
+
+            if token.draw_at_angle != 0:
+                mask = mask.rotate(token.draw_at_angle, expand=1)
+
+            _word_masks.put(key, mask)
+
+        return mask
+
     @staticmethod
     def draw_on_canvas(normal_tokens, canvas_size):
         """
@@ -209,6 +351,8 @@ class Wordle:
                 box = (0, 0, margin_size, margin_size)
         else:
             box = im_canvas.getbbox()
+            if box is None:
+                box = (0, 0, margin_size, margin_size)  # no word was drawn, e.g. all of them were dropped
 
         if background == 0:
             # white background
@@ -226,41 +370,514 @@ class Wordle:
         return im_canvas_1
 
     @staticmethod
-    def create_quadtrees(normal_tokens):
+    def get_shape(word, font_size, angle, cache, glyph_shapes=False):
         """
-            given a list of tokens we fill their quadTree attributes and cropped image size
+            returns the pair (size of the cropped image, flat quadtree) of the @word drawn with the given font size
+            and rotated by @angle; the shapes are looked up in the ShapeCache @cache first and stored there otherwise
+
+            shapes rotated by a multiple of 90 degrees are obtained from the horizontal one
+            by transforming the boxes of its tree, without drawing the word again; the leaves cover the same ink,
+            but they are those of the horizontal tree rotated, not those of a tree built from the rotated image
+            (the boxes are halved along other lines), hence the places of the vertical words differ slightly
+            from those found with the trees of the rotated images
+
+            if @glyph_shapes, the horizontal shape is assembled from the shapes of the single glyphs (see get_glyph_shape)
+            placed at their advances, instead of drawing the entire word
         """
 
-        for i, token in enumerate(normal_tokens):
-            im_tmp = Wordle.draw_word(token)
+        kind = "glyphs" if glyph_shapes else "word"
+        key = shape_cache.ShapeCache.make_key(word, FONT_NAME, font_size, angle, QUADTREE_MINSIZE, STAY_AWAY, kind)
+        shape = cache.get(key)
+        if shape is not None:
+            return shape
+
+        if angle % 90 == 0 and angle % 360 != 0:
+            img_size, quadtree = Wordle.get_shape(word, font_size, 0, cache, glyph_shapes)
+            quadtree = quadtree.rotated(angle, *get_font(font_size).getsize(word))
+            if angle % 180 != 0:
+                img_size = (img_size[1], img_size[0])
+        elif glyph_shapes and angle % 360 == 0:
+            font = get_font(font_size)
+            parts = []
+            for i, c in enumerate(word):
+                # the pen position of the i-th glyph, kerning with the previous glyph included
+                x = get_text_length(font, word[:i + 1]) - get_text_length(font, c)
+                parts.append((Wordle.get_glyph_shape(c, font_size, cache), int(round(x)), 0))
+
+            quadtree = trees.FlatQuadTree.compose(parts)
+
+            x0, y0, x1, y1 = quadtree.get_raw_boxes()[0].tolist()
+            img_size = (x1 - x0, y1 - y0)
+        else:
+            im_tmp = Wordle.draw_word(Token(word, font_size, angle))
             quadtree = bbox.construct_quadtree(im_tmp, QUADTREE_MINSIZE, QUADTREE_MINSIZE)
             quadtree.compress()
-            im_tmp = im_tmp.crop(im_tmp.getbbox())
+            quadtree = trees.FlatQuadTree.from_quadtree(quadtree, STAY_AWAY)
+
+            box = im_tmp.getbbox()
+            img_size = (box[2] - box[0], box[3] - box[1])  # the size of the cropped image
+
+        cache.put(key, img_size, quadtree)
+
+        return img_size, quadtree
+
+    @staticmethod
+    def get_glyph_shape(char, font_size, cache):
+        """
+            returns the flat quadtree of the single character @char drawn at the origin (pen position 0, 0);
+            the tree is empty if the character leaves no ink (e.g. a space);
+            glyph shapes are cached like word shapes, hence a tree is built once per (font, size, glyph)
+        """
+
+        key = shape_cache.ShapeCache.make_key(char, FONT_NAME, font_size, 0, QUADTREE_MINSIZE, STAY_AWAY, "glyph")
+        shape = cache.get(key)
+        if shape is not None:
+            return shape[1]
+
+        font = get_font(font_size)
+        w, h = font.getsize(char)
+
+        # glyphs may stick out of their advance box (negative bearings), so draw them with a margin
+        margin = font_size
+        im = Image.new('L', (w + 2 * margin, h + 2 * margin), color=0)
+        draw = ImageDraw.Draw(im)
+        draw.text((margin, margin), char, font=font, fill=255)
+
+        box = im.getbbox()
+        if box is None:
+            img_size, quadtree = (0, 0), trees.FlatQuadTree(np.empty((0, 4)), [], [], [], [], STAY_AWAY)
+        else:
+            quadtree = bbox.construct_quadtree(im, QUADTREE_MINSIZE, QUADTREE_MINSIZE)
+            quadtree.compress()
+            quadtree = trees.FlatQuadTree.from_quadtree(quadtree, STAY_AWAY).shifted(-margin, -margin)
+            img_size = (box[2] - box[0], box[3] - box[1])
+
+        cache.put(key, img_size, quadtree)
+
+        return quadtree
+
+    @staticmethod
+    def create_quadtrees(normal_tokens, cache=None, glyph_shapes=False):
+        """
+            given a list of tokens we fill their quadTree attributes and cropped image size
+            the trees are stored in the flat array form with boxes inflated by STAY_AWAY
+
+            if a ShapeCache @cache is given, the shapes are looked up there first and stored there otherwise
+            if @glyph_shapes, the trees are composed from the trees of the glyphs (see get_shape)
+        """
+
+        if cache is None:
+            cache = shape_cache.ShapeCache()
+
+        for i, token in enumerate(normal_tokens):
+            token.img_size, token.quadtree = Wordle.get_shape(token.word, token.font_size, token.draw_at_angle, cache,
+                                                              glyph_shapes)
+
+    @staticmethod
+    def find_blocker(token, place, normal_tokens, grid, blockers, test_collision):
+        """
+            returns the index of a placed token colliding with the @token put at @place, or -1 if there is none;
+            only the tokens found by the GridIndex @grid near the @place are tested, the recent @blockers first
+        """
+
+        if token.quadtree.root is None:
+            return -1
+
+        x0, y0, x1, y1 = token.quadtree.root_box
+        candidates = grid.query((x0 + place[0], y0 + place[1], x1 + place[0], y1 + place[1]))
+        if not candidates:
+            return -1
+
+        for j in blockers:
+            if test_collision(token.quadtree, normal_tokens[j].quadtree, place, normal_tokens[j].place, STAY_AWAY):
+                blockers.touch(j)
+                return j
+
+        for j in candidates:
+            if j not in blockers:
+                if test_collision(token.quadtree, normal_tokens[j].quadtree, place, normal_tokens[j].place,
+                                  STAY_AWAY):
+                    blockers.touch(j)
+                    return j
+
+        return -1
+
+    @staticmethod
+    def get_placed_box(token):
+        """ the (inflated) root box of a placed @token on the canvas """
+
+        x0, y0, x1, y1 = token.quadtree.root_box
+        return x0 + token.place[0], y0 + token.place[1], x1 + token.place[0], y1 + token.place[1]
+
+    @staticmethod
+    def get_skip_box(token, blocker):
+        """ the box (x0, y0, x1, y1) of the positions of the @token where its root box meets the placed @blocker """
+
+        x0, y0, x1, y1 = token.quadtree.root_box
+        bx0, by0, bx1, by1 = Wordle.get_placed_box(blocker)
+        return bx0 - x1, by0 - y1, bx1 - x0, by1 - y0
+
+    @staticmethod
+    def collides_with_placed(token, place, normal_tokens, grid, blockers, test_collision):
+        """ True if the @token put at @place collides with any of the placed tokens (with a place), see find_blocker """
+
+        if grid is not None:
+            return Wordle.find_blocker(token, place, normal_tokens, grid, blockers, test_collision) >= 0
+
+        for other in normal_tokens:
+            if other.place is not None and test_collision(token.quadtree, other.quadtree, place, other.place,
+                                                          STAY_AWAY):
+                return True
+
+        return False
+
+    @staticmethod
+    def find_free_place(token, places, mask, canvas, normal_tokens, grid, blockers, test_collision, canvas_size,
+                        deadline=None):
+        """
+            returns the first of the @places where the @token lies inside the canvas and collides with
+            no placed token, or None; the proposed places are confirmed by the exact test, i.e. the occupancy
+            bitmap @canvas (if given, with the PackedMask @mask of the token) or the trees of the words;
+            the search gives up (with None) after the @deadline (in timeit.default_timer seconds), if given
+        """
+
+        for place in places:
+            if deadline is not None and timeit.default_timer() > deadline:
+                return None
+
+            if canvas is not None and canvas.contains(mask, place):
+                collision = canvas.collides(mask, place)
+            else:
+                collision = Wordle.collides_with_placed(token, place, normal_tokens, grid, blockers, test_collision)
+
+            if not collision and bbox.is_inside_canvas(token.quadtree, place, canvas_size):
+                return place
+
+        return None
+
+    @staticmethod
+    def get_steps(places, start):
+        """ the steps from the @start through the @places, as the generator of a spiral gives them """
+
+        x, y = start
+        for px, py in places:
+            yield px - x, py - y
+            x, y = px, py
+
+    @staticmethod
+    def search_spiral_swept(token, start, spiral, placed_leaves, canvas_size, deadline=None):
+        """
+            moves the @token along the spirals.Rectangular @spiral starting at @start, exactly as in place_words,
+            and returns the place found for it (outside the canvas if there is no place inside) or None;
+            if the @deadline (in timeit.default_timer seconds) passes before the search ends, the place outside
+            the canvas found so far (or None)
+
+            the positions are taken a few sides of the spiral at a time (at least 128 positions, doubling up to
+            SWEEP_BLOCK_SIZE): the free positions of the sides are found from the leaves of the placed words near
+            the sides (the PlacedLeaves @placed_leaves) at once, see sweep.get_blocked_intervals;
+            the positions are not tested one by one
+        """
+
+        c_w, c_h = canvas_size
+        leaves = token.quadtree.get_leaf_boxes(inflated=True)
+        rx0, ry0, rx1, ry1 = leaves[:, 0].min(), leaves[:, 1].min(), leaves[:, 2].max(), leaves[:, 3].max()
+
+        # the word lies inside the canvas iff its (raw) leaves do, see bbox.is_inside_canvas
+        raw = token.quadtree.get_leaf_boxes()
+        ex0, ey0, ex1, ey1 = raw[:, 0].min(), raw[:, 1].min(), raw[:, 2].max(), raw[:, 3].max()
+
+        def is_inside(x, y):
+            return (x + ex0 >= 0) & (x + ex1 <= c_w) & (y + ey0 >= 0) & (y + ey1 <= c_h)
+
+        # the start is the position 0, the position L(t) + j is the j-th position of the side t
+        p = np.array(start, dtype=np.int64)
+        fallback = None
+        limit = -1  # the positions with a smaller index are tested, known once the token leaves the canvas
+        if p[0] < 0 or p[0] >= c_w or p[1] < 0 or p[1] > c_h:
+            limit = 11
+
+        box = (int(p[0] + rx0), int(p[1] + ry0), int(p[0] + rx1), int(p[1] + ry1))
+        if not sweep.collides(leaves, placed_leaves.query(box), p):
+            if is_inside(p[0], p[1]):
+                return int(p[0]), int(p[1])
+            fallback = (int(p[0]), int(p[1]))
+
+        t, first = 0, 1  # the next side and its first position
+        block_size = 128
+        while limit < 0 or first < limit:
+            if deadline is not None and timeit.default_timer() > deadline:
+                return fallback
+
+            # the sides of a block and their positions
+            sides = []
+            n_block = 0
+            while n_block < block_size:
+                _, n, corner, d = spiral.get_side(t)
+                sides.append((p, n, corner, d))
+                p = p + n * corner + (n * (n + 1) // 2) * d
+                n_block += n
+                t += 1
+            block_size = min(2 * block_size, SWEEP_BLOCK_SIZE)
+
+            starts, lengths, corners, directions = (np.array(x, dtype=np.int64) for x in zip(*sides))
+            j = np.arange(n_block, dtype=np.int64) - np.repeat(np.cumsum(lengths) - lengths, lengths) + 1
+            positions = (np.repeat(starts, lengths, axis=0) + j[:, None] * np.repeat(corners, lengths, axis=0) +
+                         (j * (j + 1) // 2)[:, None] * np.repeat(directions, lengths, axis=0))
+            xs, ys = positions[:, 0], positions[:, 1]
+
+            if limit < 0:
+                outside = np.flatnonzero((xs < 0) | (xs >= c_w) | (ys < 0) | (ys > c_h))
+                if len(outside):
+                    limit = 11 * (first + int(outside[0]) + 1)
+
+            side_lo, side_hi = sweep.get_side_ranges(starts, lengths, corners, directions)
+            near = placed_leaves.query((int(side_lo[:, 0].min() + rx0), int(side_lo[:, 1].min() + ry0),
+                                        int(side_hi[:, 0].max() + rx1), int(side_hi[:, 1].max() + ry1)))
+            intervals = sweep.get_blocked_intervals(token.quadtree, near, starts, lengths, corners, directions)
+            free = sweep.get_free_offsets(intervals, n_block) - 1
+            if limit >= 0:
+                free = free[first + free < limit]
+
+            if len(free):
+                inside = np.flatnonzero(is_inside(xs[free], ys[free]))
+                if len(inside):
+                    return int(xs[free[inside[0]]]), int(ys[free[inside[0]]])
+                if fallback is None:
+                    fallback = (int(xs[free[0]]), int(ys[free[0]]))
+
+            first += n_block
+
+        return fallback
+
+    @staticmethod
+    def search_spiral_batched(token, start, spiral, normal_tokens, placed_boxes, test_collision, canvas_size,
+                              max_block_size, skip_ahead=False, depth_field=None, probes=None, pyramid=None,
+                              leaf_centers=None, deadline=None, places=None):
+        """
+            moves the @token along the @spiral starting at @start, exactly as in place_words, and returns the place
+            found for it (outside the canvas if there is no place inside, see place_words) or None;
+            if the @deadline (in timeit.default_timer seconds) passes before the search ends, the place outside
+            the canvas found so far (or None)
+
+            the offsets of the spiral are taken in blocks (doubling in size up to @max_block_size) and the root box
+            of the token at all positions of a block is tested against the root boxes of the placed words at once;
+            only the pairs of words with intersecting roots are then tested one by one, in the order of the spiral
+
+            if @skip_ahead, after a collision the positions where the root box of the token still intersects
+            the root box of the blocking word are skipped: in the block at once, past its end by moving the spiral
+            to the first position clearing the box (see spirals.skip_inside)
+
+            if the DepthField @depth_field is given, the depth of the pixels @probes of the token is looked up
+            at all positions of a block at once, and the positions deep inside the placed words are not tested
+
+            if the OccupancyPyramid @pyramid is given, the positions of a block where the root box of the token
+            meets placed words are first tested at once for a collision for sure, with the @leaf_centers of
+            the token (see OccupancyPyramid.get_blocked); the positions free for sure are already known from
+            the root boxes here
+
+            if the iterable of @places is given (e.g. spirals.walk_inside), its positions are taken instead of
+            the spiral's, in blocks as well, there is no countdown and only a place inside the canvas is returned
+        """
+
+        c_w, c_h = canvas_size
+        x0, y0, x1, y1 = token.quadtree.root_box
 
-            token.quadtree = quadtree
-            token.img_size = im_tmp.size
+        location = np.array(start, dtype=np.int64)
+        place = None
 
-    def place_words(self, normal_tokens):
+        n_steps = 0  # positions taken from the spiral so far
+        last_step = -1  # once the token has left the canvas, the search stops after this step
+        last_hit = -1  # the index of the last token hit, tested first
+        skip_box = None  # the positions over the root box of the last blocking word, if skipping ahead
+
+        block_size = 16
+        while last_step < 0 or n_steps < last_step:
+            if deadline is not None and timeit.default_timer() > deadline:
+                return place
+
+            if places is not None:
+                positions = np.fromiter(itertools.chain.from_iterable(itertools.islice(places, block_size)),
+                                        dtype=np.int64).reshape(-1, 2)
+                if len(positions) == 0:
+                    break
+                block_size = min(2 * block_size, max_block_size)
+            else:
+                offsets = spiral.get_block(block_size)
+                if len(offsets) == 0:
+                    break
+                block_size = min(2 * block_size, max_block_size)
+
+                positions = location + np.cumsum(offsets, axis=0)  # the spiral moves relative to the last position
+                location = positions[-1]
+                steps = n_steps + 1 + np.arange(len(positions))
+                n_steps += len(positions)
+
+            if last_step < 0 and places is None:
+                outside = np.flatnonzero((positions[:, 0] < 0) | (positions[:, 0] >= c_w) |
+                                         (positions[:, 1] < 0) | (positions[:, 1] > c_h))
+                if len(outside):
+                    # the countdown of place_words: 10 more steps for every step made inside the canvas
+                    last_step = 11 * int(steps[outside[0]])
+
+            if last_step >= 0:
+                positions = positions[:max(0, last_step - int(steps[0]) + 1)]
+                if len(positions) == 0:
+                    break
+
+            xs, ys = positions[:, 0], positions[:, 1]
+            keys, boxes = placed_boxes.query((int(xs.min()) + x0, int(ys.min()) + y0,
+                                              int(xs.max()) + x1, int(ys.max()) + y1))
+
+            # hits[p, k] - the root of the token at the p-th position intersects the root of the k-th word
+            hits = ~((xs[:, None] + x0 > boxes[:, 2]) | (xs[:, None] + x1 < boxes[:, 0]) |
+                     (ys[:, None] + y0 > boxes[:, 3]) | (ys[:, None] + y1 < boxes[:, 1]))
+
+            deep = None  # deep[p] - the token at the p-th position lies inside a placed word, hence collides
+            if depth_field is not None:
+                deep = depth_field.get_depths(probes, xs, ys) > 0
+
+            blocked = None  # blocked[p] - the pyramid found the token at the p-th position colliding for sure
+            if pyramid is not None:
+                near = np.flatnonzero(hits.any(axis=1))
+                blocked = np.zeros(len(positions), dtype=bool)
+                blocked[near] = pyramid.get_blocked(leaf_centers, xs[near], ys[near])
+
+            p = 0
+            while p < len(positions):
+                if skip_box is not None:
+                    # jump to the first position clearing the box of the blocker
+                    clear = np.flatnonzero((xs[p:] < skip_box[0]) | (xs[p:] > skip_box[2]) |
+                                           (ys[p:] < skip_box[1]) | (ys[p:] > skip_box[3]))
+                    if len(clear) == 0 and places is None:
+                        # the spiral itself jumps past the rest of the positions over the box, counting their steps
+                        skipped = spiral.skip_inside(location, skip_box)
+                        if len(skipped) and last_step < 0:
+                            outside = np.flatnonzero((skipped[:, 0] < 0) | (skipped[:, 0] >= c_w) |
+                                                     (skipped[:, 1] < 0) | (skipped[:, 1] > c_h))
+                            if len(outside):
+                                last_step = 11 * (n_steps + 1 + int(outside[0]))
+                        if len(skipped):
+                            location = skipped[-1]
+                            n_steps += len(skipped)
+                        skip_box = None
+                    if len(clear) == 0:
+                        break
+                    p += int(clear[0])
+                    skip_box = None
+
+                if deep is not None and deep[p]:
+                    # the token lies inside a placed word, jump to the next position where it does not
+                    free = np.flatnonzero(~deep[p:])
+                    if len(free) == 0:
+                        break
+                    p += int(free[0])
+                    continue
+
+                location1 = (int(xs[p]), int(ys[p]))
+                candidates = keys[hits[p]].tolist()
+
+                verdict = None  # the collision decided by the pyramid, without the trees
+                if blocked is not None and blocked[p]:
+                    verdict, candidates = True, []
+
+                blocker = -1
+                if last_hit in candidates:
+                    other = normal_tokens[last_hit]
+                    if test_collision(token.quadtree, other.quadtree, location1, other.place, STAY_AWAY):
+                        blocker = last_hit
+
+                if blocker < 0:
+                    for j in candidates:
+                        if j != last_hit and test_collision(token.quadtree, normal_tokens[j].quadtree, location1,
+                                                            normal_tokens[j].place, STAY_AWAY):
+                            blocker = last_hit = j
+                            break
+
+                if not verdict and blocker < 0:
+                    if bbox.is_inside_canvas(token.quadtree, location1, canvas_size):
+                        return location1
+                    if place is None and places is None:
+                        place = location1
+                elif skip_ahead and blocker >= 0:
+                    skip_box = Wordle.get_skip_box(token, normal_tokens[blocker])
+
+                p += 1
+
+        return place
+
+    @staticmethod
+    def resize_token(token, font_size, cache, glyph_shapes=False):
+        """ sets the font size of the @token, with its shape (see get_shape) """
+
+        token.font_size = font_size
+        token.img_size, token.quadtree = Wordle.get_shape(token.word, font_size, token.draw_at_angle, cache,
+                                                          glyph_shapes)
+
+    @staticmethod
+    def get_correlation_search(normal_tokens, placed, canvas_size):
+        """ the free_space.CorrelationSearch of the canvas knowing the @placed tokens (pairs (index, place)) """
+
+        free_space = free_space_search.CorrelationSearch(canvas_size[0], canvas_size[1], FFT_CELL_SIZE)
+        for j, place in placed:
+            free_space.commit(occupancy.PackedMask(np.asarray(Wordle.get_word_mask(normal_tokens[j])) > 0, STAY_AWAY),
+                              place)
+
+        return free_space
+
+    def degrade_token(self, i, token, budget):
+        """
+            applies the policy of the PlacementBudget @budget to the i-th @token which ran out of time (or was
+            left once the total budget was spent); returns True if the token is to be tried again, i.e. it was
+            shrunk or switched to the cheaper placement, and False if it was dropped
+        """
+
+        if budget.policy == 'shrink' and token.font_size > FONT_SIZE_MIN:
+            Wordle.resize_token(token, max(FONT_SIZE_MIN, token.font_size // 2), self.shape_cache, self.glyph_shapes)
+            budget.degrade(i, token, 'shrunk')
+            return True
+
+        if budget.policy == 'switch' and token.degraded is None:
+            budget.degrade(i, token, 'switched')
+            return True
+
+        token.place = None
+        budget.degrade(i, token, 'dropped')
+        return False
+
+    def place_words(self, normal_tokens, keep_places=False):
         """
           gets a list of tokens and their frequencies
           executes the placing strategy and
           returns canvas size, locations of upper-left corner of words and words' sizes
+
+          if @keep_places, the tokens having a place keep it (they are only put on the canvas, before the others)
+          and the others are placed around them, see update_layout
         """
 
+        if not keep_places:
+            for token in normal_tokens:
+                token.place = None
+
         # 1. we first create the QuadTrees for all words and determine a size for the canvas
 
         word_img_path = []  # shows the path passed through the spiral before hitting a free space
 
         print('[{}] number of tokens={}'.format(self.name, len(normal_tokens)), flush=True)
 
+        budget = None  # the time budget of the placement, creating the trees included
+        if self.time_budget > 0 or self.token_time_budget > 0:
+            budget = time_budget.PlacementBudget(self.time_budget, self.token_time_budget, self.budget_policy)
+            budget.start()
+
         t_start = timeit.default_timer()
 
         # create the quadTrees and collect sizes (width, height) of the cropped images of the words
-        Wordle.create_quadtrees(normal_tokens)
+        Wordle.create_quadtrees(normal_tokens, self.shape_cache, self.glyph_shapes)
 
         t_stop = timeit.default_timer()
         print('[{}] (i)  quadTrees were created for all words in {} seconds'.format(self.name, t_stop - t_start),
               flush=True)
+        print(self.shape_cache.get_stats(), flush=True)
 
         # 2. We now find places for the words on our canvas
         c_w, c_h = self.propose_canvas_w_h()
@@ -273,97 +890,531 @@ class Wordle:
 
         ups_and_downs = [random.randint(0, 10) % 2 for _ in range(len(normal_tokens))]
 
-        for i, token in enumerate(normal_tokens):
-            print(token.word, end=' ', flush=True)
-
-            # determine a starting position on the canvas of this token, near half of the width of canvas
-            w, h = random.randint(int(0.3 * c_w), int(0.7 * c_w)), (c_h >> 1) - (token.img_size[1] >> 1)
-            if w < 0 or w >= c_w:
-                w = c_w >> 1
-            if h < 0 or h >= c_h:
-                h = c_h >> 1
-
-            direction = 2 * (random.randint(0, 10) % 2) - 1  # 1, -1; randomness to the placing strategy
-            if ups_and_downs[i] == 0:
-                spiral_gen = spirals.Archimedian(direction * self._arch_spiral_param).generator
-            else:
-                spiral_gen = spirals.Rectangular(self._rect_spiral_param, direction).generator
-
-            location1 = (w, h)
+        test_collision = COLLISION_ENGINES.get(self.collision_engine, bbox.test_collision)
+
+        canvas = None
+        if self.collision_engine in OCCUPANCY_ENGINES:
+            canvas = OCCUPANCY_ENGINES[self.collision_engine](c_w, c_h)
+
+        grid = None
+        if self.grid_cell_size > 0:
+            grid = spatial_hash.GridIndex(self.grid_cell_size)
+
+        placed_boxes = None  # the root boxes of the placed words, for the batched spiral
+        if self.spiral_block_size > 0 and canvas is None:
+            placed_boxes = spatial_hash.BoxList()
+
+        placed = []  # the pairs (index, place) of the placed tokens
+
+        free_space = None
+        if self.placement == 'fft':
+            free_space = free_space_search.CorrelationSearch(c_w, c_h, FFT_CELL_SIZE)
+
+        free_rects = None
+        if self.placement == 'rects':
+            free_rects = free_space_search.FreeRectangles(c_w, c_h, FREE_RECTS_MIN_SIDE)
+        n_in_rects = 0  # the words placed into a free rectangle
+
+        depth_field = None
+        if self.distance_field:
+            depth_field = occupancy.DepthField(c_w, c_h, DEPTH_MAX, STAY_AWAY)
+
+        pyramid = None
+        if self.pyramid:
+            pyramid = occupancy.OccupancyPyramid(c_w, c_h)
+
+        exhausted = []  # the words whose clipped spiral ended without a free place
+
+        placed_leaves = None  # the leaves of the placed words, for sweeping the sides of the rectangular spiral
+        if self.sweep_sides and canvas is None:
+            placed_leaves = sweep.PlacedLeaves()
+
+        searcher = None  # tests the positions of the spiral in parallel, with the same result as the serial walk
+        if self.workers > 0 and canvas is None and budget is None and \
+                not (self.skip_ahead or self.distance_field or self.pyramid or self.clip_spiral or self.sweep_sides):
+            searcher = parallel.ParallelSpiralSearch([t.quadtree for t in normal_tokens], test_collision, self.workers)
+        try:
+            # the indices of the words to place (the words keeping their places first), a word tried again is appended
+            queue = sorted(range(len(normal_tokens)), key=lambda j: normal_tokens[j].place is None)
+            for k, i in enumerate(queue):
+                token = normal_tokens[i]
+                n_before = len(normal_tokens)  # the words which might be placed
+                if k < len(normal_tokens) and not keep_places:
+                    n_before = i
+                print(token.word, end=' ', flush=True)
+
+                deadline = None  # the search of the word gives up after it
+                if budget is not None:
+                    if budget.is_over() and token.place is None and token.degraded is None and \
+                            not self.degrade_token(i, token, budget):
+                        continue  # a word left once the total budget is spent
+                    if token.degraded == 'switched' and free_space is None:
+                        # the cheaper placement from now on, it learns the words placed so far
+                        free_space = Wordle.get_correlation_search(normal_tokens, placed, (c_w, c_h))
+                    deadline = budget.start_token()
+
+                mask = None
+                if canvas is not None or free_space is not None:
+                    mask = occupancy.PackedMask(np.asarray(Wordle.get_word_mask(token)) > 0, STAY_AWAY)
+
+                probes = None
+                if depth_field is not None:
+                    probes = depth_field.get_probes(np.asarray(Wordle.get_word_mask(token)) > 0, DEPTH_PROBES)
+
+                level_boxes, leaf_centers = None, None  # the shape of the word tested against the pyramid
+                if pyramid is not None and token.quadtree.root is not None:
+                    level_boxes = token.quadtree.get_level_boxes(1).tolist()
+                    leaf_centers = pyramid.get_leaf_centers(token.quadtree)
+
+                # determine a starting position on the canvas of this token, near half of the width of canvas
+                w, h = random.randint(int(0.3 * c_w), int(0.7 * c_w)), (c_h >> 1) - (token.img_size[1] >> 1)
+                if w < 0 or w >= c_w:
+                    w = c_w >> 1
+                if h < 0 or h >= c_h:
+                    h = c_h >> 1
+
+                direction = 2 * (random.randint(0, 10) % 2) - 1  # 1, -1; randomness to the placing strategy
+                if ups_and_downs[i] == 0:
+                    spiral = spirals.Archimedian(direction * self._arch_spiral_param)
+                else:
+                    spiral = spirals.Rectangular(self._rect_spiral_param, direction)
+                spiral_gen = spiral.generator
 
-            word_img_path.append((w, h))
+                location1 = (w, h)
 
-            last_hit_index = 0  # we cache the index of last hit
+                word_img_path.append((w, h))
+
+                last_hit_index = 0  # we cache the index of last hit
+                blockers = spatial_hash.MoveToFrontList()  # same as above, when the placed words are found by the grid
+
+                iter_ = 0
+
+                start_countdown = False
+                max_iter = 0
+
+                skip_box = None  # the box of the last blocking word, if skipping ahead
+                skip_depth, skip_x, skip_y = 0, 0, 0  # the depth of the token in the ink at (skip_x, skip_y)
+                x0, y0, x1, y1 = token.quadtree.root_box
+
+                if free_space is not None and token.place is None:
+                    # the nearest places free on the coarse grid, confirmed by the exact test
+                    places = free_space.get_free_places(mask, (w, h), FFT_MAX_CANDIDATES)
+                    token.place = Wordle.find_free_place(token, places, mask, canvas, normal_tokens, grid, blockers,
+                                                         test_collision, (c_w, c_h), deadline)
+
+                if free_rects is not None and token.place is None and token.quadtree.root is not None and \
+                        token.img_size[0] * token.img_size[1] <= FREE_RECTS_MAX_AREA:
+                    # the free rectangles nearest to the center large enough for the root box of the word
+                    places = free_rects.get_places(token.quadtree.root_box, (c_w >> 1, c_h >> 1), FFT_MAX_CANDIDATES)
+                    token.place = Wordle.find_free_place(token, places, mask, canvas, normal_tokens, grid, blockers,
+                                                         test_collision, (c_w, c_h), deadline)
+                    if token.place is not None:
+                        n_in_rects += 1
+
+                clipped = token.place is None and self.clip_spiral and token.quadtree.root is not None
+                if clipped:
+                    # the places keeping the raw root box of the word inside the canvas, walked instead of the spiral
+                    rx0, ry0, rx1, ry1 = token.quadtree.get_raw_boxes()[0].tolist()
+                    places = spiral.walk_inside((w, h), (-rx0, -ry0, c_w - rx1, c_h - ry1))
+                    spiral_gen = Wordle.get_steps(places, (w, h))
+
+                if clipped and placed_boxes is not None:
+                    token.place = Wordle.search_spiral_batched(token, (w, h), spiral, normal_tokens, placed_boxes,
+                                                               test_collision, (c_w, c_h), self.spiral_block_size,
+                                                               self.skip_ahead, depth_field, probes,
+                                                               pyramid if level_boxes else None, leaf_centers, deadline,
+                                                               places)
+                elif token.place is None and not clipped and placed_leaves is not None and \
+                        isinstance(spiral, spirals.Rectangular) and token.quadtree.root is not None:
+                    token.place = Wordle.search_spiral_swept(token, (w, h), spiral, placed_leaves, (c_w, c_h), deadline)
+                elif token.place is None and searcher is not None:
+                    token.place = searcher.search(i, (w, h), spiral, placed, (c_w, c_h), STAY_AWAY)
+                elif token.place is None and placed_boxes is not None:
+                    token.place = Wordle.search_spiral_batched(token, (w, h), spiral, normal_tokens, placed_boxes,
+                                                               test_collision, (c_w, c_h), self.spiral_block_size,
+                                                               self.skip_ahead, depth_field, probes,
+                                                               pyramid if level_boxes else None, leaf_centers, deadline)
+                elif token.place is None:
+                    for dx, dy in spiral_gen:
+                        if deadline is not None and timeit.default_timer() > deadline:
+                            break  # the place outside the canvas found so far, if any, is kept
+
+                        w, h = location1[0] + dx, location1[1] + dy
+
+                        if start_countdown:
+                            max_iter -= 1
+                            if max_iter == 0:
+                                break
+                        else:
+                            iter_ += 1
+
+                        if not clipped and (w < 0 or w >= c_w or h < 0 or h > c_h):
+                            #  the shape has fallen outside the canvas
+                            if not start_countdown:
+                                start_countdown = True
+                                max_iter = 1 + 10 * iter_
+
+                        location1 = (w, h)
+                        collision = False
+
+                        if skip_box is not None:
+                            if skip_box[0] <= w <= skip_box[2] and skip_box[1] <= h <= skip_box[3]:
+                                continue  # still over the box of the last blocking word, a few steps at most
+                            skip_box = None
+
+                        if skip_depth > 0:
+                            if max(abs(w - skip_x), abs(h - skip_y)) < skip_depth:
+                                continue  # still near a position where the word was deep in the ink
+                            skip_depth = 0
+
+                        if depth_field is not None:
+                            skip_depth = depth_field.get_depth(probes, location1)
+                            if skip_depth > 0:
+                                skip_x, skip_y = location1
+                                continue
+
+                        # the occupancy of the canvas knows all placed words, no need to test them one by one;
+                        # outside of the canvas it is incomplete and we fall back to the trees of the words
+                        on_canvas = canvas is not None and canvas.contains(mask, location1)
+
+                        verdict = None  # the collision decided by the pyramid, without the trees
+                        if level_boxes and not on_canvas:
+                            verdict = pyramid.classify(token.quadtree.root_box, level_boxes, leaf_centers, location1)
+
+                        blocker = -1
+                        if on_canvas:
+                            collision = canvas.collides(mask, location1)
+                        elif verdict is not None:
+                            collision = verdict
+                        elif grid is not None:
+                            blocker = Wordle.find_blocker(token, location1, normal_tokens, grid, blockers,
+                                                          test_collision)
+                            collision = blocker >= 0
+                        elif last_hit_index < n_before:
+                            j = last_hit_index
+                            if normal_tokens[j].place is not None:
+                                collision = test_collision(token.quadtree, normal_tokens[j].quadtree, location1,
+                                                           normal_tokens[j].place, STAY_AWAY)
+                                if collision:
+                                    blocker = j
+
+                        if not collision and not on_canvas and grid is None and verdict is None:
+                            # NO collision with the cached index
+                            for j in range(n_before):  # check for collisions with the rest of the tokens
+                                if (j != last_hit_index) and (normal_tokens[j].place is not None):
+                                    if test_collision(token.quadtree, normal_tokens[j].quadtree, location1,
+                                                      normal_tokens[j].place,
+                                                      STAY_AWAY):
+                                        collision = True
+                                        last_hit_index = blocker = j
+
+                                        break  # no need to check with the rest of the tokens, try a new position now
+
+                        if collision and blocker >= 0 and self.skip_ahead:
+                            skip_box = Wordle.get_skip_box(token, normal_tokens[blocker])
+
+                        depth = -1  # how far the word is inside the box of the blocking word, in pixels
+                        if skip_box is not None and not clipped:
+                            depth = min(w - skip_box[0], skip_box[2] - w, h - skip_box[1], skip_box[3] - h)
+
+                        if depth >= SKIP_JUMP_STEPS * max(abs(dx), abs(dy)):
+                            # deep in the box of the blocking word (by the last step): the spiral jumps past its
+                            # positions over the box at once (see spirals.skip_inside), counting their steps; the
+                            # clipped walk has no index and is not jumped, a jump past a few positions would cost
+                            # more than stepping over them
+                            skipped = spiral.skip_inside(location1, skip_box)
+                            skip_box = None
+
+                            n_skipped = len(skipped)
+                            if n_skipped and not start_countdown:
+                                outside = np.flatnonzero((skipped[:, 0] < 0) | (skipped[:, 0] >= c_w) |
+                                                         (skipped[:, 1] < 0) | (skipped[:, 1] > c_h))
+                                n_inside = int(outside[0]) + 1 if len(outside) else n_skipped
+                                iter_ += n_inside
+                                n_skipped -= n_inside
+                                if len(outside):
+                                    start_countdown = True
+                                    max_iter = 1 + 10 * iter_
+
+                            if n_skipped:
+                                max_iter -= n_skipped
+                                if max_iter <= 0:
+                                    break
+                            if len(skipped):
+                                location1 = tuple(skipped[-1].tolist())
+
+                        if not collision:
+                            if bbox.is_inside_canvas(token.quadtree, location1, (c_w, c_h)):
+                                # at this point we have found a place inside the canvas where the current token has NO collision
+                                # with the already placed tokens; The search has been completed.
+                                token.place = location1
+                                break  # breaks the spiral movement
+                            else:
+                                if token.place is None:
+                                    # even though this place is outside the canvas, it is collision free and we
+                                    # store it in any case to ensure that the token will be placed
+                                    token.place = location1
+
+                if clipped and token.place is None:
+                    exhausted.append(token.word)
+
+                if token.place is None and budget is not None and budget.is_token_over() and \
+                        self.degrade_token(i, token, budget):
+                    queue.append(i)  # out of time, tried again later
+
+                if canvas is not None and token.place is not None:
+                    canvas.commit(mask, token.place)
+                    mask.release()
+
+                if free_space is not None and token.place is not None:
+                    free_space.commit(mask, token.place)
+
+                if depth_field is not None and token.place is not None:
+                    depth_field.commit(np.asarray(Wordle.get_word_mask(token)) > 0, token.place)
+
+                if pyramid is not None and token.place is not None:
+                    pyramid.commit(token.quadtree.get_leaf_boxes(inflated=True).tolist(), token.place)
+
+                if free_rects is not None and token.place is not None:
+                    for box in token.quadtree.get_level_boxes(FREE_RECTS_DEPTH).tolist():
+                        free_rects.occupy((box[0] + token.place[0], box[1] + token.place[1],
+                                           box[2] + token.place[0], box[3] + token.place[1]))
+
+                if placed_leaves is not None and token.place is not None:
+                    placed_leaves.append(i, token.quadtree, token.place)
+
+                if token.place is not None and token.quadtree.root is not None:
+                    x0, y0, x1, y1 = token.quadtree.root_box
+                    box = (x0 + token.place[0], y0 + token.place[1], x1 + token.place[0], y1 + token.place[1])
+                    if grid is not None:
+                        grid.insert(i, box)
+                    if placed_boxes is not None:
+                        placed_boxes.append(i, box)
+                    placed.append((i, token.place))
+        finally:
+            if searcher is not None:
+                searcher.shutdown()  # also if the placement fails, the processes are not left behind
 
-            iter_ = 0
+        t_stop = timeit.default_timer()
 
-            start_countdown = False
-            max_iter = 0
+        if searcher is not None:
+            print('\n[{}] {} words were searched by {} processes'.format(searcher.name, searcher.n_parallel,
+                                                                         self.workers), flush=True)
 
-            for dx, dy in spiral_gen:
-                w, h = location1[0] + dx, location1[1] + dy
+        if depth_field is not None:
+            print('\n[{}] {} of {} probed positions were inside the placed words'.format(
+                depth_field.name, depth_field.n_hits, depth_field.n_probes), flush=True)
 
-                if start_countdown:
-                    max_iter -= 1
-                    if max_iter == 0:
-                        break
-                else:
-                    iter_ += 1
+        if pyramid is not None:
+            print('\n[{}] {} free and {} blocked of {} positions, hit rate {:.3f}'.format(
+                pyramid.name, pyramid.n_free, pyramid.n_blocked, pyramid.n_tests, pyramid.get_hit_rate()), flush=True)
 
-                if w < 0 or w >= c_w or h < 0 or h > c_h:
-                    #  the shape has fallen outside the canvas
-                    if not start_countdown:
-                        start_countdown = True
-                        max_iter = 1 + 10 * iter_
+        if self.clip_spiral:
+            print('\n[{}] the spiral was exhausted for {} words: {}'.format(self.name, len(exhausted),
+                                                                          ' '.join(exhausted)), flush=True)
 
-                location1 = (w, h)
-                collision = False
-
-                if last_hit_index < i:
-                    j = last_hit_index
-                    if normal_tokens[j].place is not None:
-                        collision = bbox.test_collision(token.quadtree, normal_tokens[j].quadtree, location1,
-                                                        normal_tokens[j].place, STAY_AWAY)
-
-                if not collision:
-                    # NO collision with the cached index
-                    for j in range(i):  # check for collisions with the rest of the tokens
-                        if (j != last_hit_index) and (normal_tokens[j].place is not None):
-                            if bbox.test_collision(token.quadtree, normal_tokens[j].quadtree, location1,
-                                                   normal_tokens[j].place,
-                                                   STAY_AWAY):
-                                collision = True
-                                last_hit_index = j
-
-                                break  # no need to check with the rest of the tokens, try a new position now
-
-                if not collision:
-                    if bbox.is_inside_canvas(token.quadtree, location1, (c_w, c_h)):
-                        # at this point we have found a place inside the canvas where the current token has NO collision
-                        # with the already placed tokens; The search has been completed.
-                        token.place = location1
-                        break  # breaks the spiral movement
-                    else:
-                        if token.place is None:
-                            # even though this place is outside the canvas, it is collision free and we
-                            # store it in any case to ensure that the token will be placed
-                            token.place = location1
+        self.budget_report = budget.get_report() if budget is not None else dict()
+        if budget is not None:
+            print('\n' + budget.get_stats(), flush=True)
 
-        t_stop = timeit.default_timer()
+        if free_rects is not None:
+            print('\n[{}] {} words were placed into free rectangles, {} rectangles left'.format(
+                free_rects.name, n_in_rects, len(free_rects)), flush=True)
 
         print('\n[{}] words were placed in {} seconds'.format(self.name, t_stop - t_start),  flush=True)
 
         return c_w, c_h
 
+    @staticmethod
+    def get_layout_score(normal_tokens, canvas_size, elapsed):
+        """
+            returns the score of a layout as a tuple (skipped words, words outside the canvas,
+            area of the bounding box of all words, seconds taken to place them); smaller is better, in this order
+        """
+
+        skipped, outside = 0, 0
+        x_min, y_min, x_max, y_max = None, None, None, None
+
+        for token in normal_tokens:
+            if token.place is None:
+                skipped += 1
+                continue
+
+            if not bbox.is_inside_canvas(token.quadtree, token.place, canvas_size):
+                outside += 1
+
+            x0, y0, x1, y1 = token.quadtree.get_raw_boxes()[0].tolist()
+            x0, y0, x1, y1 = x0 + token.place[0], y0 + token.place[1], x1 + token.place[0], y1 + token.place[1]
+            x_min = x0 if x_min is None else min(x_min, x0)
+            y_min = y0 if y_min is None else min(y_min, y0)
+            x_max = x1 if x_max is None else max(x_max, x1)
+            y_max = y1 if y_max is None else max(y_max, y1)
+
+        area = 0 if x_min is None else (x_max - x_min) * (y_max - y_min)
+
+        return skipped, outside, area, elapsed
+
+    def place_words_seeded(self, normal_tokens, seed):
+        """
+            places the words as place_words does, with all random choices (starting points, spirals and their
+            directions) made from the @seed, hence the layout can be reproduced from it;
+            returns the triples (place, font size, degraded) of the tokens and the score of the layout,
+            see get_layout_score; the tokens shrunk by the time budget get back their font sizes
+        """
+
+        sizes = [token.font_size for token in normal_tokens]
+        for token in normal_tokens:
+            token.place = None
+            token.degraded = None
+
+        random.seed(seed)
+
+        t_start = timeit.default_timer()
+        canvas_size = self.place_words(normal_tokens)
+        elapsed = timeit.default_timer() - t_start
+
+        states = [(token.place, token.font_size, token.degraded) for token in normal_tokens]
+        score = Wordle.get_layout_score(normal_tokens, canvas_size, elapsed)
+
+        for token, size in zip(normal_tokens, sizes):
+            if token.font_size != size:
+                Wordle.resize_token(token, size, self.shape_cache, self.glyph_shapes)
+
+        return states, score
+
+    def search_layouts(self, normal_tokens, n_layouts, seed, workers=0):
+        """
+            places the words with the seeds @seed, @seed + 1, ..., @seed + @n_layouts - 1 and keeps the best layout
+            (see get_layout_score); if @workers > 0, the layouts are computed in that many processes at once
+            returns the canvas size, as place_words does
+        """
+
+        seeds = [seed + k for k in range(n_layouts)]
+
+        # the trees are built once here and travel with the tokens
+        Wordle.create_quadtrees(normal_tokens, self.shape_cache, self.glyph_shapes)
+
+        print('[{}] trying {} layouts with seeds {}..{}'.format(self.name, n_layouts, seeds[0], seeds[-1]), flush=True)
+
+        if workers > 0:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(_place_words_quietly, [self] * n_layouts, [normal_tokens] * n_layouts, seeds))
+        else:
+            results = [_place_words_quietly(self, normal_tokens, s) for s in seeds]
+
+        for s, (_, score) in zip(seeds, results):
+            print('[{}] seed={}: skipped={}, outside={}, area={}, time={:.2f} seconds'.format(self.name, s, *score),
+                  flush=True)
+
+        best = min(range(n_layouts), key=lambda k: results[k][1])
+        print('[{}] the best layout has seed={}'.format(self.name, seeds[best]), flush=True)
+
+        for token, (place, size, degraded) in zip(normal_tokens, results[best][0]):
+            if token.font_size != size:
+                Wordle.resize_token(token, size, self.shape_cache, self.glyph_shapes)
+            token.place, token.degraded = place, degraded
+
+        self.budget_report = dict()  # of the best layout
+        for token in normal_tokens:
+            if token.degraded is not None:
+                self.budget_report.setdefault(token.degraded, []).append(token.word)
+
+        return self.propose_canvas_w_h()
+
+    @staticmethod
+    def get_layout(normal_tokens):
+        """
+            the layout of the placed tokens, as a list of dicts with the word, its font size, angle and place;
+            it has to be taken before draw_on_canvas, which moves the places if some of them are negative
+        """
+
+        return [{'word': token.word, 'font_size': token.font_size, 'angle': token.draw_at_angle,
+                 'place': list(token.place)} for token in normal_tokens if token.place is not None]
+
+    @staticmethod
+    def save_layout(layout, file_path):
+        """ saves the @layout (see get_layout) as a json file, replacing the old file at once """
+
+        folder = os.path.dirname(os.path.abspath(file_path))
+        fd, tmp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(layout, f)
+            os.replace(tmp_path, file_path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @staticmethod
+    def load_layout(file_path):
+        """ the layout saved by save_layout """
+
+        with open(file_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def update_layout(self, layout, token_to_freq):
+        """
+            creates the tokens of the @token_to_freq (see create_normalized_tokens) and places them, starting
+            from the @layout of the previous frequencies (see get_layout) instead of placing all of them anew:
+            the words whose font size is the same (up to the size tolerance) keep their size, angle and place,
+            the words of the layout which are gone are dropped, and the resized and the new words are placed
+            around the kept ones; the resized words keep their angle
+
+            returns the tokens and the canvas size, as place_words does
+        """
+
+        normal_tokens = self.create_normalized_tokens(token_to_freq, TOKENS_TO_USE, 1.0 - self.vert_prob)
+        previous = {entry['word']: entry for entry in layout}
+
+        n_kept, n_resized = 0, 0
+        for token in normal_tokens:
+            entry = previous.get(token.word)
+            if entry is None:
+                continue  # a new word
+
+            token.draw_at_angle = entry['angle']
+            if abs(token.font_size - entry['font_size']) <= self.size_tolerance:
+                token.font_size = entry['font_size']
+                token.place = tuple(entry['place'])
+                n_kept += 1
+            else:
+                n_resized += 1
+
+        print('[{}] updating the layout: {} words are kept, {} resized, {} new and {} gone'.format(
+            self.name, n_kept, n_resized, len(normal_tokens) - n_kept - n_resized,
+            len(previous) - n_kept - n_resized), flush=True)
+
+        canvas_size = self.place_words(normal_tokens, keep_places=True)
+
+        return normal_tokens, canvas_size
+
     def create(self, interactive=False):
         """ the master function, creates the wordle from a given text file """
 
-        tk = tokenizer.SimpleTokenizer(stop_words_file="stop-words.txt")
-        tokens = tk.tokenize_file(self.file_path, token_min_length=2)
-        token_to_freq = tk.get_token_to_freq_sorted(tokens, drop_stop_words=True)
+        seed = self.seed if self.seed is not None else random.randrange(1 << 31)
+        random.seed(seed)
 
-        normal_tokens = self.create_normalized_tokens(token_to_freq, TOKENS_TO_USE, 1.0 - self.vert_prob)
-        canvas_w, canvas_h = self.place_words(normal_tokens)
+        tk = tokenizer.SimpleTokenizer(stop_words_file="stop-words.txt", decode_errors=self.decode_errors,
+                                       engine=self.tokenizer_engine)
+        token_counts = tk.count_tokens_in_file(self.file_path, token_min_length=2, workers=self.tokenizer_workers,
+                                               drop_stop_words=True)
+        token_to_freq = tk.get_token_to_freq_sorted_from_counts(token_counts, drop_stop_words=True)
+
+        if self.layout_file and os.path.exists(self.layout_file):
+            normal_tokens, (canvas_w, canvas_h) = self.update_layout(Wordle.load_layout(self.layout_file),
+                                                                     token_to_freq)
+        else:
+            normal_tokens = self.create_normalized_tokens(token_to_freq, TOKENS_TO_USE, 1.0 - self.vert_prob)
+            if self.layouts > 1:
+                canvas_w, canvas_h = self.search_layouts(normal_tokens, self.layouts, seed, self.workers)
+            else:
+                canvas_w, canvas_h = self.place_words(normal_tokens)
+
+        self.layout = Wordle.get_layout(normal_tokens)
+        if self.layout_file:
+            Wordle.save_layout(self.layout, self.layout_file)
+            print('the layout was saved as <{}>'.format(self.layout_file), flush=True)
 
         wordle_img = Wordle.draw_on_canvas(normal_tokens, (canvas_w, canvas_h))
 
@@ -399,18 +1450,101 @@ if __name__ == "__main__":
                         help='probability of a word to be placed vertically; default placement is horizontal')
     parser.add_argument('--interactive', type=bool, required=False, default=False,
                         help='if 1, will not exit after wordle creation to allow change of color schemes')
+    parser.add_argument('--collision', type=str, required=False, default='quadtree',
+                        choices=sorted(COLLISION_ENGINES.keys()) + sorted(OCCUPANCY_ENGINES.keys()),
+                        help='the algorithm testing if two word shapes collide')
+    parser.add_argument('--cachedir', type=str, required=False, default='',
+                        help='folder of a persistent cache of word shapes, shared between runs; no disk cache if empty')
+    parser.add_argument('--placement', type=str, required=False, default='spiral', choices=['spiral', 'fft', 'rects'],
+                        help='spiral - move the word along a spiral until it fits; fft - find all free places at once; '
+                             'rects - put the small words into the free rectangles nearest to the center')
+    parser.add_argument('--spiralblock', type=int, required=False, default=256,
+                        help='the most spiral positions tested at once against the placed words; 0 for one by one')
+    parser.add_argument('--skipahead', type=int, required=False, default=0,
+                        help='if 1, the positions over the bounding box of the word blocking the last position '
+                             'are not tested')
+    parser.add_argument('--workers', type=int, required=False, default=0,
+                        help='number of processes sharing the long spiral walks of the words; 0 - no extra processes')
+    parser.add_argument('--layouts', type=int, required=False, default=1,
+                        help='number of layouts tried with different seeds, the most compact one is saved')
+    parser.add_argument('--seed', type=int, required=False, default=-1,
+                        help='the seed of the random choices (the first of the seeds of the layouts); random if < 0')
+    parser.add_argument('--distancefield', type=int, required=False, default=0,
+                        help='if 1, the spiral skips the positions near a position deep inside the placed words')
+    parser.add_argument('--pyramid', type=int, required=False, default=0,
+                        help='if 1, the positions are first tested against a pyramid of the occupancy of the canvas')
+    parser.add_argument('--clipspiral', type=int, required=False, default=0,
+                        help='if 1, the spiral visits only the places inside the canvas; words not fitting are dropped')
+    parser.add_argument('--sweep', type=int, required=False, default=0,
+                        help='if 1, the free places on a side of the rectangular spiral are found at once '
+                             '(slower than the batched spiral on short walks)')
+    parser.add_argument('--timebudget', type=float, required=False, default=0.0,
+                        help='the most seconds of placing all words; 0 for no limit')
+    parser.add_argument('--tokenbudget', type=float, required=False, default=0.0,
+                        help='the most seconds of placing a single word; 0 for no limit')
+    parser.add_argument('--budgetpolicy', type=str, required=False, default='drop', choices=time_budget.POLICIES,
+                        help='the words running out of time are dropped, shrunk, or switched to the fft placement')
+    parser.add_argument('--layoutfile', type=str, required=False, default='',
+                        help='json file of the layout; if it exists, the layout is updated for the new text and saved')
+    parser.add_argument('--sizetolerance', type=int, required=False, default=0,
+                        help='when updating a layout, the words whose font size changed by at most this keep it')
+    parser.add_argument('--tokenworkers', type=int, required=False, default=0,
+                        help='number of processes tokenizing parts of the text file; 0 or 1 - no extra processes')
+    parser.add_argument('--decodeerrors', type=str, required=False, default='rows', choices=file_reader.ERROR_HANDLERS,
+                        help='invalid utf-8 bytes: rows - the whole row is read as latin-1 (as before); latin-1 - only '
+                             'the invalid bytes are; or an error handler of bytes.decode')
+    parser.add_argument('--tokenengine', type=str, required=False, default='bytes', choices=tokenizer.ENGINES,
+                        help='cutting the text into tokens: bytes - one pass of a byte table; split - regex and split')
+    parser.add_argument('--gridcell', type=int, required=False, default=128,
+                        help='size of the grid cells used to find the words near a position; 0 to test all words')
+    parser.add_argument('--glyphshapes', type=int, required=False, default=0,
+                        help='if 1, the shapes of the words are composed from cached shapes of single glyphs')
 
     args = parser.parse_args()
 
     filepath = args.filepath
     vertprob = args.vertprob
     interactive = args.interactive
+    cachedir = args.cachedir
+    collision = args.collision
+    glyphshapes = args.glyphshapes
+    gridcell = args.gridcell
+    placement = args.placement
+    spiralblock = args.spiralblock
+    skipahead = args.skipahead
+    workers = args.workers
+    layouts = args.layouts
+    seed = args.seed
+    distancefield = args.distancefield
+    pyramid = args.pyramid
+    clipspiral = args.clipspiral
+    sweepsides = args.sweep
+    timebudget = args.timebudget
+    tokenbudget = args.tokenbudget
+    budgetpolicy = args.budgetpolicy
+    layoutfile = args.layoutfile
+    sizetolerance = args.sizetolerance
+    tokenworkers = args.tokenworkers
+    decodeerrors = args.decodeerrors
+    tokenengine = args.tokenengine
 
     if vertprob < 0.0:
         vertprob = 0.0
     if vertprob > 1.0:
         vertprob = 1.0
 
-    wordle = Wordle(filepath, vertprob)
+    if clipspiral == 1 and sweepsides == 1:
+        parser.error('--sweep walks whole sides of the spiral and cannot be combined with --clipspiral')
+
+    wordle = Wordle(filepath, vertprob, cache_dir=cachedir if cachedir else None, collision_engine=collision,
+                    glyph_shapes=glyphshapes == 1, grid_cell_size=gridcell,
+                    placement=placement, spiral_block_size=spiralblock, skip_ahead=skipahead == 1,
+                    workers=workers, layouts=layouts, seed=seed if seed >= 0 else None,
+                    distance_field=distancefield == 1, pyramid=pyramid == 1, clip_spiral=clipspiral == 1,
+                    sweep_sides=sweepsides == 1, time_budget=timebudget, token_time_budget=tokenbudget,
+                    budget_policy=budgetpolicy, layout_file=layoutfile if layoutfile else None,
+                    size_tolerance=sizetolerance, tokenizer_workers=tokenworkers, decode_errors=decodeerrors,
+                    tokenizer_engine=tokenengine)
+
     wordle.create(interactive=interactive)
 